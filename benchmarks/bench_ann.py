@@ -0,0 +1,97 @@
+"""
+Recall vs latency of the IVF approximate index against exact cosine.
+
+Builds the exact neighbour table and IVF indexes with several probe counts on the MovieLens
+data in data/ (or synthetic data with --synthetic-scale), then reports for every setting:
+the time to build the whole neighbour table, p50/p99 latency of a single-movie query, and
+recall@k of both against the exact top k.
+
+The synthetic data draws every user's movies independently, so it has no real neighbour
+structure and its recall numbers are not meaningful; use it for timings at larger sizes.
+
+Usage:
+    python -m benchmarks.bench_ann --probes 1 2 4 8 16 --k 10
+"""
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks import common
+from myapp import ann
+from myapp import recommender
+
+
+def recall_at_k(approximate, exact, k):
+    """Mean share of every row's exact top k found in its approximate top k."""
+    hits = [len(np.intersect1d(found[:k][found[:k] >= 0], truth[:k])) for found, truth in zip(approximate, exact)]
+    return float(np.mean(hits)) / k
+
+
+def query_latency(search, rows):
+    samples = []
+    for row in rows:
+        start = time.perf_counter()
+        search(row)
+        samples.append(time.perf_counter() - start)
+    return common.latency_summary(samples)
+
+
+def evaluate(probe_counts, n_lists, k, top_k, queries, synthetic_scale, seed):
+    ratings, _ = common.synthetic_data(synthetic_scale, seed) if synthetic_scale else common.load_movielens()
+    matrix, movie_ids, _ = recommender.build_rating_matrix(ratings)
+    rng = np.random.default_rng(seed)
+    query_rows = rng.choice(len(movie_ids), min(queries, len(movie_ids)), replace=False)
+
+    start = time.perf_counter()
+    exact = recommender.neighbours_from_matrix(matrix, movie_ids, top_k)
+    exact_build_s = time.perf_counter() - start
+    normalized = recommender.normalize_rows(matrix).tocsr()
+    results = [{
+        "engine": "exact",
+        "movies": len(movie_ids),
+        "build_s": round(exact_build_s, 3),
+        "table_recall": 1.0,
+        "query_recall": 1.0,
+        **query_latency(lambda row: recommender.neighbour_rows(normalized, [row], top_k), query_rows),
+    }]
+
+    start = time.perf_counter()
+    index = ann.IVFIndex.build(matrix, n_lists, seed=seed)
+    index_s = time.perf_counter() - start
+    for n_probe in probe_counts:
+        start = time.perf_counter()
+        table = index.neighbour_table(movie_ids, top_k, n_probe)
+        table_s = time.perf_counter() - start
+        searched = np.array([index.search(row, top_k, n_probe)[0] for row in query_rows])
+        results.append({
+            "engine": f"ivf lists={len(index.centroids)} probes={n_probe}",
+            "movies": len(movie_ids),
+            "build_s": round(index_s + table_s, 3),
+            "table_recall": round(recall_at_k(table.neighbours, exact.neighbours, k), 4),
+            "query_recall": round(recall_at_k(searched, exact.neighbours[query_rows], k), 4),
+            **query_latency(lambda row: index.search(row, top_k, n_probe), query_rows),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--probes", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--lists", type=int, default=None, help="IVF lists, defaults to sqrt(movies)")
+    parser.add_argument("--k", type=int, default=10, help="recall is measured on the top k")
+    parser.add_argument("--top-k", type=int, default=recommender.DEFAULT_TOP_K, help="neighbours kept per movie")
+    parser.add_argument("--queries", type=int, default=500, help="single-movie queries timed per setting")
+    parser.add_argument("--synthetic-scale", type=float, default=None,
+                        help="use synthetic data of this scale instead of MovieLens")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    results = evaluate(args.probes, args.lists, args.k, args.top_k, args.queries, args.synthetic_scale, args.seed)
+    common.print_table(results)
+    common.write_json(args.json, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Sync vs async database layer under concurrent clients.
+
+Each mode runs in its own process with DB_ASYNC=0/1 against the same SQLite copy of the
+MovieLens data. Clients are asyncio tasks driving the app over httpx's ASGI transport, so
+sync endpoints go through FastAPI's threadpool and async ones stay on the event loop. The
+mix is 70% /recommend/, 20% /click_stats/ and 10% /click/, with the impression buffer off
+so every recommendation writes to the database.
+
+Usage:
+    python -m benchmarks.bench_async_db --clients 1 16 128 --duration 5
+"""
+import argparse
+import asyncio
+import time
+
+import numpy as np
+
+from benchmarks import common
+
+
+async def _drive(app, titles, movie_ids, n_clients, duration):
+    import httpx
+
+    transport = httpx.ASGITransport(app=app)
+    deadline = time.perf_counter() + duration
+    errors = 0
+
+    async def client_task(client, seed):
+        nonlocal errors
+        rng = np.random.default_rng(seed)
+        samples = []
+        while time.perf_counter() < deadline:
+            roll = rng.random()
+            start = time.perf_counter()
+            if roll < 0.7:
+                response = await client.get("/recommend/", params={"movie": titles[rng.integers(len(titles))]})
+            elif roll < 0.9:
+                response = await client.get("/click_stats/", params={"movie_id": int(movie_ids[rng.integers(len(movie_ids))])})
+            else:
+                response = await client.post("/click/", params={"movie_id": int(movie_ids[rng.integers(len(movie_ids))])})
+            samples.append(time.perf_counter() - start)
+            errors += response.status_code >= 500
+        return samples
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        per_client = await asyncio.gather(*(client_task(client, seed) for seed in range(n_clients)))
+    return [s for samples in per_client for s in samples], errors
+
+
+def _load(clients, duration):
+    from myapp import config
+    from myapp import serving
+    from myapp.main import app
+
+    index = serving.current()
+    titles = sorted(index.title_to_row)
+    movie_ids = np.asarray(index.movie_ids)
+
+    async def run():
+        results = []
+        async with app.router.lifespan_context(app):
+            for n_clients in clients:
+                samples, errors = await _drive(app, titles, movie_ids, n_clients, duration)
+                results.append({
+                    "mode": "async" if config.DB_ASYNC else "sync",
+                    "clients": n_clients,
+                    "requests": len(samples),
+                    "errors": errors,
+                    "req_per_s": round(len(samples) / duration, 1),
+                    **common.latency_summary(samples),
+                })
+        return results
+
+    return asyncio.run(run())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 16, 128])
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per concurrency level")
+    parser.add_argument("--db", help="SQLite file to use (created if missing)")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    url = common.prepare_database(args.db)
+    results = []
+    for mode in ("0", "1"):
+        results += common.run_isolated(_load, args.clients, args.duration,
+                                       env={"DATABASE_URL": url, "DB_ASYNC": mode, "IMPRESSION_BUFFER": "0"})
+    common.print_table(results)
+    common.write_json(args.json, results)
+
+
+if __name__ == "__main__":
+    main()
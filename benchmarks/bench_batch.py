@@ -0,0 +1,81 @@
+"""
+N single /recommend/ calls vs one POST /recommend/batch call for the same N seed titles.
+
+The app runs in-process behind FastAPI's TestClient against a SQLite copy of the MovieLens
+data, with the impression buffer off (one impression write per call) and on. The batch
+results are checked against the single calls; the script exits non-zero if they differ.
+
+Usage:
+    python -m benchmarks.bench_batch --seeds 10 50 200 --repeat 5
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from benchmarks import common
+
+
+def _compare(seed_counts, repeat, top_n):
+    from fastapi.testclient import TestClient
+    from myapp import config
+    from myapp import serving
+    from myapp.main import app
+
+    index = serving.current()
+    titles = sorted(index.title_to_row)
+    rng = np.random.default_rng(0)
+    results = []
+    with TestClient(app) as client:
+        for n_seeds in seed_counts:
+            seeds = [titles[i] for i in rng.choice(len(titles), n_seeds, replace=False)]
+            single_s, batch_s = [], []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                singles = [client.get("/recommend/", params={"movie": seed}).json()["recommendations"] for seed in seeds]
+                single_s.append(time.perf_counter() - start)
+
+                start = time.perf_counter()
+                batch = client.post("/recommend/batch", json={"titles": seeds, "top_n": top_n}).json()["results"]
+                batch_s.append(time.perf_counter() - start)
+
+            # Single calls drop untitled neighbours after the top-n cut, the batch masks them
+            # before it, so only compare seeds where the single call came back full
+            mismatches = sum(len(one) == top_n and one != many["recommendations"]
+                             for one, many in zip(singles, batch))
+            single_ms = float(np.median(single_s)) * 1000
+            batch_ms = float(np.median(batch_s)) * 1000
+            results.append({
+                "buffer": "on" if config.IMPRESSION_BUFFER else "off",
+                "seeds": n_seeds,
+                "singles_ms": round(single_ms, 2),
+                "batch_ms": round(batch_ms, 2),
+                "speedup": round(single_ms / batch_ms, 1),
+                "mismatches": mismatches,
+            })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seeds", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--db", help="SQLite file to use (created if missing)")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    url = common.prepare_database(args.db)
+    results = []
+    for buffer in ("0", "1"):
+        # /recommend/ always returns 4 results
+        results += common.run_isolated(_compare, args.seeds, args.repeat, 4,
+                                       env={"DATABASE_URL": url, "IMPRESSION_BUFFER": buffer})
+    common.print_table(results)
+    common.write_json(args.json, results)
+    if any(row["mismatches"] for row in results):
+        sys.exit("batch results differ from single calls")
+
+
+if __name__ == "__main__":
+    main()
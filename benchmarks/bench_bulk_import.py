@@ -0,0 +1,97 @@
+"""
+Rows per second of POST /movies/bulk against repeated /add_movie/ calls.
+
+Every run starts from a fresh copy of the MovieLens database and drives the app in-process
+behind TestClient, each in its own process. The bulk import sends --movies movies with a
+seed rating as one JSON array and as NDJSON, for every BULK_BATCH_SIZE given. /add_movie/ is
+called --add-movie-calls times, one movie per call, since each call commits and updates the
+model on its own. Both paths fold the new ratings into the served model, which is included in
+the time. Afterwards the ids of the new movies are checked to be distinct.
+
+Usage:
+    python -m benchmarks.bench_bulk_import --movies 10000 --add-movie-calls 1000 --batch-sizes 500 1000 5000
+"""
+import argparse
+import json
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks import common
+from myapp.models import GENRES
+
+
+def _movies(n, prefix):
+    return [{"title": f"{prefix} movie {i}", "release_date": "01-Jan-2024", GENRES[i % len(GENRES)]: 1,
+             "user_rating": float(i % 5 + 1)} for i in range(n)]
+
+
+def _run(mode, n_movies):
+    from fastapi.testclient import TestClient
+    from myapp import config
+    from myapp.main import app
+
+    movies = _movies(n_movies, mode)
+    with TestClient(app) as client:
+        start = time.perf_counter()
+        if mode == "add_movie":
+            for movie in movies:
+                genre = next(genre for genre in GENRES if movie.get(genre))
+                client.post("/add_movie/", params={"movie_title": movie["title"], "category": genre,
+                                                   "release_date": movie["release_date"],
+                                                   "user_rating": movie["user_rating"]}).raise_for_status()
+        elif mode == "bulk json":
+            client.post("/movies/bulk", json=movies).raise_for_status()
+        else:
+            body = "".join(json.dumps(movie) + "\n" for movie in movies)
+            client.post("/movies/bulk", content=body, headers={"content-type": "application/x-ndjson"}).raise_for_status()
+        seconds = time.perf_counter() - start
+    return {
+        "mode": mode,
+        "batch_size": config.BULK_BATCH_SIZE if mode != "add_movie" else "",
+        "movies": n_movies,
+        "seconds": round(seconds, 3),
+        "rows_per_s": round(n_movies / seconds, 1),
+        "peak_rss_mb": round(common.peak_rss_mb(), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--movies", type=int, default=10_000, help="movies per bulk import")
+    parser.add_argument("--add-movie-calls", type=int, default=1000, help="movies added one /add_movie/ call each")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1000])
+    parser.add_argument("--db", help="SQLite file with the MovieLens data (created if missing)")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    source = Path(common.prepare_database(args.db).removeprefix("sqlite:///"))
+    workdir = Path(tempfile.mkdtemp(prefix="movie_bulk_"))
+    runs = [("add_movie", args.add_movie_calls, None)]
+    runs += [(mode, args.movies, batch_size) for batch_size in args.batch_sizes for mode in ["bulk json", "bulk ndjson"]]
+
+    results = []
+    for mode, n_movies, batch_size in runs:
+        # The backup API copies pending WAL pages too; a fresh directory leaves no stale -wal file behind
+        db_path = Path(tempfile.mkdtemp(dir=workdir)) / "movie_recommender.db"
+        with sqlite3.connect(source) as src, sqlite3.connect(db_path) as dst:
+            src.backup(dst)
+        env = {"DATABASE_URL": f"sqlite:///{db_path}", "USE_MODEL_ARTIFACT": "0"}
+        if batch_size:
+            env["BULK_BATCH_SIZE"] = str(batch_size)
+        row = common.run_isolated(_run, mode, n_movies, env=env)
+        with sqlite3.connect(db_path) as conn:
+            ids = [movie_id for (movie_id,) in conn.execute(
+                "SELECT movie_id FROM movies WHERE title LIKE ?", (f"{mode} movie %",))]
+        row["distinct_ids"] = len(ids) == len(set(ids)) == n_movies
+        results.append(row)
+        common.print_table(results[-1:])
+
+    print()
+    common.print_table(results)
+    common.write_json(args.json, results)
+
+
+if __name__ == "__main__":
+    main()
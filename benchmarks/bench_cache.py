@@ -0,0 +1,90 @@
+"""
+Replays a Zipf-distributed workload against the API with the response caches off and on.
+
+80% of the requests are /recommend/ for a title and 20% are /click_stats/ for a movie, both
+drawn from a Zipf distribution over a random popularity order. Every cache size runs in a
+fresh process against the same SQLite copy of the MovieLens data; size 0 disables both
+caches. Reports throughput, latency and the caches' hit, miss and eviction counters.
+
+Usage:
+    python -m benchmarks.bench_cache --sizes 0 100 10000 --requests 20000 --zipf 1.1
+"""
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks import common
+
+
+def zipf_choice(rng, items, exponent, size):
+    """Draws size items, the i-th most popular with probability ~ 1 / i^exponent."""
+    popularity = rng.permutation(len(items))
+    ranks = np.arange(1, len(items) + 1, dtype=np.float64)
+    weights = ranks ** -exponent
+    return [items[i] for i in popularity[rng.choice(len(items), size, p=weights / weights.sum())]]
+
+
+def _replay(n_requests, exponent, seed):
+    from fastapi.testclient import TestClient
+    from myapp import config
+    from myapp import serving
+    from myapp.main import app
+
+    index = serving.current()
+    rng = np.random.default_rng(seed)
+    titles = zipf_choice(rng, sorted(index.title_to_row), exponent, n_requests)
+    movie_ids = zipf_choice(rng, [int(m) for m in index.movie_ids], exponent, n_requests)
+    is_stats = rng.random(n_requests) < 0.2
+
+    samples = []
+    with TestClient(app) as client:
+        start_all = time.perf_counter()
+        for title, movie_id, stats in zip(titles, movie_ids, is_stats):
+            start = time.perf_counter()
+            if stats:
+                client.get("/click_stats/", params={"movie_id": movie_id})
+            else:
+                client.get("/recommend/", params={"movie": title})
+            samples.append(time.perf_counter() - start)
+        elapsed = time.perf_counter() - start_all
+        cache_stats = client.get("/cache_stats/").json()
+
+    recs, clicks = cache_stats["recommendations"], cache_stats["click_stats"]
+    return {
+        "cache_size": config.RECOMMEND_CACHE_SIZE,
+        "requests": n_requests,
+        "req_per_s": round(n_requests / elapsed, 1),
+        **common.latency_summary(samples),
+        "rec_hit_rate": round(recs["hit_rate"], 3),
+        "rec_evictions": recs["evictions"],
+        "stats_hit_rate": round(clicks["hit_rate"], 3),
+        "stats_expirations": clicks["expirations"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[0, 100, 10000])
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--zipf", type=float, default=1.1, help="Zipf exponent of the title popularity")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--db", help="SQLite file to use (created if missing)")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    url = common.prepare_database(args.db)
+    results = []
+    for size in args.sizes:
+        results.append(common.run_isolated(_replay, args.requests, args.zipf, args.seed, env={
+            "DATABASE_URL": url,
+            "RECOMMEND_CACHE_SIZE": str(size),
+            "CLICK_STATS_CACHE_SIZE": str(size),
+            "USER_MODEL": "0",
+        }))
+    common.print_table(results)
+    common.write_json(args.json, results)
+
+
+if __name__ == "__main__":
+    main()
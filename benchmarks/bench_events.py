@@ -0,0 +1,188 @@
+"""
+Event log ingestion throughput and rollup lag.
+
+Every run starts from a fresh copy of the MovieLens database, in its own process.
+- append: client threads log single click events through EventLog.append while its
+  background thread writes them; events/s include writing everything to disk
+- direct: the same clicks written the way /click/ does without EVENT_LOG, one read and commit
+  of the ClickStats row per click
+- rollup: --events mixed events (80% impressions, 15% clicks, 5% ratings) folded into
+  click_stats and ratings by one rollup call
+- steady: events logged at --rate per second for --duration seconds while a RollupJob runs
+  every --interval seconds; the lag is the age of the oldest event of each rollup when it
+  committed
+
+Usage:
+    python -m benchmarks.bench_events --events 1000000 --direct-events 2000 --rate 5000 --interval 1
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks import common
+
+
+def _movie_ids():
+    from sqlalchemy import select
+    from myapp.database import engine
+    from myapp.models import Movie
+
+    with engine.connect() as conn:
+        return np.asarray(conn.scalars(select(Movie.movie_id)).all())
+
+
+def _log_size(directory):
+    return sum(os.path.getsize(path) for path in Path(directory).glob("*.events"))
+
+
+def _append(directory, n_events, clients):
+    from myapp import events
+
+    movie_ids = _movie_ids()
+    log = events.EventLog(directory)
+    log.start()
+
+    def client(seed):
+        rng = np.random.default_rng(seed)
+        for movie_id in rng.choice(movie_ids, n_events // clients).tolist():
+            log.append(events.CLICK, [movie_id])
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(seed,)) for seed in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    log.stop()
+    seconds = time.perf_counter() - start
+    logged = n_events // clients * clients
+    return {"name": "append", "events": logged, "seconds": round(seconds, 3),
+            "events_per_s": round(logged / seconds), "bytes_per_event": round(_log_size(directory) / logged, 1)}
+
+
+def _direct(n_events, clients):
+    from myapp.database import SessionLocal
+    from myapp.models import ClickStats, Movie
+
+    movie_ids = _movie_ids()
+
+    def client(seed):
+        rng = np.random.default_rng(seed)
+        with SessionLocal() as db:
+            for movie_id in rng.choice(movie_ids, n_events // clients).tolist():
+                record = db.query(ClickStats).filter(ClickStats.movie_id == movie_id).first()
+                if not record:
+                    record = ClickStats(movie_id=movie_id, recommendations_shown=0, clicks=0,
+                                        title=db.query(Movie).filter(Movie.movie_id == movie_id).first().title)
+                    db.add(record)
+                record.clicks += 1
+                db.commit()
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(seed,)) for seed in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - start
+    written = n_events // clients * clients
+    return {"name": "direct", "events": written, "seconds": round(seconds, 3),
+            "events_per_s": round(written / seconds), "bytes_per_event": ""}
+
+
+def _mixed_events(log, movie_ids, n_events, rng):
+    # 80% impressions, 15% clicks and 5% ratings by random users
+    from myapp import events
+
+    kinds = rng.choice([events.IMPRESSION, events.CLICK, events.RATING], n_events, p=[0.8, 0.15, 0.05])
+    chosen = rng.choice(movie_ids, n_events)
+    for kind in [events.IMPRESSION, events.CLICK]:
+        log.append(kind, chosen[kinds == kind])
+    rated = chosen[kinds == events.RATING]
+    for user_id, movie_id, rating in zip(rng.integers(1, 944, len(rated)).tolist(), rated.tolist(),
+                                         rng.integers(1, 6, len(rated)).tolist()):
+        log.append(events.RATING, [movie_id], user_id, rating)
+
+
+def _rollup(directory, n_events):
+    from myapp import events
+    from myapp.database import engine
+
+    log = events.EventLog(directory)
+    _mixed_events(log, _movie_ids(), n_events, np.random.default_rng(0))
+    log.stop()
+    start = time.perf_counter()
+    rolled_up = events.rollup(engine, directory, max_events=n_events)
+    seconds = time.perf_counter() - start
+    return {"name": "rollup", "events": len(rolled_up), "seconds": round(seconds, 3),
+            "events_per_s": round(len(rolled_up) / seconds), "peak_rss_mb": round(common.peak_rss_mb(), 1)}
+
+
+def _steady(directory, rate, duration, interval):
+    from myapp import events
+    from myapp.database import engine
+
+    movie_ids = _movie_ids()
+    lags = []
+    log = events.EventLog(directory)
+    job = events.RollupJob(engine, directory, interval,
+                           on_rollup=lambda rolled_up: lags.append(time.time() - rolled_up["time"].min()))
+    log.start()
+    job.start()
+    rng = np.random.default_rng(0)
+    # Log a tick's worth of events every 10 ms
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        _mixed_events(log, movie_ids, max(1, int(rate / 100)), rng)
+        time.sleep(0.01)
+    log.stop()
+    job.stop()
+    return {"name": f"steady rate={rate} interval={interval}", "rollups": len(lags),
+            "lag_p50_s": round(float(np.median(lags)), 3), "lag_max_s": round(float(np.max(lags)), 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=1_000_000, help="events logged and rolled up")
+    parser.add_argument("--direct-events", type=int, default=2000, help="clicks committed one by one")
+    parser.add_argument("--clients", type=int, default=4, help="threads logging or committing clicks")
+    parser.add_argument("--rate", type=int, default=5000, help="events per second of the steady run")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of the steady run")
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds between rollups of the steady run")
+    parser.add_argument("--db", help="SQLite file with the MovieLens data (created if missing)")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    source = Path(common.prepare_database(args.db).removeprefix("sqlite:///"))
+    workdir = Path(tempfile.mkdtemp(prefix="movie_events_"))
+    runs = [(_append, args.events, args.clients), (_direct, args.direct_events, args.clients),
+            (_rollup, args.events), (_steady, args.rate, args.duration, args.interval)]
+
+    ingest, rollups = [], []
+    for fn, *fn_args in runs:
+        # The backup API copies pending WAL pages too; a fresh directory leaves no stale -wal file behind
+        rundir = Path(tempfile.mkdtemp(dir=workdir))
+        db_path = rundir / "movie_recommender.db"
+        with sqlite3.connect(source) as src, sqlite3.connect(db_path) as dst:
+            src.backup(dst)
+        if fn is not _direct:
+            fn_args = [str(rundir / "events")] + fn_args
+        row = common.run_isolated(fn, *fn_args, env={"DATABASE_URL": f"sqlite:///{db_path}"})
+        (ingest if fn in (_append, _direct) else rollups).append(row)
+        common.print_table([row])
+
+    print()
+    common.print_table(ingest)
+    print()
+    common.print_table(rollups)
+    common.write_json(args.json, {"ingest": ingest, "rollup": rollups})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""
+Per-worker memory and model swap latency of a multi-worker uvicorn deployment.
+
+Starts `uvicorn myapp.main:app --workers N` against a SQLite copy of the MovieLens data and a
+model built by `python -m myapp.artifact build`, while client threads keep calling /recommend/.
+Then, twice: new ratings are written to the database and the builder publishes a new version.
+In the "poll" round the workers find it through MODEL_POLL_INTERVAL, in the "signal" round
+every worker is sent SIGUSR1 right after the build.
+
+Reports the RSS and PSS of every worker before and after the swaps, the time from the new
+'current' pointer until each worker answers /model/ with the new version, and the latency and
+failures of the client requests during each round.
+
+Usage:
+    python -m benchmarks.bench_hot_swap --workers 4 --poll-interval 2
+"""
+import argparse
+import os
+import signal
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks import common
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _memory_mb(pid):
+    # RSS and PSS of another process from its smaps_rollup
+    values = {}
+    for line in Path(f"/proc/{pid}/smaps_rollup").read_text().splitlines():
+        name, *rest = line.split()
+        if name in ("Rss:", "Pss:"):
+            values[name[:-1].lower()] = int(rest[0]) / 1024
+    return values
+
+
+def _worker_versions(base, n_workers, timeout=60):
+    # /model/ of every worker, found by opening new connections until n_workers distinct pids answered
+    import requests
+
+    seen = {}
+    deadline = time.monotonic() + timeout
+    while len(seen) < n_workers and time.monotonic() < deadline:
+        info = requests.get(f"{base}/model/", headers={"Connection": "close"}, timeout=5).json()
+        seen[info["pid"]] = info["version"]
+    return seen
+
+
+class Load:
+    """Client threads calling /recommend/ until stopped, keeping (time, latency, ok) samples."""
+
+    def __init__(self, base, titles, clients):
+        self.base = base
+        self.titles = titles
+        self.samples = []
+        self._stop = threading.Event()
+        self._threads = [threading.Thread(target=self._run, args=(seed,), daemon=True) for seed in range(clients)]
+
+    def _run(self, seed):
+        import requests
+
+        rng = np.random.default_rng(seed)
+        with requests.Session() as session:
+            while not self._stop.is_set():
+                start = time.perf_counter()
+                try:
+                    ok = session.get(f"{self.base}/recommend/", timeout=10,
+                                     params={"movie": self.titles[rng.integers(len(self.titles))]}).status_code == 200
+                except requests.RequestException:
+                    ok = False
+                self.samples.append((time.time(), time.perf_counter() - start, ok))
+
+    def window(self, start, stop):
+        samples = [(latency, ok) for at, latency, ok in self.samples if start <= at < stop]
+        return {"requests": len(samples), "failed": sum(not ok for _, ok in samples),
+                **common.latency_summary([latency for latency, _ in samples] or [0.0])}
+
+    def __enter__(self):
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--poll-interval", type=float, default=2.0, help="MODEL_POLL_INTERVAL of the workers")
+    parser.add_argument("--clients", type=int, default=4, help="threads calling /recommend/ throughout")
+    parser.add_argument("--new-ratings", type=int, default=1000, help="ratings added before each rebuild")
+    parser.add_argument("--db", help="SQLite file with the MovieLens data (created if missing)")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    import requests
+
+    workdir = Path(tempfile.mkdtemp(prefix="movie_swap_"))
+    db_path = workdir / "movie_recommender.db"
+    with sqlite3.connect(common.prepare_database(args.db).removeprefix("sqlite:///")) as src, sqlite3.connect(db_path) as dst:
+        src.backup(dst)
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{db_path}", "MODEL_DIR": str(workdir / "models"),
+           "MODEL_POLL_INTERVAL": str(args.poll_interval), "USER_MODEL": "0"}
+
+    def rebuild():
+        subprocess.run([sys.executable, "-m", "myapp.artifact", "build"], cwd=common.ROOT_DIR, env=env, check=True,
+                       stdout=subprocess.DEVNULL)
+        return os.stat(workdir / "models" / "current").st_mtime
+
+    rebuild()
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "myapp.main:app", "--port", str(port),
+                               "--workers", str(args.workers), "--log-level", "warning"], cwd=common.ROOT_DIR, env=env)
+    rng = np.random.default_rng(0)
+    try:
+        deadline = time.monotonic() + 180
+        while True:
+            if server.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError("uvicorn did not start")
+            try:
+                requests.get(f"{base}/", timeout=1)
+                break
+            except requests.ConnectionError:
+                time.sleep(0.5)
+        workers = _worker_versions(base, args.workers)
+        memory = [{"when": "before swaps", "pid": pid, **_memory_mb(pid)} for pid in workers]
+
+        titles = requests.get(f"{base}/movies/search", params={"limit": 100}).json()["results"]
+        rounds = []
+        with Load(base, [movie["title"] for movie in titles], args.clients) as load:
+            time.sleep(2)
+            rounds.append({"round": "steady", **load.window(0, time.time())})
+            for trigger in ["poll", "signal"]:
+                with sqlite3.connect(db_path) as conn:
+                    movie_ids = [row[0] for row in conn.execute("SELECT movie_id FROM movies")]
+                    conn.executemany("INSERT OR REPLACE INTO ratings (user_id, movie_id, rating, timestamp) VALUES (?, ?, ?, 0)",
+                                     [(int(user), int(movie), float(rating)) for user, movie, rating in zip(
+                                         rng.integers(1, 944, args.new_ratings), rng.choice(movie_ids, args.new_ratings),
+                                         rng.integers(1, 6, args.new_ratings))])
+                published = rebuild()
+                if trigger == "signal":
+                    for pid in workers:
+                        os.kill(pid, signal.SIGUSR1)
+                version = (workdir / "models" / "current").read_text().strip()
+
+                # First time every worker is seen serving the new version
+                swapped = {}
+                while len(swapped) < len(workers) and time.time() - published < 120:
+                    info = requests.get(f"{base}/model/", headers={"Connection": "close"}, timeout=5).json()
+                    if info["version"] == version:
+                        swapped.setdefault(info["pid"], time.time() - published)
+                done = time.time()
+                time.sleep(0.5)
+                rounds.append({"round": trigger, "workers_swapped": len(swapped),
+                               "swap_s_max": round(max(swapped.values(), default=float("nan")), 3),
+                               "swap_s_mean": round(float(np.mean(list(swapped.values()))) if swapped else float("nan"), 3),
+                               **load.window(published, done)})
+        memory += [{"when": "after swaps", "pid": pid, **_memory_mb(pid)} for pid in workers]
+    finally:
+        server.terminate()
+        server.wait()
+
+    for row in memory:
+        row["rss"], row["pss"] = round(row["rss"], 1), round(row["pss"], 1)
+    common.print_table(memory)
+    print()
+    common.print_table(rounds)
+    common.write_json(args.json, {"memory_mb": memory, "rounds": rounds})
+
+
+if __name__ == "__main__":
+    main()
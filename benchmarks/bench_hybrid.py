@@ -0,0 +1,151 @@
+"""
+Hybrid genre + collaborative scoring vs the purely collaborative neighbour table.
+
+Quality, on the MovieLens data in data/:
+- "warm": holds out a random share of every user's ratings, builds the model on the rest and
+  recommends k movies for up to --seeds of every user's liked (rating >= 4) training movies,
+  leaving out what the user already rated. Reports precision@k and hit rate against the
+  user's held-out ratings, and the share of the catalog ever recommended.
+- "cold": picks --cold-movies well-rated movies and keeps a single rating of each, as for a
+  movie added through /add_movie/. Reports recall@k of their recommendations against the top k
+  neighbours the full data gives them.
+
+"collaborative" is the model before the hybrid scorer (no genre share, no cold-start fallback),
+the other rows use the given CONTENT_WEIGHT values with the COLD_START_RATINGS fallback.
+
+Latency: p50/p99 of RecommenderIndex.recommend for warm and cold seeds, on MovieLens and on
+synthetic data of the given scales.
+
+Usage:
+    python -m benchmarks.bench_hybrid --weights 0 0.1 0.25 0.5 --k 10 --latency-scales 10 30
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks import common
+from benchmarks.bench_user_model import split_by_user
+from myapp import recommender
+
+
+def warm_quality(index, train, test, k, n_seeds, content_weight, cold_start_ratings, seed):
+    """precision@k, hit rate and catalog coverage of seed-movie recommendations for every user."""
+    rng = np.random.default_rng(seed)
+    liked = train[train["rating"] >= 4]
+    train_rows = train.groupby("user_id")["movie_id"].apply(lambda ids: [index.id_to_row[i] for i in ids])
+    test_ids = test[test["rating"] >= 4].groupby("user_id")["movie_id"].apply(set)
+
+    precisions, hits, shown = [], [], set()
+    for user_id, seeds in liked.groupby("user_id")["movie_id"]:
+        relevant = test_ids.get(user_id)
+        if not relevant:
+            continue
+        seeds = rng.choice(seeds.to_numpy(), min(n_seeds, len(seeds)), replace=False)
+        recs = index.recommend_batch([index.id_to_row[s] for s in seeds], k, train_rows[user_id],
+                                     content_weight, cold_start_ratings)
+        for seed_recs in recs:
+            found = sum(movie_id in relevant for movie_id, _ in seed_recs)
+            precisions.append(found / k)
+            hits.append(found > 0)
+            shown.update(movie_id for movie_id, _ in seed_recs)
+    return {
+        f"precision@{k}": round(float(np.mean(precisions)), 4),
+        "hit_rate": round(float(np.mean(hits)), 4),
+        "coverage": round(len(shown) / len(index.movie_ids), 4),
+    }
+
+
+def cold_quality(index, cold_ids, truth, k, content_weight, cold_start_ratings):
+    """Mean recall@k of the cold movies' recommendations against their full-data neighbours."""
+    rows = [index.id_to_row[movie_id] for movie_id in cold_ids]
+    recs = index.recommend_batch(rows, k, (), content_weight, cold_start_ratings)
+    return {f"cold_recall@{k}": round(float(np.mean(
+        [len({movie_id for movie_id, _ in seed_recs} & expected) / k for seed_recs, expected in zip(recs, truth)])), 4)}
+
+
+def make_cold(ratings, n_movies, min_ratings, seed):
+    """Keeps one random rating of n_movies movies that have at least min_ratings ratings."""
+    rng = np.random.default_rng(seed)
+    counts = ratings["movie_id"].value_counts()
+    cold_ids = rng.choice(counts.index[counts >= min_ratings].to_numpy(), n_movies, replace=False)
+    is_cold = ratings["movie_id"].isin(cold_ids)
+    kept = ratings[is_cold].sample(frac=1, random_state=seed).drop_duplicates("movie_id")
+    return pd.concat([ratings[~is_cold], kept], ignore_index=True), cold_ids
+
+
+def evaluate_quality(weights, k, n_seeds, test_share, cold_movies, cold_start_ratings, seed):
+    ratings, movies = common.load_movielens()
+    variants = [("collaborative", 0.0, 0)] + [(f"hybrid w={w}", w, cold_start_ratings) for w in weights]
+
+    train, test = split_by_user(ratings, test_share, seed)
+    warm_index = recommender.RecommenderIndex.build(train, movies)
+
+    cold_train, cold_ids = make_cold(ratings, cold_movies, 50, seed)
+    cold_index = recommender.RecommenderIndex.build(cold_train, movies)
+    full = recommender.RecommenderIndex.build(ratings, movies)
+    truth = [{movie_id for movie_id, _ in full.recommend_batch([full.id_to_row[movie_id]], k)[0]} for movie_id in cold_ids]
+
+    results = []
+    for name, content_weight, min_ratings in variants:
+        results.append({
+            "variant": name,
+            **warm_quality(warm_index, train, test, k, n_seeds, content_weight, min_ratings, seed),
+            **cold_quality(cold_index, cold_ids, truth, k, content_weight, min_ratings),
+        })
+    return results
+
+
+def evaluate_latency(weights, scales, cold_start_ratings, queries, seed):
+    rng = np.random.default_rng(seed)
+    results = []
+    for scale in [1] + list(scales):
+        ratings, movies = common.load_movielens() if scale == 1 else common.synthetic_data(scale, seed)
+        index = recommender.RecommenderIndex.build(ratings, movies)
+        counts = index.rating_counts
+        seeds = {
+            "warm": np.flatnonzero(counts >= cold_start_ratings),
+            "cold": np.flatnonzero((counts > 0) & (counts < cold_start_ratings)),
+        }
+        for name, content_weight, min_ratings in [("collaborative", 0.0, 0)] + [(f"hybrid w={w}", w, cold_start_ratings) for w in weights]:
+            for seed_type, rows in seeds.items():
+                if not len(rows):
+                    continue
+                titles = [str(index.titles[row]) for row in rng.choice(rows, queries)]
+                samples = []
+                for title in titles:
+                    start = time.perf_counter()
+                    index.recommend(title, 10, content_weight, min_ratings)
+                    samples.append(time.perf_counter() - start)
+                results.append({"scale": scale, "movies": len(index.movie_ids), "variant": name, "seeds": seed_type,
+                                **common.latency_summary(samples)})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--weights", type=float, nargs="+", default=[0.0, 0.1, 0.25, 0.5])
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seeds", type=int, default=5, help="liked training movies used as seeds per user")
+    parser.add_argument("--test-share", type=float, default=0.2, help="share of every user's ratings held out")
+    parser.add_argument("--cold-movies", type=int, default=100, help="movies reduced to a single rating")
+    parser.add_argument("--cold-start-ratings", type=int, default=recommender.COLD_START_RATINGS)
+    parser.add_argument("--latency-scales", type=float, nargs="*", default=[10, 30],
+                        help="synthetic catalog sizes timed besides MovieLens")
+    parser.add_argument("--queries", type=int, default=500, help="recommend calls timed per row")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    quality = evaluate_quality(args.weights, args.k, args.seeds, args.test_share, args.cold_movies,
+                               args.cold_start_ratings, args.seed)
+    common.print_table(quality)
+    print()
+    latency = evaluate_latency(args.weights, args.latency_scales, args.cold_start_ratings, args.queries, args.seed)
+    common.print_table(latency)
+    common.write_json(args.json, {"quality": quality, "latency": latency})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Time of folding one new movie rating into the model, and a check against a full rebuild.
+
+Three updates are tried: a new movie rated once by a new user (what /add_movie/ does),
+a new movie rated by existing users, and a changed rating of an existing movie. For each,
+the incremental neighbour scores must equal the scores of a full rebuild over the same
+data. Neighbour ids may differ only between movies with tied scores.
+
+Usage:
+    python -m benchmarks.bench_incremental --scales 1 10
+"""
+import argparse
+import sys
+
+import numpy as np
+import pandas as pd
+
+from benchmarks import common
+from myapp import recommender
+
+
+def updates(ratings):
+    # Next unused movie id
+    new_id = int(ratings["movie_id"].max()) + 1
+    users = ratings["user_id"].unique()[:20]
+    popular = ratings["movie_id"].value_counts().index[0]
+    return {
+        "new movie, new user": (pd.DataFrame({"user_id": [999999], "movie_id": [new_id], "rating": [4.0]}),
+                                {new_id: "new movie"}),
+        "new movie, 20 users": (pd.DataFrame({"user_id": users, "movie_id": new_id, "rating": 3.0}),
+                                {new_id: "new movie"}),
+        "changed rating": (pd.DataFrame({"user_id": [users[0]], "movie_id": [popular], "rating": [1.0]}), {}),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", type=float, nargs="+", default=[1, 10])
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    results = []
+    all_match = True
+    for scale in args.scales:
+        ratings, movies = common.synthetic_data(scale)
+        index = recommender.RecommenderIndex.build(ratings, movies)
+        for name, (new_ratings, titles) in updates(ratings).items():
+            updated, incremental_s = common.timed(recommender.update_index, index, new_ratings, titles)
+
+            all_ratings = pd.concat([ratings, new_ratings]).drop_duplicates(["user_id", "movie_id"], keep="last")
+            full, full_s = common.timed(recommender.create_neighbour_table, all_ratings,
+                                        movie_ids=updated.movie_ids)
+            match = bool(np.allclose(updated.neighbour_table.scores, full.scores, atol=1e-6))
+            all_match &= match
+            results.append({
+                "scale": scale,
+                "update": name,
+                "incremental_ms": round(incremental_s * 1000, 2),
+                "full_rebuild_ms": round(full_s * 1000, 2),
+                "matches_full_rebuild": match,
+            })
+            common.print_table(results[-1:])
+
+    print()
+    common.print_table(results)
+    common.write_json(args.json, results)
+    sys.exit(0 if all_match else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Rows per second and peak RSS of sql_load.py, row-by-row ORM insert vs streaming bulk load.
+
+Synthetic MovieLens files are generated at each scale and loaded into a fresh SQLite
+database. The bulk load is also run a second time to show that it is idempotent.
+
+Usage:
+    python -m benchmarks.bench_ingest --scales 1 10 --modes orm bulk
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+from pathlib import Path
+
+from benchmarks import common
+
+
+def _load(mode, item_path, data_path, chunk_size):
+    import sql_load
+
+    argv = ["--movies", str(item_path), "--ratings", str(data_path), "--chunk-size", str(chunk_size)]
+    _, seconds = common.timed(sql_load.main, argv + (["--orm"] if mode == "orm" else []))
+    return {"seconds": seconds, "peak_rss_mb": common.peak_rss_mb()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", type=float, nargs="+", default=[1, 10])
+    parser.add_argument("--modes", nargs="+", default=["orm", "bulk"], choices=["orm", "bulk"])
+    parser.add_argument("--chunk-size", type=int, default=50_000)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="movie_ingest_"))
+    results = []
+    for scale in args.scales:
+        ratings, movies = common.synthetic_data(scale)
+        item_path, data_path = common.write_movielens_files(ratings, movies, workdir / f"x{scale:g}")
+        rows = len(ratings) + len(movies)
+        for mode in args.modes:
+            db_path = workdir / f"x{scale:g}_{mode}.db"
+            env = {"DATABASE_URL": f"sqlite:///{db_path}"}
+            runs = ["first"] + (["repeat"] if mode == "bulk" else [])
+            for run in runs:
+                stats = common.run_isolated(_load, mode, item_path, data_path, args.chunk_size, env=env)
+                with sqlite3.connect(db_path) as conn:
+                    stored = conn.execute("SELECT COUNT(*) FROM ratings").fetchone()[0]
+                results.append({
+                    "scale": scale,
+                    "mode": mode,
+                    "run": run,
+                    "rows": rows,
+                    "seconds": round(stats["seconds"], 2),
+                    "rows_per_s": round(rows / stats["seconds"]),
+                    "peak_rss_mb": round(stats["peak_rss_mb"], 1),
+                    "ratings_stored": stored,
+                })
+                common.print_table(results[-1:])
+            os.remove(db_path)
+
+    print()
+    common.print_table(results)
+    common.write_json(args.json, results)
+
+
+if __name__ == "__main__":
+    main()
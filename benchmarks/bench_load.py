@@ -0,0 +1,64 @@
+"""
+Wall time and peak memory of loading the model data from the database.
+
+"select *" is the previous load_data: pd.read_sql over every column of both tables.
+"dataframe" and "arrays" are the current load_data, which selects only the needed columns
+and streams them in chunks into int32/float32 arrays, returned as DataFrames or as arrays.
+Each load runs in a fresh process; extra_rss_mb is the peak RSS above the RSS the
+process had after its imports.
+
+Usage:
+    python -m benchmarks.bench_load --scales 1 10
+"""
+import argparse
+import tempfile
+from pathlib import Path
+
+from benchmarks import common
+
+
+def _load(mode):
+    import pandas as pd
+    from myapp import recommender
+    from myapp.database import engine
+
+    baseline_mb = common.current_rss_mb()
+    if mode == "select *":
+        _, seconds = common.timed(lambda: (pd.read_sql("SELECT * FROM ratings", con=engine),
+                                           pd.read_sql("SELECT * FROM movies", con=engine)))
+    else:
+        _, seconds = common.timed(recommender.load_data, as_arrays=mode == "arrays")
+    return {"seconds": seconds, "extra_rss_mb": common.peak_rss_mb() - baseline_mb}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", type=float, nargs="+", default=[1, 10])
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="movie_load_"))
+    results = []
+    for scale in args.scales:
+        ratings, movies = common.synthetic_data(scale)
+        item_path, data_path = common.write_movielens_files(ratings, movies, workdir / f"x{scale:g}")
+        url = f"sqlite:///{workdir / f'x{scale:g}.db'}"
+        common.run_isolated(_load_files, item_path, data_path, env={"DATABASE_URL": url})
+        for mode in ("select *", "dataframe", "arrays"):
+            stats = common.run_isolated(_load, mode, env={"DATABASE_URL": url})
+            results.append({"scale": scale, "ratings": len(ratings), "mode": mode,
+                            "seconds": round(stats["seconds"], 3), "extra_rss_mb": round(stats["extra_rss_mb"], 1)})
+            common.print_table(results[-1:])
+
+    print()
+    common.print_table(results)
+    common.write_json(args.json, results)
+
+
+def _load_files(item_path, data_path):
+    import sql_load
+    sql_load.main(["--movies", str(item_path), "--ratings", str(data_path)])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Per-request latency of the /recommend/ lookup before and after RecommenderIndex.
+
+"before" replays the original request path: get_recommendations over the dense similarity
+DataFrame followed by a boolean-mask scan of the movies table for every result.
+"after" is RecommenderIndex.recommend, which the API now serves from.
+
+Usage:
+    python -m benchmarks.bench_lookup --requests 5000 --json lookup.json
+"""
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks import common
+from myapp import recommender
+
+
+def legacy_recommend(movie_title, movies, similarity_df, top_n=4):
+    # The lookup /recommend/ used to do on every request
+    movie_lookup = movies.set_index("title")["movie_id"].to_dict()
+    movie_id = movie_lookup[movie_title]
+    sorted_scores = similarity_df[movie_id].sort_values(ascending=False)
+    similar_movie_ids = sorted_scores.index[1:top_n + 1].tolist()
+    id_to_title = movies.set_index("movie_id")["title"].to_dict()
+    rec_titles = [id_to_title[mid] for mid in similar_movie_ids if mid in id_to_title]
+    return [(movies[movies["title"] == t]["movie_id"].values[0], t) for t in rec_titles]
+
+
+def replay(fn, titles):
+    samples = []
+    for title in titles:
+        start = time.perf_counter()
+        fn(title)
+        samples.append(time.perf_counter() - start)
+    return common.latency_summary(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    ratings, movies = common.load_movielens()
+    similarity_df = recommender.create_similarity_matrix(ratings)
+    index = recommender.RecommenderIndex.build(ratings, movies)
+
+    rng = np.random.default_rng(0)
+    titles = rng.choice(sorted(index.title_to_row), size=args.requests)
+
+    results = [
+        {"path": "before", **replay(lambda t: legacy_recommend(t, movies, similarity_df), titles)},
+        {"path": "after", **replay(index.recommend, titles)},
+    ]
+    common.print_table(results)
+    common.write_json(args.json, results)
+
+
+if __name__ == "__main__":
+    main()
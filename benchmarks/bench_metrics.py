@@ -0,0 +1,108 @@
+"""
+Overhead of the timing spans, the /metrics histograms and the per-request profiler.
+
+Micro: time per metrics.span() block and per histogram observation, and the time to render
+/metrics once every span and route has samples.
+
+API: p50/p99 of /recommend/ (response cache off) and /click_stats/ against the MovieLens
+database, each mode in a fresh process:
+- "no middleware": the ObserveRequests middleware taken off the app, spans still on
+- "metrics": the app as shipped
+- "profiled": every request sends the X-Profile header, so each one is run under cProfile
+  and dumped to a temporary PROFILE_DIR
+
+Usage:
+    python -m benchmarks.bench_metrics --requests 2000
+"""
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks import common
+
+PROFILE_TOKEN = "bench"
+
+
+def micro(iterations):
+    from myapp import metrics
+
+    histogram = metrics.Histogram("bench_seconds", "Benchmark histogram.", ["span"])
+    start = time.perf_counter()
+    for _ in range(iterations):
+        with metrics.span("bench"):
+            pass
+    span_s = time.perf_counter() - start
+    start = time.perf_counter()
+    for i in range(iterations):
+        histogram.observe(i * 1e-6, "bench")
+    observe_s = time.perf_counter() - start
+    start = time.perf_counter()
+    text = metrics.render()
+    render_s = time.perf_counter() - start
+    return [
+        {"operation": "span()", "per_call_us": round(span_s / iterations * 1e6, 3)},
+        {"operation": "Histogram.observe", "per_call_us": round(observe_s / iterations * 1e6, 3)},
+        {"operation": f"render ({len(text.splitlines())} lines)", "per_call_us": round(render_s * 1e6, 1)},
+    ]
+
+
+def _replay(mode, n_requests, seed):
+    from fastapi.testclient import TestClient
+    from myapp import serving
+    from myapp.main import ObserveRequests, app
+
+    if mode == "no middleware":
+        # The middleware stack is built on the first request, so this takes effect
+        app.user_middleware = [m for m in app.user_middleware if m.cls is not ObserveRequests]
+    headers = {"X-Profile": PROFILE_TOKEN} if mode == "profiled" else {}
+
+    index = serving.current()
+    rng = np.random.default_rng(seed)
+    titles = [str(index.titles[row]) for row in rng.choice(len(index.titles), n_requests)]
+    movie_ids = [int(movie_id) for movie_id in rng.choice(index.movie_ids, n_requests)]
+
+    results = []
+    with TestClient(app) as client:
+        for endpoint, params in [("/recommend/", [{"movie": title} for title in titles]),
+                                 ("/click_stats/", [{"movie_id": movie_id} for movie_id in movie_ids])]:
+            samples = []
+            for request_params in params:
+                start = time.perf_counter()
+                client.get(endpoint, params=request_params, headers=headers)
+                samples.append(time.perf_counter() - start)
+            results.append({"mode": mode, "endpoint": endpoint, **common.latency_summary(samples)})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000, help="requests per endpoint and mode")
+    parser.add_argument("--iterations", type=int, default=200000, help="calls timed per micro benchmark")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--db", help="SQLite file to use (created if missing)")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    micro_results = micro(args.iterations)
+    common.print_table(micro_results)
+    print()
+
+    url = common.prepare_database(args.db)
+    api_results = []
+    with tempfile.TemporaryDirectory(prefix="movie_profiles_") as profile_dir:
+        for mode in ["no middleware", "metrics", "profiled"]:
+            api_results += common.run_isolated(_replay, mode, args.requests, args.seed, env={
+                "DATABASE_URL": url,
+                "RECOMMEND_CACHE_SIZE": "0",
+                "CLICK_STATS_CACHE_SIZE": "0",
+                "PROFILE_TOKEN": PROFILE_TOKEN,
+                "PROFILE_DIR": profile_dir,
+            })
+    common.print_table(api_results)
+    common.write_json(args.json, {"micro": micro_results, "api": api_results})
+
+
+if __name__ == "__main__":
+    main()
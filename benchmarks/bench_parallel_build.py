@@ -0,0 +1,119 @@
+"""
+Build time and peak memory of the exact neighbour table with 1, 2, 4 and 8 worker processes.
+
+Every (scale, workers, block size) setting runs in a fresh process on synthetic data of the
+given scale. 1 worker is the in-process blocked build, more workers use the process pool in
+myapp/parallel.py. Reports the wall time, the speedup over 1 worker, the peak RSS of the
+building process and of the largest worker, and whether the table is identical to the
+first setting's table. Speedups are bounded by the cores of the machine, printed first.
+
+Usage:
+    python -m benchmarks.bench_parallel_build --scales 10 30 --workers 1 2 4 8 --block-sizes 512
+"""
+import argparse
+import hashlib
+import os
+import threading
+import time
+from pathlib import Path
+
+from benchmarks import common
+from myapp import recommender
+
+
+def _descendants(pid):
+    # Child processes of pid, recursively, from /proc/<pid>/task/<tid>/children
+    found = []
+    try:
+        for tid in os.listdir(f"/proc/{pid}/task"):
+            for child in Path(f"/proc/{pid}/task/{tid}/children").read_text().split():
+                found += [int(child)] + _descendants(int(child))
+    except OSError:
+        pass
+    return found
+
+
+def _peak_mb(pid):
+    # VmHWM, the peak resident set size of a running process
+    try:
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+class WorkerPeak:
+    """Largest peak RSS of any descendant process, sampled in a thread while the block runs."""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak_mb = 0.0
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while not self._done.wait(self.interval):
+            for pid in _descendants(os.getpid()):
+                self.peak_mb = max(self.peak_mb, _peak_mb(pid))
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._done.set()
+        self._thread.join()
+
+
+def _build(scale, workers, block_size, seed):
+    ratings, _ = common.synthetic_data(scale, seed)
+    matrix, movie_ids, _ = recommender.build_rating_matrix(ratings)
+    del ratings
+    with WorkerPeak() as workers_peak:
+        start = time.perf_counter()
+        table = recommender.neighbours_from_matrix(matrix, movie_ids, recommender.DEFAULT_TOP_K, block_size, workers)
+        elapsed = time.perf_counter() - start
+    digest = hashlib.sha256(table.neighbours.tobytes() + table.scores.tobytes()).hexdigest()
+    return {
+        "scale": scale,
+        "movies": len(movie_ids),
+        "workers": workers,
+        "block_size": block_size,
+        "build_s": round(elapsed, 3),
+        "peak_rss_mb": round(common.peak_rss_mb(), 1),
+        "worker_peak_mb": round(workers_peak.peak_mb, 1) if workers > 1 else "",
+        "digest": digest,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", type=float, nargs="+", default=[10, 30])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--block-sizes", type=int, nargs="+", default=[recommender.DEFAULT_BLOCK_SIZE])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    print(f"CPU cores: {os.cpu_count()}")
+    results = []
+    for scale in args.scales:
+        for block_size in args.block_sizes:
+            # The first worker count (1 by default) is the reference for speedup and results
+            baseline_s = baseline_digest = None
+            for workers in args.workers:
+                row = common.run_isolated(_build, scale, workers, block_size, args.seed)
+                digest = row.pop("digest")
+                if baseline_s is None:
+                    baseline_s, baseline_digest = row["build_s"], digest
+                row["speedup"] = round(baseline_s / row["build_s"], 2)
+                row["identical"] = digest == baseline_digest
+                results.append(row)
+    common.print_table(results)
+    common.write_json(args.json, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+/recommend/ throughput with concurrent clients, impression buffer on and off.
+
+The app runs in-process behind FastAPI's TestClient against a SQLite copy of the MovieLens
+data. With the buffer off every request writes its impressions in its own upsert.
+
+Usage:
+    python -m benchmarks.bench_recommend_load --clients 1 8 32 --duration 5
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from benchmarks import common
+
+
+def _load(clients, duration):
+    from fastapi.testclient import TestClient
+    from myapp import config
+    from myapp import serving
+    from myapp.main import app
+
+    index = serving.current()
+
+    titles = sorted(index.title_to_row)
+    results = []
+    with TestClient(app) as client:
+        for n_clients in clients:
+            deadline = time.perf_counter() + duration
+
+            def worker(seed):
+                rng = np.random.default_rng(seed)
+                samples = []
+                while time.perf_counter() < deadline:
+                    start = time.perf_counter()
+                    client.get("/recommend/", params={"movie": titles[rng.integers(len(titles))]})
+                    samples.append(time.perf_counter() - start)
+                return samples
+
+            with ThreadPoolExecutor(n_clients) as pool:
+                samples = [s for worker_samples in pool.map(worker, range(n_clients)) for s in worker_samples]
+            results.append({
+                "buffer": "on" if config.IMPRESSION_BUFFER else "off",
+                "clients": n_clients,
+                "requests": len(samples),
+                "req_per_s": round(len(samples) / duration, 1),
+                **common.latency_summary(samples),
+            })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per concurrency level")
+    parser.add_argument("--db", help="SQLite file to use (created if missing)")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    url = common.prepare_database(args.db)
+    results = []
+    for buffer in ("0", "1"):
+        results += common.run_isolated(_load, args.clients, args.duration,
+                                       env={"DATABASE_URL": url, "IMPRESSION_BUFFER": buffer})
+    common.print_table(results)
+    common.write_json(args.json, results)
+
+
+if __name__ == "__main__":
+    main()
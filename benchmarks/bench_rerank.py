@@ -0,0 +1,141 @@
+"""
+Latency and effect of the re-ranking stage behind /recommend/.
+
+Builds the model on MovieLens (scale 1) or synthetic data of the given scales, fills an
+in-memory click_stats table with synthetic counters (impressions growing with a movie's
+ratings, click rates drawn per movie) and loads it into a ClickStatsSnapshot. Then runs
+RecommenderIndex.recommend for --queries random seed movies with no re-ranking, each stage
+alone and all of them together, and reports per configuration:
+- p50/p99/mean latency of recommend and the p50 added over no re-ranking
+- diversity: 1 - mean genre cosine similarity between two movies of a list
+- popularity: mean log popularity in [0, 1] of the recommended movies
+- ctr_lift: mean smoothed click-rate lift of the recommended movies
+- overlap: share of the list also in the list without re-ranking
+
+Exits with status 1 when a configuration's p99 is above --budget-ms.
+
+Usage:
+    python -m benchmarks.bench_rerank --scales 1 10 --k 10 --budget-ms 2
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from benchmarks import common
+
+
+def _snapshot(index, seed, prior_shown):
+    # click_stats in an in-memory database, read through the same query the API uses
+    from sqlalchemy import create_engine, insert
+    from sqlalchemy.pool import StaticPool
+    from myapp.models import ClickStats
+    from myapp.reranking import ClickStatsSnapshot
+
+    rng = np.random.default_rng(seed)
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    ClickStats.__table__.create(engine)
+    shown = rng.poisson(5 * index.rating_counts + 1)
+    clicks = rng.binomial(shown, rng.beta(2, 30, len(shown)))
+    with engine.begin() as conn:
+        conn.execute(insert(ClickStats), [
+            {"movie_id": int(movie_id), "title": str(title), "recommendations_shown": int(s), "clicks": int(c)}
+            for movie_id, title, s, c in zip(index.movie_ids, index.titles, shown, clicks)])
+    snapshot = ClickStatsSnapshot(engine, prior_shown=prior_shown)
+    snapshot.refresh()
+    return snapshot
+
+
+def _diversity(index, rows):
+    # 1 - mean pairwise genre cosine similarity of one list
+    if len(rows) < 2:
+        return None
+    genres, inverse_norms = index.genre_vectors
+    vectors = genres[rows] * inverse_norms[rows, None]
+    similarity = vectors @ vectors.T
+    pairs = len(rows) * (len(rows) - 1)
+    return 1.0 - (similarity.sum() - np.trace(similarity)) / pairs
+
+
+def _run(scale, args):
+    from myapp import recommender, reranking
+
+    ratings, movies = common.load_movielens() if scale == 1 else common.synthetic_data(scale, args.seed)
+    index = recommender.RecommenderIndex.build(ratings, movies)
+    snapshot = _snapshot(index, args.seed, args.prior_shown)
+    rng = np.random.default_rng(args.seed)
+    seeds = [str(index.titles[row]) for row in rng.choice(np.flatnonzero(index.has_title), args.queries)]
+
+    configs = {
+        "none": None,
+        "popularity": reranking.make_reranker(popularity=args.popularity, pool_factor=args.pool_factor),
+        "ctr": reranking.make_reranker(ctr=args.ctr, snapshot=snapshot, pool_factor=args.pool_factor),
+        "mmr": reranking.make_reranker(diversity=args.diversity, pool_factor=args.pool_factor),
+        "all": reranking.make_reranker(args.diversity, args.popularity, args.ctr, snapshot, args.pool_factor),
+    }
+    results, baseline = [], {}
+    for name, reranker in configs.items():
+        # Warm up the lazily built arrays before timing
+        index.recommend(seeds[0], args.k, args.content_weight, reranker=reranker)
+        samples, lists = [], []
+        for title in seeds:
+            start = time.perf_counter()
+            recs = index.recommend(title, args.k, args.content_weight, reranker=reranker)
+            samples.append(time.perf_counter() - start)
+            lists.append(np.array([index.id_to_row[movie_id] for movie_id, _ in recs], dtype=np.intp))
+        if reranker is None:
+            baseline = {"lists": lists, "p50_ms": common.latency_summary(samples)["p50_ms"]}
+
+        latency = common.latency_summary(samples)
+        diversities = [d for d in (_diversity(index, rows) for rows in lists) if d is not None]
+        shown = np.concatenate(lists)
+        overlap = np.mean([len(np.intersect1d(rows, base)) / max(1, len(base))
+                           for rows, base in zip(lists, baseline["lists"])])
+        results.append({
+            "scale": scale,
+            "movies": len(index.movie_ids),
+            "config": name,
+            **latency,
+            "added_p50_ms": round(latency["p50_ms"] - baseline["p50_ms"], 4),
+            "diversity": round(float(np.mean(diversities)), 3),
+            "popularity": round(float(index.popularity[shown].mean()), 3),
+            "ctr_lift": round(float(snapshot.lift(index.movie_ids[shown]).mean()), 3),
+            "overlap": round(float(overlap), 3),
+            "within_budget": latency["p99_ms"] <= args.budget_ms,
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", type=float, nargs="+", default=[1, 10])
+    parser.add_argument("--k", type=int, default=10, help="recommendations per query")
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--content-weight", type=float, default=0.0)
+    parser.add_argument("--diversity", type=float, default=0.3, help="RERANK_DIVERSITY")
+    parser.add_argument("--popularity", type=float, default=0.3, help="RERANK_POPULARITY")
+    parser.add_argument("--ctr", type=float, default=0.3, help="RERANK_CTR")
+    parser.add_argument("--pool-factor", type=int, default=5, help="RERANK_POOL_FACTOR")
+    parser.add_argument("--prior-shown", type=float, default=20, help="CTR_PRIOR_SHOWN")
+    parser.add_argument("--budget-ms", type=float, default=2.0, help="highest p99 accepted for recommend")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    results = []
+    for scale in args.scales:
+        results += common.run_isolated(_run, scale, args)
+        common.print_table(results[-5:])
+        print()
+
+    common.print_table(results)
+    common.write_json(args.json, {"budget_ms": args.budget_ms, "results": results})
+    over = [f"{row['config']} at scale {row['scale']}" for row in results if not row["within_budget"]]
+    if over:
+        print(f"\nOver the {args.budget_ms} ms p99 budget: {', '.join(over)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Latency and accuracy of the fuzzy title resolver at growing catalog sizes.
+
+The catalog is the MovieLens titles plus synthetic titles of one to five words drawn from
+their vocabulary, up to --sizes titles. Queries are catalog titles typed the way users do:
+different case, a leading article instead of a trailing one, a bracketed year, and zero to
+two typos (insertion, deletion, substitution or swap of adjacent characters). Reports the
+build time and peak RSS growth of the TitleResolver, p50/p99 of lookup() for the best match
+(as /recommend/ does) and for 5 candidates (as /movies/resolve does), and the share of
+queries resolved to the title they were made from.
+
+Usage:
+    python -m benchmarks.bench_resolve --sizes 1682 10000 100000 300000 --queries 2000
+"""
+import argparse
+import string
+import time
+
+import numpy as np
+
+from benchmarks import common
+
+
+def _catalog(size, seed):
+    titles = [str(title) for title in common.load_movielens()[1]["title"]]
+    words = sorted({word for title in titles for word in title.replace(",", " ").split()})
+    rng = np.random.default_rng(seed)
+    seen = set(titles)
+    while len(titles) < size:
+        title = " ".join(rng.choice(words, rng.integers(1, 6)))
+        if title not in seen:
+            seen.add(title)
+            titles.append(title)
+    return titles[:size]
+
+
+def _typo(title, rng):
+    # One random edit of a character, as a fast typist would make it
+    position = int(rng.integers(len(title)))
+    letter = string.ascii_lowercase[rng.integers(26)]
+    edit = rng.integers(4)
+    if edit == 0:
+        return title[:position] + letter + title[position:]
+    if edit == 1:
+        return title[:position] + title[position + 1:]
+    if edit == 2:
+        return title[:position] + letter + title[position + 1:]
+    position = min(position, len(title) - 2)
+    return title[:position] + title[position + 1] + title[position] + title[position + 2:]
+
+
+def _query(title, rng):
+    if title.endswith(", the") and rng.random() < 0.5:
+        title = "The " + title[:-5]
+    if rng.random() < 0.3:
+        title = f"{title} ({rng.integers(1930, 2000)})"
+    for _ in range(rng.integers(3)):
+        title = _typo(title, rng)
+    return title.title() if rng.random() < 0.5 else title
+
+
+def _run(size, n_queries, seed):
+    from myapp.titles import TitleResolver
+
+    titles = _catalog(size, seed)
+    rng = np.random.default_rng(seed)
+    base_mb = common.peak_rss_mb()
+    resolver, build_s = common.timed(TitleResolver, titles, np.arange(len(titles)))
+    # Queries made from titles of at least 8 characters, shorter ones leave too little to go on
+    targets = [i for i in rng.permutation(len(titles)) if len(titles[i]) >= 8][:n_queries]
+    queries = [_query(titles[i], rng) for i in targets]
+
+    results = {}
+    for name, limit in [("best", 1), ("candidates", 5)]:
+        samples, correct = [], 0
+        for target, query in zip(targets, queries):
+            start = time.perf_counter()
+            match, _ = resolver.lookup(query, limit)
+            samples.append(time.perf_counter() - start)
+            # A duplicate title counts as resolved
+            correct += match is not None and match.title == titles[target]
+        results[name] = (common.latency_summary(samples), correct / len(queries))
+    return {
+        "titles": size,
+        "build_s": round(build_s, 3),
+        "build_peak_mb": round(common.peak_rss_mb() - base_mb, 1),
+        "best_p50_ms": results["best"][0]["p50_ms"],
+        "best_p99_ms": results["best"][0]["p99_ms"],
+        "candidates_p50_ms": results["candidates"][0]["p50_ms"],
+        "candidates_p99_ms": results["candidates"][0]["p99_ms"],
+        "resolved": round(results["best"][1], 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1682, 10_000, 100_000, 300_000])
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        results.append(common.run_isolated(_run, size, args.queries, args.seed))
+        common.print_table(results[-1:])
+
+    print()
+    common.print_table(results)
+    common.write_json(args.json, results)
+
+
+if __name__ == "__main__":
+    main()
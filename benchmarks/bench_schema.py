@@ -0,0 +1,119 @@
+"""
+load_data() and the /click/ and /click_stats/ queries on the old string-key schema and
+on the integer-key schema produced by migrate_db.py.
+
+A copy of the MovieLens data is stored with the old schema, timed, migrated with
+`python migrate_db.py` and timed again. The per-movie and per-user rating scans used by
+the recommender are timed as well.
+
+Usage:
+    python -m benchmarks.bench_schema --queries 2000
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks import common
+
+# Schema the models declared before the move to integer keys
+LEGACY_SCHEMA = """
+CREATE TABLE movies (movie_id VARCHAR NOT NULL PRIMARY KEY, title VARCHAR, release_date VARCHAR,
+    unknown INTEGER, action INTEGER, adventure INTEGER, animation INTEGER, children INTEGER, comedy INTEGER,
+    crime INTEGER, documentary INTEGER, drama INTEGER, fantasy INTEGER, filmnoir INTEGER, horror INTEGER,
+    musical INTEGER, mystery INTEGER, romance INTEGER, scifi INTEGER, thriller INTEGER, war INTEGER, western INTEGER);
+CREATE INDEX ix_movies_title ON movies (title);
+CREATE INDEX ix_movies_movie_id ON movies (movie_id);
+CREATE TABLE ratings (user_id VARCHAR NOT NULL, movie_id VARCHAR NOT NULL, rating FLOAT, PRIMARY KEY (user_id, movie_id));
+CREATE INDEX ix_ratings_movie_id ON ratings (movie_id);
+CREATE INDEX ix_ratings_user_id ON ratings (user_id);
+CREATE TABLE click_stats (movie_id VARCHAR NOT NULL PRIMARY KEY, title VARCHAR, recommendations_shown INTEGER, clicks INTEGER);
+CREATE UNIQUE INDEX ix_click_stats_title ON click_stats (title);
+CREATE INDEX ix_click_stats_movie_id ON click_stats (movie_id);
+"""
+
+QUERIES = {
+    "click": "UPDATE click_stats SET clicks = clicks + 1 WHERE movie_id = ?",
+    "click_stats": "SELECT clicks, recommendations_shown FROM click_stats WHERE movie_id = ?",
+    "ratings_by_movie": "SELECT user_id, rating FROM ratings WHERE movie_id = ?",
+    "ratings_by_user": "SELECT movie_id, rating FROM ratings WHERE user_id = ?",
+}
+
+
+def create_legacy_db(path):
+    ratings, movies = common.load_movielens()
+    with sqlite3.connect(path) as conn:
+        conn.executescript(LEGACY_SCHEMA)
+        movies.astype({"movie_id": str}).to_sql("movies", conn, if_exists="append", index=False)
+        ratings.astype({"user_id": str, "movie_id": str, "rating": float}).to_sql(
+            "ratings", conn, if_exists="append", index=False)
+        # One click_stats row per movie, titles made unique for the old unique index
+        conn.execute("INSERT INTO click_stats SELECT movie_id, title || ' #' || movie_id, 10, 1 FROM movies")
+
+
+def _load_data(legacy):
+    if legacy:
+        import pandas as pd
+        from myapp.database import engine
+        # load_data as it was: SELECT * with default dtypes
+        _, seconds = common.timed(lambda: (pd.read_sql("SELECT * FROM movies", con=engine),
+                                           pd.read_sql("SELECT * FROM ratings", con=engine)))
+    else:
+        from myapp import recommender
+        _, seconds = common.timed(recommender.load_data)
+    return {"load_data_s": seconds, "peak_rss_mb": common.peak_rss_mb()}
+
+
+def time_queries(path, legacy, n_queries):
+    rng = np.random.default_rng(0)
+    ids = rng.integers(1, 944, size=n_queries)
+    params = [(str(i),) if legacy else (int(i),) for i in ids]
+    results = {}
+    with sqlite3.connect(path) as conn:
+        for name, sql in QUERIES.items():
+            samples = []
+            for param in params:
+                start = time.perf_counter()
+                conn.execute(sql, param).fetchall()
+                if name == "click":
+                    conn.commit()
+                samples.append(time.perf_counter() - start)
+            results[name] = common.latency_summary(samples)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="movie_schema_"))
+    legacy_path, migrated_path = workdir / "legacy.db", workdir / "migrated.db"
+    create_legacy_db(legacy_path)
+    shutil.copy(legacy_path, migrated_path)
+    subprocess.run([sys.executable, "migrate_db.py"], cwd=common.ROOT_DIR, check=True,
+                   env={**os.environ, "DATABASE_URL": f"sqlite:///{migrated_path}"})
+
+    results = []
+    for schema, path in (("string keys", legacy_path), ("integer keys", migrated_path)):
+        legacy = schema == "string keys"
+        load = common.run_isolated(_load_data, legacy, env={"DATABASE_URL": f"sqlite:///{path}"})
+        results.append({"schema": schema, "query": "load_data",
+                        "seconds": round(load["load_data_s"], 3), "peak_rss_mb": round(load["peak_rss_mb"], 1)})
+        for name, summary in time_queries(path, legacy, args.queries).items():
+            results.append({"schema": schema, "query": name, **summary})
+
+    common.print_table(results)
+    common.write_json(args.json, results)
+
+
+if __name__ == "__main__":
+    main()
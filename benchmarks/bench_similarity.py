@@ -0,0 +1,57 @@
+"""
+Build time and peak RSS of the dense similarity matrix against the sparse top-K engine.
+
+Each build runs in a fresh process so peak RSS reflects that build only.
+
+Usage:
+    python -m benchmarks.bench_similarity --scales 1 10 100 --json similarity.json
+"""
+import argparse
+
+from benchmarks import common
+
+
+def _build(mode, scale):
+    from myapp import recommender
+
+    ratings, _ = common.synthetic_data(scale)
+    baseline_mb = common.peak_rss_mb()
+    if mode == "dense":
+        _, seconds = common.timed(recommender.create_similarity_matrix, ratings)
+    else:
+        _, seconds = common.timed(recommender.create_neighbour_table, ratings)
+    return {
+        "mode": mode,
+        "scale": scale,
+        "movies": ratings["movie_id"].nunique(),
+        "ratings": len(ratings),
+        "build_s": round(seconds, 3),
+        "peak_rss_mb": round(common.peak_rss_mb(), 1),
+        "data_rss_mb": round(baseline_mb, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", type=float, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    results = []
+    for scale in args.scales:
+        for mode in ("dense", "sparse"):
+            n_movies = int(common.BASE_MOVIES * scale)
+            # pivot table, similarity array and DataFrame copy are all N x N float64
+            if mode == "dense" and 3 * n_movies ** 2 * 8 > common.available_memory_bytes():
+                results.append({"mode": mode, "scale": scale, "movies": n_movies, "build_s": "skipped (out of memory)"})
+                continue
+            results.append(common.run_isolated(_build, mode, scale))
+            common.print_table(results[-1:])
+
+    print()
+    common.print_table(results)
+    common.write_json(args.json, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Cold-start time and per-worker memory of the API with and without a persisted model.
+
+"compute" workers load both tables and build the model when myapp.main is imported.
+"artifact" workers memory-map the version written by `python -m myapp.artifact build`.
+All workers of a run stay alive together so PSS shows how much memory they share.
+
+Usage:
+    python -m benchmarks.bench_startup --workers 4
+"""
+import argparse
+import multiprocessing as mp
+import os
+import tempfile
+import time
+
+from benchmarks import common
+
+
+def _worker(env, barrier, queue):
+    os.environ.update(env)
+    # Import the heavy libraries first so startup_s measures the app's own work
+    start = time.perf_counter()
+    import fastapi, numpy, pandas, sqlalchemy  # noqa: F401
+    libs_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    from myapp import serving
+    import myapp.main  # noqa: F401
+    index = serving.current()
+    startup_s = time.perf_counter() - start
+
+    # Serve every title once so the model pages are actually touched
+    for title in list(index.title_to_row):
+        index.recommend(title)
+
+    barrier.wait()
+    queue.put({"libs_s": libs_s, "startup_s": startup_s, "rss_mb": common.current_rss_mb(), "pss_mb": common.pss_mb()})
+    barrier.wait()
+
+
+def run_workers(n_workers, env):
+    ctx = mp.get_context("spawn")
+    barrier = ctx.Barrier(n_workers)
+    queue = ctx.Queue()
+    workers = [ctx.Process(target=_worker, args=(env, barrier, queue)) for _ in range(n_workers)]
+    for worker in workers:
+        worker.start()
+    stats = [queue.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--db", help="SQLite file to use (created if missing)")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    url = common.prepare_database(args.db)
+    model_dir = tempfile.mkdtemp(prefix="movie_models_")
+    base_env = {"DATABASE_URL": url, "MODEL_DIR": model_dir, "IMPRESSION_BUFFER": "0"}
+
+    results = []
+    for mode in ("compute", "artifact"):
+        if mode == "artifact":
+            common.run_isolated(_build_artifact, model_dir, env=base_env)
+        env = {**base_env, "USE_MODEL_ARTIFACT": "1" if mode == "artifact" else "0"}
+        stats = run_workers(args.workers, env)
+        results.append({
+            "mode": mode,
+            "workers": args.workers,
+            "libs_import_s_max": round(max(s["libs_s"] for s in stats), 3),
+            "startup_s_max": round(max(s["startup_s"] for s in stats), 3),
+            "rss_mb_per_worker": round(sum(s["rss_mb"] for s in stats) / len(stats), 1),
+            "pss_mb_per_worker": round(sum(s["pss_mb"] for s in stats) / len(stats), 1),
+            "pss_mb_total": round(sum(s["pss_mb"] for s in stats), 1),
+        })
+    common.print_table(results)
+    common.write_json(args.json, results)
+
+
+def _build_artifact(model_dir):
+    from myapp import artifact
+    return artifact.build(model_dir, force=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+Streamlit page latency against a local backend: the old per-column requests vs one batch call.
+
+Starts uvicorn on a free port against a SQLite copy of the MovieLens data, then times:
+- "5 calls": what the page used to do per interaction, /recommend/ followed by one
+  /click_stats/ per column, each with a fresh requests.get connection
+- "2 calls, pooled": /recommend/ plus /click_stats/batch on one requests.Session
+- "1 call, with_stats": /recommend/?with_stats=1, the click percentages in the same response,
+  as the page makes it now
+- "page render": a full run of streamlit-app.py in Streamlit's AppTest after pressing
+  "Get Recommendations", with the page talking to the backend over HTTP
+- "rerun": one script rerun, as triggered by any widget change. "before" is the movie picker
+  as it used to be, filled by recommender.get_movies_list() straight from the database on
+  every run; "after" is the picker of streamlit-app.py, filled from the cached
+  /movies/search; "full page" is a rerun of the whole current page
+
+Usage:
+    python -m benchmarks.bench_ui --interactions 200
+"""
+import argparse
+import logging
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from benchmarks import common
+
+# The movie picker before /movies/search: a full SELECT DISTINCT on every rerun
+OLD_PICKER = """
+import streamlit as st
+from myapp import recommender
+st.selectbox(label="Select a Movie", index=None, options=recommender.get_movies_list())
+"""
+
+# The movie picker of streamlit-app.py: typeahead over the cached /movies/search
+NEW_PICKER = """
+import os
+import requests
+import streamlit as st
+
+@st.cache_resource
+def get_session():
+    return requests.Session()
+
+@st.cache_data(ttl=60, show_spinner=False)
+def search_movies(prefix):
+    data = get_session().get(os.environ["API_URL"] + "/movies/search", params={"q": prefix, "limit": 50}).json()
+    return [movie["title"] for movie in data["results"]], data["total"]
+
+prefix = st.text_input("Search for a movie")
+titles, total = search_movies(prefix.strip().lower())
+st.selectbox(label="Select a Movie", index=None, options=titles)
+"""
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _start_backend(url, port):
+    env = {**os.environ, "DATABASE_URL": url, "USER_MODEL": "0"}
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "myapp.main:app", "--port", str(port), "--log-level", "warning"],
+                              cwd=common.ROOT_DIR, env=env)
+    import requests
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError("backend exited during startup")
+        try:
+            requests.get(f"http://127.0.0.1:{port}/", timeout=1)
+            return server
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError("backend did not start")
+
+
+def _time(fn, titles):
+    samples = []
+    for title in titles:
+        start = time.perf_counter()
+        fn(title)
+        samples.append(time.perf_counter() - start)
+    return common.latency_summary(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--interactions", type=int, default=200, help="button presses timed per variant")
+    parser.add_argument("--renders", type=int, default=20, help="full page renders and reruns timed")
+    parser.add_argument("--db", help="SQLite file to use (created if missing)")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    url = common.prepare_database(args.db)
+    # The page reads the movie list straight from the database
+    os.environ["DATABASE_URL"] = url
+    port = _free_port()
+    api = f"http://127.0.0.1:{port}"
+    os.environ["API_URL"] = api
+
+    import requests
+    from streamlit.testing.v1 import AppTest
+    from myapp import recommender
+    # AppTest runs the script in bare mode, which logs a harmless warning per run
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+
+    titles = [title.lower() for title in recommender.get_movies_list()]
+    rng = np.random.default_rng(0)
+    server = _start_backend(url, port)
+    try:
+        def five_calls(title):
+            recs = requests.get(f"{api}/recommend/", params={"movie": title}).json()["recommendations"]
+            for rec in recs:
+                requests.get(f"{api}/click_stats/", params={"movie_id": rec["movie_id"]}).json()
+
+        session = requests.Session()
+
+        def two_calls(title):
+            recs = session.get(f"{api}/recommend/", params={"movie": title}).json()["recommendations"]
+            session.get(f"{api}/click_stats/batch", params={"ids": ",".join(str(rec["movie_id"]) for rec in recs)}).json()
+
+        def render(title):
+            app = AppTest.from_file(str(common.ROOT_DIR / "streamlit-app.py"), default_timeout=60)
+            app.run()
+            app.text_input[0].input(title).run()
+            app.selectbox[0].set_value(title).run()
+            start = time.perf_counter()
+            app.button[0].click().run()
+            elapsed = time.perf_counter() - start
+            if app.exception:
+                raise RuntimeError(app.exception[0].message)
+            return elapsed
+
+        def one_call(title):
+            session.get(f"{api}/recommend/", params={"movie": title, "with_stats": 1}).json()
+
+        sample = [titles[i] for i in rng.integers(len(titles), size=args.interactions)]
+        results = [
+            {"variant": "5 calls", **_time(five_calls, sample)},
+            {"variant": "2 calls, pooled", **_time(two_calls, sample)},
+            {"variant": "1 call, with_stats", **_time(one_call, sample)},
+        ]
+        render_samples = [render(titles[i]) for i in rng.integers(len(titles), size=args.renders)]
+        results.append({"variant": "page render", **common.latency_summary(render_samples)})
+
+        def reruns(app):
+            app.run()
+            samples = []
+            for _ in range(args.renders):
+                start = time.perf_counter()
+                app.run()
+                samples.append(time.perf_counter() - start)
+            return common.latency_summary(samples)
+
+        results.append({"variant": "rerun, before", **reruns(AppTest.from_string(OLD_PICKER, default_timeout=60))})
+        results.append({"variant": "rerun, after", **reruns(AppTest.from_string(NEW_PICKER, default_timeout=60))})
+        results.append({"variant": "rerun, full page",
+                        **reruns(AppTest.from_file(str(common.ROOT_DIR / "streamlit-app.py"), default_timeout=60))})
+    finally:
+        server.terminate()
+        server.wait()
+
+    common.print_table(results)
+    common.write_json(args.json, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Personalized recommendations: ALS factorization vs the item-item neighbour table.
+
+Holds out a random share of every user's ratings in data/u.data, builds both models on the
+rest and ranks unrated movies for every user. The item-item model scores a movie by the
+similarities of its neighbours the user rated, weighted by the ratings. Reports
+precision@k and recall@k against the held-out movies, training time, model size and
+per-request latency of UserRecommender.recommend.
+
+Usage:
+    python -m benchmarks.bench_user_model --k 10 --factors 16 32 64
+"""
+import argparse
+import time
+
+import numpy as np
+from scipy import sparse
+
+from benchmarks import common
+from myapp import factorization
+from myapp import recommender
+
+
+def split_by_user(ratings, test_share, seed):
+    """Moves test_share of every user's ratings into a held-out set."""
+    rng = np.random.default_rng(seed)
+    held_out = rng.random(len(ratings)) < test_share
+    return ratings[~held_out].reset_index(drop=True), ratings[held_out].reset_index(drop=True)
+
+
+def user_movie_matrix(ratings, user_ids, movie_ids):
+    """user x movie csr matrix of rating rows, on fixed user and movie orders."""
+    rows = np.searchsorted(user_ids, ratings["user_id"].to_numpy())
+    columns = np.searchsorted(movie_ids, ratings["movie_id"].to_numpy())
+    return sparse.csr_matrix((ratings["rating"].to_numpy(dtype=np.float32), (rows, columns)),
+                             shape=(len(user_ids), len(movie_ids)))
+
+
+def precision_recall(scores, train_matrix, test_matrix, k):
+    """
+    Mean precision@k and recall@k of dense user x movie scores.
+
+    Movies the user rated in training are never recommended, users without held-out
+    ratings are skipped.
+    """
+    scores = scores.copy()
+    scores[train_matrix.nonzero()] = -np.inf
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    relevant = test_matrix.toarray() > 0
+    hits = np.take_along_axis(relevant, top, axis=1).sum(axis=1)
+    n_relevant = relevant.sum(axis=1)
+    users = n_relevant > 0
+    return float((hits[users] / k).mean()), float((hits[users] / n_relevant[users]).mean())
+
+
+def item_item_scores(index, train_matrix):
+    """user x movie scores from the neighbour table: sum of rating * similarity."""
+    table = index.neighbour_table
+    n_movies, top_k = table.neighbours.shape
+    valid = table.neighbours >= 0
+    similarity = sparse.csr_matrix(
+        (table.scores[valid], (np.repeat(np.arange(n_movies), top_k)[valid.ravel()], table.neighbours[valid])),
+        shape=(n_movies, n_movies))
+    return (train_matrix @ similarity).toarray()
+
+
+def evaluate(factor_counts, k, test_share, iterations, seed):
+    ratings, movies = common.load_movielens()
+    train, test = split_by_user(ratings, test_share, seed)
+
+    # Both models share the movie and user order of the full data set
+    user_ids = np.unique(ratings["user_id"].to_numpy())
+    movie_ids = np.unique(ratings["movie_id"].to_numpy())
+    train_matrix = user_movie_matrix(train, user_ids, movie_ids)
+    test_matrix = user_movie_matrix(test, user_ids, movie_ids)
+
+    results = []
+    start = time.perf_counter()
+    index = recommender.RecommenderIndex.from_movies(
+        recommender.neighbours_from_matrix(train_matrix.T.tocsr(), movie_ids, recommender.DEFAULT_TOP_K,
+                                           recommender.DEFAULT_BLOCK_SIZE),
+        movies, train_matrix.T.tocsr(), user_ids)
+    build_s = time.perf_counter() - start
+    precision, recall = precision_recall(item_item_scores(index, train_matrix), train_matrix, test_matrix, k)
+    table = index.neighbour_table
+    results.append({
+        "model": "item-item",
+        "train_s": round(build_s, 2),
+        "size_mb": round((table.neighbours.nbytes + table.scores.nbytes) / 2**20, 2),
+        f"precision@{k}": round(precision, 4),
+        f"recall@{k}": round(recall, 4),
+    })
+
+    rng = np.random.default_rng(seed)
+    for n_factors in factor_counts:
+        start = time.perf_counter()
+        model = factorization.UserRecommender.from_index(index, factors=n_factors, iterations=iterations)
+        train_s = time.perf_counter() - start
+        precision, recall = precision_recall(model.user_factors @ model.item_factors.T, train_matrix, test_matrix, k)
+
+        samples = []
+        for user_id in rng.choice(user_ids, 1000):
+            start = time.perf_counter()
+            model.recommend(user_id, k)
+            samples.append(time.perf_counter() - start)
+        results.append({
+            "model": f"als-{n_factors}",
+            "train_s": round(train_s, 2),
+            "size_mb": round(model.nbytes / 2**20, 2),
+            f"precision@{k}": round(precision, 4),
+            f"recall@{k}": round(recall, 4),
+            **common.latency_summary(samples),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--factors", type=int, nargs="+", default=[16, 32, 64])
+    parser.add_argument("--iterations", type=int, default=factorization.DEFAULT_ITERATIONS)
+    parser.add_argument("--test-share", type=float, default=0.2, help="share of every user's ratings held out")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    results = evaluate(args.factors, args.k, args.test_share, args.iterations, args.seed)
+    common.print_table(results)
+    common.write_json(args.json, results)
+
+
+if __name__ == "__main__":
+    main()
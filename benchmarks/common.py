@@ -0,0 +1,238 @@
+# Shared helpers for the benchmark scripts
+import json
+import multiprocessing as mp
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from myapp.models import GENRES
+
+# Project root and the MovieLens files shipped with the repo
+ROOT_DIR = Path(__file__).resolve().parent.parent
+DATA_DIR = ROOT_DIR / "data"
+
+# Size of the MovieLens 100K dataset, used as the 1x scale for synthetic data
+BASE_USERS = 943
+BASE_MOVIES = 1682
+BASE_RATINGS = 100_000
+
+
+def load_movielens():
+    """
+    Reads data/u.data and data/u.item into the same DataFrame shapes recommender.load_data returns.
+
+    Returns:
+        tuple: (ratings_df, movies_df)
+    """
+    movies = pd.read_csv(DATA_DIR / "u.item", sep="|", header=None,
+                         usecols=[0, 1, 2] + list(range(5, 24)),
+                         names=["movie_id", "title", "release_date", *GENRES])
+    ratings = pd.read_csv(DATA_DIR / "u.data", sep="\t", header=None, usecols=[0, 1, 2],
+                          names=["user_id", "movie_id", "rating"],
+                          dtype={"user_id": "int32", "movie_id": "int32", "rating": "float32"})
+    movies["movie_id"] = movies["movie_id"].astype("int32")
+    return ratings, movies
+
+
+def synthetic_data(scale=1, seed=0, users=None, movies=None, density=None):
+    """
+    Generates MovieLens-shaped ratings and movies at scale times the 100K dataset size.
+
+    Movie popularity follows a Zipf-like curve so that a few titles collect most ratings,
+    like the real data. users, movies and density override the scaled sizes; the number
+    of ratings drawn is density x users x movies, slightly fewer remain once repeated
+    (user, movie) pairs are dropped.
+
+    Returns:
+        tuple: (ratings_df, movies_df)
+    """
+    rng = np.random.default_rng(seed)
+    n_users = int(users or BASE_USERS * scale)
+    n_movies = int(movies or BASE_MOVIES * scale)
+    n_ratings = int(density * n_users * n_movies) if density else int(BASE_RATINGS * scale)
+
+    popularity = 1.0 / np.arange(1, n_movies + 1) ** 0.8
+    popularity /= popularity.sum()
+    movie_idx = rng.choice(n_movies, size=n_ratings, p=popularity)
+    user_idx = rng.integers(0, n_users, size=n_ratings)
+
+    # A user rates a movie at most once
+    pairs = np.unique(np.stack([user_idx, movie_idx], axis=1), axis=0)
+    ratings = pd.DataFrame({
+        "user_id": (pairs[:, 0] + 1).astype(np.int32),
+        "movie_id": (pairs[:, 1] + 1).astype(np.int32),
+        "rating": rng.integers(1, 6, size=len(pairs)).astype(np.float32),
+    })
+
+    movies = pd.DataFrame({
+        "movie_id": np.arange(1, n_movies + 1, dtype=np.int32),
+        "title": [f"movie {i}" for i in range(1, n_movies + 1)],
+        "release_date": "01-Jan-2000",
+    })
+    genre_flags = (rng.random((n_movies, len(GENRES))) < 0.1).astype(int)
+    for i, genre in enumerate(GENRES):
+        movies[genre] = genre_flags[:, i]
+    return ratings, movies
+
+
+def write_movielens_files(ratings, movies, directory):
+    """
+    Writes ratings and movies as u.data and u.item files in the MovieLens 100K format.
+
+    Returns:
+        tuple: (u.item path, u.data path)
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    item_path, data_path = directory / "u.item", directory / "u.data"
+
+    items = movies[["movie_id", "title", "release_date"]].copy()
+    items["video_release_date"] = ""
+    items["url"] = ""
+    items = pd.concat([items, movies[list(GENRES)]], axis=1)
+    items.to_csv(item_path, sep="|", header=False, index=False)
+
+    data = ratings[["user_id", "movie_id", "rating"]].copy()
+    data["rating"] = data["rating"].astype(int)
+    data["timestamp"] = ratings["timestamp"] if "timestamp" in ratings else 880000000
+    data.to_csv(data_path, sep="\t", header=False, index=False)
+    return item_path, data_path
+
+
+def peak_rss_mb():
+    """Returns the peak resident set size of this process in MB."""
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def current_rss_mb():
+    """Returns the current resident set size of this process in MB."""
+    with open("/proc/self/statm") as f:
+        pages = int(f.read().split()[1])
+    return pages * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+
+
+def pss_mb():
+    """
+    Returns the proportional set size of this process in MB.
+
+    Pages shared with other processes (for example a memory-mapped model) are divided
+    between them, so summing PSS over workers gives their real combined footprint.
+    """
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            if line.startswith("Pss:"):
+                return int(line.split()[1]) / 1024
+    return float("nan")
+
+
+def available_memory_bytes():
+    """Returns the physical memory available to new allocations."""
+    return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+
+
+def prepare_database(path=None, data_dir=None):
+    """
+    Creates a SQLite database loaded with the MovieLens data through sql_load.py.
+
+    An existing file at path is reused, without a path a fresh temporary file is used.
+    data_dir holds u.item and u.data files to load instead of the ones in data/.
+
+    Returns:
+        str: the DATABASE_URL of the database
+    """
+    path = Path(path or Path(tempfile.mkdtemp(prefix="movie_bench_")) / "movie_recommender.db")
+    url = f"sqlite:///{path}"
+    if not path.exists():
+        files = ["--movies", str(Path(data_dir) / "u.item"), "--ratings", str(Path(data_dir) / "u.data")] if data_dir else []
+        subprocess.run([sys.executable, "sql_load.py", *files], cwd=ROOT_DIR, check=True,
+                       env={**os.environ, "DATABASE_URL": url})
+    return url
+
+
+def run_metadata():
+    """Commit, machine and interpreter of a benchmark run, saved with its results."""
+    def git(*args):
+        result = subprocess.run(["git", *args], cwd=ROOT_DIR, capture_output=True, text=True)
+        return result.stdout.strip() if result.returncode == 0 else ""
+
+    return {
+        "commit": git("rev-parse", "HEAD"),
+        "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def _isolated_target(queue, fn, args, env):
+    os.environ.update(env)
+    queue.put(fn(*args))
+
+
+def run_isolated(fn, *args, env=None):
+    """
+    Runs fn(*args) in a fresh process so its peak RSS is not polluted by earlier runs.
+
+    fn must be a module-level function returning something picklable. env is applied to
+    os.environ before fn runs, so settings in myapp.config can differ per run.
+    """
+    ctx = mp.get_context("spawn")
+    queue = ctx.Queue()
+    process = ctx.Process(target=_isolated_target, args=(queue, fn, args, env or {}))
+    process.start()
+    while True:
+        try:
+            result = queue.get(timeout=1)
+            break
+        except Exception:
+            # Stop waiting if the child died before reporting a result
+            if not process.is_alive():
+                raise RuntimeError(f"{fn.__name__} failed in its benchmark process") from None
+    process.join()
+    return result
+
+
+def timed(fn, *args, **kwargs):
+    """Returns (result, elapsed seconds) for one call of fn."""
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def latency_summary(samples_s):
+    """Summarises latencies given in seconds as p50/p99/mean in milliseconds."""
+    samples_ms = np.asarray(samples_s) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(samples_ms, 50)), 4),
+        "p99_ms": round(float(np.percentile(samples_ms, 99)), 4),
+        "mean_ms": round(float(samples_ms.mean()), 4),
+    }
+
+
+def print_table(rows):
+    """Prints a list of dicts as an aligned text table."""
+    if not rows:
+        return
+    columns = list(dict.fromkeys(key for row in rows for key in row))
+    widths = {c: max(len(c), *(len(str(row.get(c, ""))) for row in rows)) for c in columns}
+    print("  ".join(c.ljust(widths[c]) for c in columns))
+    for row in rows:
+        print("  ".join(str(row.get(c, "")).ljust(widths[c]) for c in columns))
+
+
+def write_json(path, payload):
+    """Writes benchmark results to a JSON file if a path was given."""
+    if path:
+        with open(path, "w") as f:
+            json.dump(payload, f, indent=2)
@@ -0,0 +1,225 @@
+"""
+One-step benchmark suite: data ingest, model build, lookups and the API under load.
+
+Generates synthetic MovieLens-shaped data of the given shape (users, movies, rating density),
+loads it into a fresh SQLite database through sql_load.py and then measures, every step in a
+fresh process so its memory high-water mark is its own:
+- ingest: sql_load.py wall time, rows/s and peak RSS
+- load: recommender.load_data from the database
+- build: the dense create_similarity_matrix (skipped when it would not fit in memory), the
+  sparse create_neighbour_table and RecommenderIndex.build
+- lookup: p50/p99 of get_recommendations and RecommenderIndex.recommend
+- api: the FastAPI app in-process behind TestClient at each concurrency level, 80% /recommend/
+  and 20% /click_stats/ requests for random movies
+
+Results are written to JSON together with the commit they were measured on. --compare takes
+an earlier JSON file, prints every metric next to its old value and exits non-zero when one
+got worse by more than --threshold, so two commits can be compared on the same machine.
+
+Usage:
+    git checkout main && python -m benchmarks.suite --json main.json
+    git checkout my-branch && python -m benchmarks.suite --json branch.json --compare main.json
+"""
+import argparse
+import json
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks import common
+
+# Metrics compared by --compare; all others (sizes, counts) only describe the run
+LOWER_IS_BETTER = ("seconds", "p50_ms", "p99_ms", "peak_rss_mb")
+HIGHER_IS_BETTER = ("rows_per_s", "req_per_s")
+
+
+def _load(repeat):
+    from myapp import recommender
+
+    seconds = [common.timed(recommender.load_data)[1] for _ in range(repeat)]
+    return [{"name": "load_data", "seconds": round(statistics.median(seconds), 4),
+             "peak_rss_mb": round(common.peak_rss_mb(), 1)}]
+
+
+def _build(name):
+    from myapp import recommender
+
+    ratings, movies = recommender.load_data()
+    builds = {
+        "create_similarity_matrix": lambda: recommender.create_similarity_matrix(ratings),
+        "create_neighbour_table": lambda: recommender.create_neighbour_table(ratings),
+        "RecommenderIndex.build": lambda: recommender.RecommenderIndex.build(ratings, movies),
+    }
+    data_mb = common.peak_rss_mb()
+    _, seconds = common.timed(builds[name])
+    return [{"name": name, "seconds": round(seconds, 4), "peak_rss_mb": round(common.peak_rss_mb(), 1),
+             "data_rss_mb": round(data_mb, 1)}]
+
+
+def _lookup(queries, seed):
+    from myapp import recommender
+
+    ratings, movies = recommender.load_data()
+    table = recommender.create_neighbour_table(ratings)
+    index = recommender.RecommenderIndex.build(ratings, movies)
+    rng = np.random.default_rng(seed)
+    titles = [str(title) for title in rng.choice(movies["title"].to_numpy(), queries)]
+
+    results = []
+    for name, fn in [("get_recommendations", lambda title: recommender.get_recommendations(title, movies, table)),
+                     ("RecommenderIndex.recommend", index.recommend)]:
+        samples = []
+        for title in titles:
+            start = time.perf_counter()
+            fn(title)
+            samples.append(time.perf_counter() - start)
+        results.append({"name": name, "queries": queries, **common.latency_summary(samples)})
+    return results
+
+
+def _api(clients, duration, seed):
+    from fastapi.testclient import TestClient
+    from myapp import serving
+    from myapp.main import app
+
+    index = serving.current()
+    titles = [str(title) for title in index.titles]
+    movie_ids = [int(movie_id) for movie_id in index.movie_ids]
+
+    results = []
+    with TestClient(app) as client:
+        for n_clients in clients:
+            deadline = time.perf_counter() + duration
+
+            def worker(worker_seed):
+                rng = np.random.default_rng(worker_seed)
+                samples = []
+                while time.perf_counter() < deadline:
+                    start = time.perf_counter()
+                    if rng.random() < 0.2:
+                        client.get("/click_stats/", params={"movie_id": movie_ids[rng.integers(len(movie_ids))]})
+                    else:
+                        client.get("/recommend/", params={"movie": titles[rng.integers(len(titles))]})
+                    samples.append(time.perf_counter() - start)
+                return samples
+
+            with ThreadPoolExecutor(n_clients) as pool:
+                samples = [s for worker_samples in pool.map(worker, range(seed, seed + n_clients))
+                           for s in worker_samples]
+            results.append({
+                "name": f"api clients={n_clients}",
+                "requests": len(samples),
+                "req_per_s": round(len(samples) / duration, 1),
+                **common.latency_summary(samples),
+                "peak_rss_mb": round(common.peak_rss_mb(), 1),
+            })
+    return results
+
+
+def ingest(db_path, data_dir, rows):
+    """Loads the generated files with sql_load.py, timing it and reading its peak RSS."""
+    import resource
+
+    start = time.perf_counter()
+    url = common.prepare_database(db_path, data_dir)
+    seconds = time.perf_counter() - start
+    # The loader is the only child process waited for so far
+    peak_mb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    return url, [{"name": "sql_load.py", "rows": rows, "seconds": round(seconds, 3),
+                  "rows_per_s": round(rows / seconds), "peak_rss_mb": round(peak_mb, 1)}]
+
+
+def compare(results, baseline, threshold):
+    """
+    Prints every compared metric of results next to its value in baseline.
+
+    Returns:
+        list: descriptions of the metrics that got worse by more than threshold
+    """
+    old_rows = {(section, row["name"]): row for section, rows in baseline["results"].items() for row in rows}
+    table, regressions = [], []
+    for section, rows in results.items():
+        for row in rows:
+            old = old_rows.get((section, row["name"]))
+            if old is None:
+                continue
+            for metric in LOWER_IS_BETTER + HIGHER_IS_BETTER:
+                if not isinstance(row.get(metric), (int, float)) or not isinstance(old.get(metric), (int, float)):
+                    continue
+                change = (row[metric] - old[metric]) / old[metric] if old[metric] else 0.0
+                worse = change > threshold if metric in LOWER_IS_BETTER else change < -threshold
+                table.append({"section": section, "name": row["name"], "metric": metric, "old": old[metric],
+                              "new": row[metric], "change": f"{change:+.1%}", "regression": "yes" if worse else ""})
+                if worse:
+                    regressions.append(f"{section} / {row['name']} / {metric}: {old[metric]} -> {row[metric]}")
+    common.print_table(table)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=common.BASE_USERS)
+    parser.add_argument("--movies", type=int, default=common.BASE_MOVIES)
+    parser.add_argument("--density", type=float, default=common.BASE_RATINGS / (common.BASE_USERS * common.BASE_MOVIES),
+                        help="share of (user, movie) pairs rated, 0.063 in MovieLens 100K")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 8, 32], help="API concurrency levels")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per API concurrency level")
+    parser.add_argument("--queries", type=int, default=1000, help="lookups timed per lookup function")
+    parser.add_argument("--repeat", type=int, default=3, help="load_data runs, the median is reported")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--compare", help="results JSON of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="relative change of a metric counted as a regression")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="movie_suite_"))
+    ratings, movies = common.synthetic_data(seed=args.seed, users=args.users, movies=args.movies, density=args.density)
+    common.write_movielens_files(ratings, movies, workdir)
+    shape = {"users": args.users, "movies": args.movies, "density": args.density, "ratings": len(ratings)}
+    print(f"{shape['ratings']} ratings of {args.movies} movies by {args.users} users in {workdir}")
+    del ratings, movies
+
+    results = {}
+    url, results["ingest"] = ingest(workdir / "movie_recommender.db", workdir, shape["ratings"] + shape["movies"])
+    # The API builds its model from this database rather than a stored artifact
+    env = {"DATABASE_URL": url, "USE_MODEL_ARTIFACT": "0"}
+    results["load"] = common.run_isolated(_load, args.repeat, env=env)
+
+    results["build"] = []
+    for name in ["create_similarity_matrix", "create_neighbour_table", "RecommenderIndex.build"]:
+        # pivot table, similarity array and DataFrame copy are all N x N float64
+        if name == "create_similarity_matrix" and 3 * args.movies ** 2 * 8 > common.available_memory_bytes():
+            print(f"{name} skipped, it would not fit in memory")
+            continue
+        results["build"] += common.run_isolated(_build, name, env=env)
+
+    results["lookup"] = common.run_isolated(_lookup, args.queries, args.seed, env=env)
+    results["api"] = common.run_isolated(_api, args.clients, args.duration, args.seed, env=env)
+
+    for section, rows in results.items():
+        print(f"\n{section}")
+        common.print_table(rows)
+    common.write_json(args.json, {"meta": {**common.run_metadata(), **shape}, "results": results})
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"\ncompared with {baseline['meta'].get('commit', '')[:12]} from {baseline['meta'].get('date', '')}")
+        if any(baseline["meta"].get(key) != value for key, value in shape.items()):
+            print("warning: the baseline was run on data of another shape, "
+                  + ", ".join(f"{key}={baseline['meta'].get(key)}" for key in shape))
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} metrics worse by more than {args.threshold:.0%}:")
+            print("\n".join(regressions))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+# Imports
+import argparse
+from sqlalchemy import Integer, inspect, text
+from sqlalchemy.schema import CreateIndex, CreateTable
+from myapp import bulk_load
+from myapp.database import engine
+from myapp.models import Base, ClickStats, Movie, Rating
+
+'''
+Migrates a database created with string movie_id/user_id keys to integer keys.
+
+Also adds ratings.timestamp, replaces the single-column rating indexes with covering
+(movie_id, user_id, rating) and (user_id, movie_id, rating) indexes, and drops the unique
+constraint on click_stats.title. Back up the database before running it.
+
+Usage:
+    python migrate_db.py [--ratings ./data/u.data]
+'''
+
+# Old-schema tables and the columns copied from each, ids cast to integers
+COPY_COLUMNS = {
+    Movie: [c.name for c in Movie.__table__.columns],
+    Rating: ["user_id", "movie_id", "rating"],
+    ClickStats: [c.name for c in ClickStats.__table__.columns],
+}
+ID_COLUMNS = {"movie_id", "user_id"}
+
+
+def needs_migration():
+    # The old schema declared movies.movie_id as a string
+    columns = {c["name"]: c["type"] for c in inspect(engine).get_columns("movies")}
+    return not isinstance(columns["movie_id"], Integer)
+
+
+def _select_list(model):
+    return ", ".join(f"CAST({c} AS INTEGER)" if c in ID_COLUMNS else c for c in COPY_COLUMNS[model])
+
+
+def migrate_sqlite():
+    # SQLite cannot change a column type: rebuild each table and copy the rows, in one transaction
+    # Reflect before taking the write lock, the inspector uses its own connection
+    old_indexes = {model: [i["name"] for i in inspect(engine).get_indexes(model.__tablename__)] for model in COPY_COLUMNS}
+    raw = engine.raw_connection()
+    try:
+        raw.driver_connection.isolation_level = None  # manage BEGIN/COMMIT ourselves so the DDL is transactional
+        cursor = raw.cursor()
+        cursor.execute("BEGIN")
+        try:
+            for model in COPY_COLUMNS:
+                table = model.__tablename__
+                cursor.execute(f"ALTER TABLE {table} RENAME TO {table}_old")
+                # Index names stay taken after a rename, drop them before creating the new ones
+                for name in old_indexes[model]:
+                    cursor.execute(f"DROP INDEX IF EXISTS {name}")
+
+                cursor.execute(str(CreateTable(model.__table__).compile(dialect=engine.dialect)))
+                for index in model.__table__.indexes:
+                    cursor.execute(str(CreateIndex(index).compile(dialect=engine.dialect)))
+
+                columns = ", ".join(COPY_COLUMNS[model])
+                cursor.execute(f"INSERT INTO {table} ({columns}) SELECT {_select_list(model)} FROM {table}_old")
+                cursor.execute(f"DROP TABLE {table}_old")
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+    finally:
+        raw.close()
+
+
+def migrate_postgres():
+    # PostgreSQL changes the column types in place, DDL is transactional
+    statements = [
+        "ALTER TABLE movies ALTER COLUMN movie_id TYPE INTEGER USING movie_id::integer",
+        "ALTER TABLE ratings ALTER COLUMN user_id TYPE INTEGER USING user_id::integer, "
+        "ALTER COLUMN movie_id TYPE INTEGER USING movie_id::integer",
+        'ALTER TABLE ratings ADD COLUMN IF NOT EXISTS "timestamp" INTEGER DEFAULT 0',
+        "ALTER TABLE click_stats ALTER COLUMN movie_id TYPE INTEGER USING movie_id::integer",
+        "ALTER TABLE click_stats DROP CONSTRAINT IF EXISTS click_stats_title_key",
+        "DROP INDEX IF EXISTS ix_click_stats_movie_id",
+        "DROP INDEX IF EXISTS ix_movies_movie_id",
+        "DROP INDEX IF EXISTS ix_ratings_user_id",
+        "DROP INDEX IF EXISTS ix_ratings_movie_id",
+    ]
+    with engine.begin() as conn:
+        for statement in statements:
+            conn.execute(text(statement))
+        for index in Rating.__table__.indexes:
+            index.create(conn, checkfirst=True)
+
+
+def backfill_timestamps(ratings_path):
+    """Copies the timestamp column of a u.data file into the matching rating rows."""
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TEMP TABLE rating_timestamps "
+                          "(user_id INTEGER, movie_id INTEGER, ts INTEGER, PRIMARY KEY (user_id, movie_id))"))
+        for chunk in bulk_load.read_rating_chunks(ratings_path):
+            rows = chunk.rename(columns={"timestamp": "ts"})[["user_id", "movie_id", "ts"]].to_dict("records")
+            conn.execute(text("INSERT INTO rating_timestamps VALUES (:user_id, :movie_id, :ts)"), rows)
+        result = conn.execute(text(
+            'UPDATE ratings SET "timestamp" = (SELECT t.ts FROM rating_timestamps t '
+            "WHERE t.user_id = ratings.user_id AND t.movie_id = ratings.movie_id) "
+            "WHERE EXISTS (SELECT 1 FROM rating_timestamps t "
+            "WHERE t.user_id = ratings.user_id AND t.movie_id = ratings.movie_id)"))
+        conn.execute(text("DROP TABLE rating_timestamps"))
+    return result.rowcount
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Migrate the database to integer keys.")
+    parser.add_argument("--ratings", help="u.data file to copy rating timestamps from")
+    args = parser.parse_args(argv)
+
+    if needs_migration():
+        migrate_postgres() if engine.dialect.name == "postgresql" else migrate_sqlite()
+        print("Migrated to integer keys.")
+    else:
+        print("Already on integer keys.")
+    Base.metadata.create_all(bind=engine)
+
+    if args.ratings:
+        print(f"Timestamps copied to {backfill_timestamps(args.ratings)} ratings.")
+
+
+if __name__ == "__main__":
+    main()
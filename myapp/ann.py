@@ -0,0 +1,197 @@
+# Imports
+import numpy as np
+from scipy import sparse
+from myapp.recommender import DEFAULT_TOP_K, NeighbourTable, normalize_rows, top_n_columns, top_n_indices
+
+# Lists probed per query. More probes give better recall for more work
+DEFAULT_PROBES = 8
+# Dimensions of the random projection the lists are clustered on
+DEFAULT_DIM = 128
+# k-means iterations when building the lists
+DEFAULT_KMEANS_ITERATIONS = 10
+# Rows assigned to centroids per chunk, bounds the rows x lists score block
+ASSIGN_CHUNK = 8192
+
+
+def _unit_rows(vectors):
+    # Scale rows to unit length, all-zero rows stay zero
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+def _closest_lists(vectors, centroids, n):
+    # The n nearest centroids (largest dot products) of every row, a chunk of rows at a time
+    n = min(n, len(centroids))
+    lists = np.empty((len(vectors), n), dtype=np.int32)
+    for start in range(0, len(vectors), ASSIGN_CHUNK):
+        scores = vectors[start:start + ASSIGN_CHUNK] @ centroids.T
+        lists[start:start + ASSIGN_CHUNK] = np.argpartition(-scores, n - 1, axis=1)[:, :n]
+    return lists
+
+
+def _assign(vectors, centroids):
+    # Nearest centroid of every row
+    labels = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), ASSIGN_CHUNK):
+        labels[start:start + ASSIGN_CHUNK] = np.argmax(vectors[start:start + ASSIGN_CHUNK] @ centroids.T, axis=1)
+    return labels
+
+
+class IVFIndex:
+    """
+    Inverted-file index over the normalised movie vectors of a rating matrix.
+
+    Movies are grouped into lists by spherical k-means on a low-dimensional random projection
+    of their rating vectors. A query only scores the movies in its n_probe closest lists, and
+    scores them with the exact cosine on the original sparse vectors.
+    """
+
+    def __init__(self, normalized, projection, vectors, centroids):
+        """
+        Args:
+            normalized (csr_matrix): movie x user matrix with unit-length rows
+            projection (np.ndarray): user x dim random projection
+            vectors (np.ndarray): movie x dim projected rows, unit length
+            centroids (np.ndarray): list x dim unit-length centroids
+        """
+        self.normalized = normalized
+        self.projection = projection
+        self.vectors = vectors
+        self.centroids = centroids
+        self.labels = _assign(vectors, centroids)
+        # Rows grouped by list: list l holds list_rows[list_offsets[l]:list_offsets[l + 1]]
+        self.list_rows = np.argsort(self.labels, kind="stable").astype(np.int32)
+        self.list_offsets = np.searchsorted(self.labels[self.list_rows], np.arange(len(centroids) + 1)).astype(np.int64)
+
+    @classmethod
+    def build(cls, matrix, n_lists=None, dim=DEFAULT_DIM, iterations=DEFAULT_KMEANS_ITERATIONS, seed=0):
+        """
+        Clusters the rows of a movie x user rating matrix into n_lists lists.
+
+        Args:
+            matrix (csr_matrix): movie x user ratings
+            n_lists (int, optional): number of lists, defaults to sqrt(number of movies)
+            dim (int): dimensions of the random projection
+            iterations (int): k-means iterations
+            seed (int): seed of the projection and the initial centroids
+
+        Returns:
+            IVFIndex: the built index
+        """
+        normalized = normalize_rows(matrix.tocsr().astype(np.float32)).tocsr()
+        n_movies = normalized.shape[0]
+        n_lists = min(n_lists or max(1, int(np.sqrt(n_movies))), n_movies)
+
+        rng = np.random.default_rng(seed)
+        projection = (rng.standard_normal((normalized.shape[1], dim)) / np.sqrt(dim)).astype(np.float32)
+        vectors = _unit_rows(np.asarray(normalized @ projection, dtype=np.float32))
+
+        centroids = vectors[rng.choice(n_movies, n_lists, replace=False)]
+        for _ in range(iterations):
+            labels = _assign(vectors, centroids)
+            # Sum of the member vectors of every list in one sparse product
+            membership = sparse.csr_matrix((np.ones(n_movies, dtype=np.float32), (labels, np.arange(n_movies))),
+                                           shape=(n_lists, n_movies))
+            sums = np.asarray(membership @ vectors)
+            empty = np.bincount(labels, minlength=n_lists) == 0
+            sums[empty] = vectors[rng.choice(n_movies, int(empty.sum()))]
+            centroids = _unit_rows(sums)
+        return cls(normalized, projection, vectors, centroids)
+
+    def probes(self, rows, n_probe=DEFAULT_PROBES):
+        """The n_probe lists scored for every given row, always including the row's own list."""
+        probes = _closest_lists(self.vectors[rows], self.centroids, n_probe)
+        own = self.labels[rows]
+        missing = ~(probes == own[:, None]).any(axis=1)
+        probes[missing, -1] = own[missing]
+        return probes
+
+    def search_rows(self, rows, top_k=DEFAULT_TOP_K, n_probe=DEFAULT_PROBES):
+        """
+        Approximate top_k neighbours of the given movie rows.
+
+        Every row only scores the movies of its n_probe closest lists, with the exact cosine.
+        The work is grouped by list: each list is scored once against all rows probing it
+        and the results are merged into the rows' running top k.
+
+        Returns:
+            tuple: (neighbour rows int32, scores float32), both len(rows) x k, -1 / -inf
+            where fewer than k neighbours were found
+        """
+        rows = np.asarray(rows, dtype=np.int32)
+        k = max(min(top_k, self.normalized.shape[0] - 1), 0)
+        neighbours = np.full((len(rows), k), -1, dtype=np.int32)
+        scores = np.full((len(rows), k), -np.inf, dtype=np.float32)
+        if k == 0 or len(rows) == 0:
+            return neighbours, scores
+
+        # Invert the probes: positions (into rows) of the queries that probe each list
+        probes = self.probes(rows, n_probe)
+        flat = probes.ravel()
+        order = np.argsort(flat, kind="stable")
+        offsets = np.searchsorted(flat[order], np.arange(len(self.centroids) + 1))
+        query_of = np.repeat(np.arange(len(rows)), probes.shape[1])[order]
+
+        for l in range(len(self.centroids)):
+            members = self.list_rows[self.list_offsets[l]:self.list_offsets[l + 1]]
+            if len(members) == 0:
+                continue
+            sorted_members = np.sort(members)
+            for chunk_start in range(offsets[l], offsets[l + 1], ASSIGN_CHUNK):
+                queries = query_of[chunk_start:min(chunk_start + ASSIGN_CHUNK, offsets[l + 1])]
+                block = (self.normalized[rows[queries]] @ self.normalized[sorted_members].T).toarray()
+
+                # A movie is never its own neighbour
+                columns = np.minimum(np.searchsorted(sorted_members, rows[queries]), len(sorted_members) - 1)
+                is_self = sorted_members[columns] == rows[queries]
+                block[np.flatnonzero(is_self), columns[is_self]] = -np.inf
+
+                top = top_n_columns(block, k)
+                merged_rows = np.hstack([neighbours[queries], sorted_members[top]])
+                merged_scores = np.hstack([scores[queries], np.take_along_axis(block, top, axis=1)])
+                keep = top_n_columns(merged_scores, k)
+                neighbours[queries] = np.take_along_axis(merged_rows, keep, axis=1)
+                scores[queries] = np.take_along_axis(merged_scores, keep, axis=1)
+
+        neighbours[~np.isfinite(scores)] = -1
+        return neighbours, scores
+
+    def search(self, row, top_k=DEFAULT_TOP_K, n_probe=DEFAULT_PROBES):
+        """
+        Approximate top_k neighbours of one movie row.
+
+        Same result as search_rows for a single row, scored with one sparse product against
+        the members of all probed lists.
+
+        Returns:
+            tuple: (neighbour rows int32, scores float32), -1 / -inf where fewer were found
+        """
+        k = max(min(top_k, self.normalized.shape[0] - 1), 0)
+        lists = self.probes([row], n_probe)[0]
+        candidates = np.concatenate([self.list_rows[self.list_offsets[l]:self.list_offsets[l + 1]] for l in lists])
+        candidates = candidates[candidates != row]
+        block = np.full(max(len(candidates), k), -np.inf, dtype=np.float32)
+        block[:len(candidates)] = (self.normalized[candidates] @ self.normalized[row].T).toarray().ravel()
+        candidates = np.concatenate([candidates, np.full(len(block) - len(candidates), -1, dtype=np.int32)])
+
+        top = top_n_indices(block, k)
+        neighbours, scores = candidates[top].astype(np.int32), block[top]
+        neighbours[~np.isfinite(scores)] = -1
+        return neighbours, scores
+
+    def neighbour_table(self, movie_ids, top_k=DEFAULT_TOP_K, n_probe=DEFAULT_PROBES):
+        """Approximate NeighbourTable of every movie."""
+        neighbours, scores = self.search_rows(np.arange(self.normalized.shape[0]), top_k, n_probe)
+        return NeighbourTable(movie_ids=movie_ids, neighbours=neighbours, scores=scores)
+
+
+def ivf_neighbours(matrix, movie_ids, top_k=DEFAULT_TOP_K, n_lists=None, n_probe=None):
+    """Builds an IVFIndex on a movie x user rating matrix and returns its approximate NeighbourTable."""
+    return IVFIndex.build(matrix, n_lists).neighbour_table(movie_ids, top_k, n_probe or DEFAULT_PROBES)
+
+'''
+Python file with an approximate nearest-neighbour (IVF) index for large catalogs.
+
+The exact engine compares every movie with every other one, which is quadratic in the
+catalog size. The IVF index only compares movies that fall in nearby lists.
+'''
@@ -0,0 +1,257 @@
+# Imports
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from myapp import metrics
+from myapp import recommender
+
+logger = logging.getLogger(__name__)
+
+# Bump when the on-disk layout changes, older artifacts are then rejected
+FORMAT_VERSION = 4
+# File inside the model directory that names the version to serve
+CURRENT_POINTER = "current"
+# Arrays stored as .npy files so they can be memory-mapped
+ARRAYS = ("movie_ids", "titles", "neighbours", "scores", "user_ids", "matrix_data", "matrix_indices", "matrix_indptr")
+# Arrays written only when the index has them
+OPTIONAL_ARRAYS = ("genres",)
+
+
+class StaleArtifactError(ValueError):
+    """Raised by load_artifact for a version written in another FORMAT_VERSION."""
+
+
+def _format_version(version_dir):
+    # Format of a saved version, None when its manifest cannot be read
+    try:
+        return json.loads((Path(version_dir) / "manifest.json").read_text())["format_version"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def source_checksum(ratings, movies):
+    """
+    Returns a SHA-256 checksum of the rating rows and movie titles and genres a model is built from.
+
+    Rows are sorted first so the checksum does not depend on the order the database returns them in.
+    """
+    digest = hashlib.sha256()
+    ratings = ratings[["user_id", "movie_id", "rating"]].sort_values(["movie_id", "user_id"])
+    movies = movies[["movie_id", "title"] + [genre for genre in recommender.GENRES if genre in movies]].sort_values("movie_id")
+    for frame in (ratings, movies):
+        digest.update(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def current_version(model_dir):
+    """Returns the version the model directory currently points to, or None."""
+    pointer = Path(model_dir) / CURRENT_POINTER
+    if not pointer.exists():
+        return None
+    return pointer.read_text().strip() or None
+
+
+def save_artifact(index, model_dir, checksum, similarity="exact"):
+    """
+    Writes a RecommenderIndex to a new version directory and points 'current' at it.
+
+    Layout: <model_dir>/<version>/manifest.json plus one .npy file per entry of ARRAYS, and of
+    OPTIONAL_ARRAYS the index has. The rating matrix is stored as its three CSR arrays so the
+    model can be updated incrementally.
+
+    Returns:
+        str: the new version name
+    """
+    model_dir = Path(model_dir)
+    version = f"{time.strftime('%Y%m%d%H%M%S')}-{checksum[:12]}"
+    version_dir = model_dir / version
+    version_dir.mkdir(parents=True, exist_ok=True)
+
+    table = index.neighbour_table
+    arrays = {
+        "movie_ids": np.asarray(table.movie_ids),
+        # Fixed-width strings instead of an object array, object arrays cannot be memory-mapped
+        "titles": np.asarray(index.titles, dtype=str),
+        "neighbours": table.neighbours,
+        "scores": table.scores,
+        "user_ids": np.asarray(index.user_ids),
+        "matrix_data": index.matrix.data,
+        "matrix_indices": index.matrix.indices,
+        "matrix_indptr": index.matrix.indptr,
+    }
+    if index.genres is not None:
+        arrays["genres"] = np.asarray(index.genres, dtype=np.uint8)
+    for name, array in arrays.items():
+        np.save(version_dir / f"{name}.npy", array)
+
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "version": version,
+        "source_checksum": checksum,
+        "movies": len(table.movie_ids),
+        "top_k": table.neighbours.shape[1],
+        "similarity": similarity,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+    (version_dir / "manifest.json").write_text(json.dumps(manifest, indent=2))
+
+    # Swap the pointer atomically so readers never see a half-written version
+    tmp_pointer = model_dir / f".{CURRENT_POINTER}.tmp"
+    tmp_pointer.write_text(version)
+    os.replace(tmp_pointer, model_dir / CURRENT_POINTER)
+    return version
+
+
+@metrics.span("model.load_artifact")
+def load_artifact(model_dir, version=None):
+    """
+    Memory-maps a saved model and wraps it in a RecommenderIndex.
+
+    The arrays are opened read-only with mmap, so every worker process serving the same
+    version shares one copy of the pages through the OS page cache.
+
+    Args:
+        model_dir (str): directory passed to save_artifact
+        version (str, optional): version to load. Defaults to the current one.
+
+    Returns:
+        tuple: (RecommenderIndex, manifest dict)
+
+    Raises:
+        StaleArtifactError: if the version was written in another FORMAT_VERSION
+    """
+    version = version or current_version(model_dir)
+    if version is None:
+        raise FileNotFoundError(f"No model artifact in {model_dir}")
+    version_dir = Path(model_dir) / version
+
+    manifest = json.loads((version_dir / "manifest.json").read_text())
+    if manifest["format_version"] != FORMAT_VERSION:
+        raise StaleArtifactError(f"Model {version} has format {manifest['format_version']}, expected {FORMAT_VERSION}")
+
+    arrays = {name: np.load(version_dir / f"{name}.npy", mmap_mode="r") for name in ARRAYS}
+    arrays.update({name: np.load(version_dir / f"{name}.npy", mmap_mode="r")
+                   for name in OPTIONAL_ARRAYS if (version_dir / f"{name}.npy").exists()})
+    table = recommender.NeighbourTable(
+        movie_ids=arrays["movie_ids"], neighbours=arrays["neighbours"], scores=arrays["scores"])
+    matrix = sparse.csr_matrix(
+        (arrays["matrix_data"], arrays["matrix_indices"], arrays["matrix_indptr"]),
+        shape=(len(arrays["movie_ids"]), len(arrays["user_ids"])))
+    index = recommender.RecommenderIndex(table, arrays["titles"], matrix, arrays["user_ids"], arrays.get("genres"))
+    return index, manifest
+
+
+def prune_versions(model_dir, keep):
+    """
+    Deletes all but the newest keep version directories, and every version written in another
+    FORMAT_VERSION, which no worker can load. The current version is always kept.
+
+    Workers that still have a deleted version memory-mapped keep reading it until they swap,
+    the files are only freed once the last mapping is closed.
+
+    Returns:
+        list: the deleted version names
+    """
+    model_dir = Path(model_dir)
+    current = current_version(model_dir)
+    # Version names start with their build time, so name order is age order
+    versions = sorted(path.name for path in model_dir.iterdir() if (path / "manifest.json").exists())
+    deleted = set(versions[:-keep]) if keep > 0 else set()
+    deleted |= {version for version in versions if _format_version(model_dir / version) != FORMAT_VERSION}
+    deleted = sorted(deleted - {current})
+    for version in deleted:
+        shutil.rmtree(model_dir / version)
+    return deleted
+
+
+def build(model_dir, top_k=recommender.DEFAULT_TOP_K, force=False, similarity="exact", n_lists=None, n_probe=None,
+          block_size=recommender.DEFAULT_BLOCK_SIZE, workers=1):
+    """
+    Loads the data from the database, builds the model and saves it as a new version.
+
+    The build is skipped when the current version was built from identical data with the same
+    similarity engine, unless force is set. similarity, n_lists, n_probe, block_size and workers
+    are passed to RecommenderIndex.build.
+
+    Returns:
+        str: the version being served after the call
+    """
+    ratings, movies = recommender.load_data()
+    checksum = source_checksum(ratings, movies)
+
+    current = current_version(model_dir)
+    if current and not force:
+        manifest = json.loads((Path(model_dir) / current / "manifest.json").read_text())
+        if (manifest["source_checksum"] == checksum and manifest["format_version"] == FORMAT_VERSION
+                and manifest.get("similarity", "exact") == similarity):
+            print(f"Model {current} is up to date.")
+            return current
+
+    index = recommender.RecommenderIndex.build(ratings, movies, top_k=top_k, block_size=block_size, similarity=similarity,
+                                               n_lists=n_lists, n_probe=n_probe, workers=workers)
+    version = save_artifact(index, model_dir, checksum, similarity)
+    print(f"Model {version} written to {model_dir}.")
+    return version
+
+
+def build_every(interval, model_dir, keep=0, **build_args):
+    """
+    Runs build every interval seconds until interrupted, pruning old versions after each new one.
+
+    Each run picks up the ratings added since the last one; unchanged data is skipped by the
+    checksum test in build. Serving workers notice the new version through ModelWatcher. A
+    failed build is logged and retried at the next interval.
+    """
+    version = current_version(model_dir)
+    while True:
+        try:
+            new_version = build(model_dir, **build_args)
+            if new_version != version and keep:
+                prune_versions(model_dir, keep)
+            version = new_version
+        except Exception:
+            logger.exception("Model build failed")
+        time.sleep(interval)
+
+
+# Command line: python -m myapp.artifact build
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build and persist the recommender model.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="build the model from the database and save it")
+    build_parser.add_argument("--model-dir", default=None, help="defaults to MODEL_DIR")
+    build_parser.add_argument("--top-k", type=int, default=recommender.DEFAULT_TOP_K)
+    build_parser.add_argument("--force", action="store_true", help="rebuild even if the data did not change")
+    build_parser.add_argument("--similarity", choices=["exact", "ivf"], default=None, help="defaults to SIMILARITY_INDEX")
+    build_parser.add_argument("--workers", type=int, default=None, help="build processes, defaults to SIMILARITY_WORKERS")
+    build_parser.add_argument("--block-size", type=int, default=None, help="movies per block, defaults to SIMILARITY_BLOCK_SIZE")
+    build_parser.add_argument("--every", type=float, default=None,
+                              help="keep running and rebuild every this many seconds, defaults to MODEL_REBUILD_INTERVAL (0 builds once)")
+    build_parser.add_argument("--keep", type=int, default=None, help="versions kept on disk, defaults to MODEL_KEEP_VERSIONS")
+    args = parser.parse_args()
+
+    from myapp import config
+    logging.basicConfig(level=logging.INFO)
+    model_dir = args.model_dir or config.MODEL_DIR
+    build_args = dict(top_k=args.top_k, similarity=args.similarity or config.SIMILARITY_INDEX,
+                      n_lists=config.IVF_LISTS or None, n_probe=config.IVF_PROBES,
+                      block_size=args.block_size or config.SIMILARITY_BLOCK_SIZE,
+                      workers=args.workers or config.SIMILARITY_WORKERS)
+    keep = config.MODEL_KEEP_VERSIONS if args.keep is None else args.keep
+    every = config.MODEL_REBUILD_INTERVAL if args.every is None else args.every
+    if every > 0:
+        # --force applies to the first build only, later ones rebuild when the data changed
+        build(model_dir, force=args.force, **build_args)
+        prune_versions(model_dir, keep)
+        build_every(every, model_dir, keep, **build_args)
+    else:
+        build(model_dir, force=args.force, **build_args)
+        prune_versions(model_dir, keep)
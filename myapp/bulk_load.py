@@ -0,0 +1,127 @@
+# Imports
+import io
+import time
+import pandas as pd
+from sqlalchemy.dialects import sqlite
+from myapp.models import Movie, Rating
+
+# Rows read from the source file and written per transaction
+CHUNK_SIZE = 50_000
+
+# SQLite settings used only while loading: no fsync per transaction, journal and temp data in memory
+SQLITE_LOAD_PRAGMAS = {
+    "synchronous": "OFF",
+    "journal_mode": "MEMORY",
+    "temp_store": "MEMORY",
+    "cache_size": "-200000",  # negative means KiB, about 200 MB
+}
+
+# MovieLens u.item columns kept in the movies table
+MOVIE_COLUMNS = ['movie_id', 'title', 'release_date','unknown', 'action', 'adventure', 'animation', 'children',
+                 'comedy', 'crime', 'documentary', 'drama', 'fantasy','filmnoir', 'horror', 'musical','mystery',
+                 'romance', 'scifi', 'thriller', 'war', 'western']
+MOVIE_USECOLS = [0,1,2,5,6,7,8,9,10,11,12,13,14,15,16,17,18,19,20,21,22,23]
+RATING_COLUMNS = ["user_id", "movie_id", "rating", "timestamp"]
+
+
+def read_movie_chunks(path, chunk_size=CHUNK_SIZE):
+    """Yields the movies of a u.item file as DataFrames of at most chunk_size rows."""
+    for chunk in pd.read_csv(path, sep="|", header=None, usecols=MOVIE_USECOLS, names=MOVIE_COLUMNS,
+                             chunksize=chunk_size):
+        chunk["release_date"] = chunk["release_date"].fillna("")
+        yield chunk
+
+
+def read_rating_chunks(path, chunk_size=CHUNK_SIZE):
+    """Yields the ratings of a u.data file as DataFrames of at most chunk_size rows."""
+    for chunk in pd.read_csv(path, sep="\t", header=None, usecols=[0,1,2,3], names=RATING_COLUMNS,
+                             chunksize=chunk_size):
+        chunk["rating"] = chunk["rating"].astype(float)
+        yield chunk
+
+
+def _sqlite_pragmas(conn, pragmas):
+    # Apply pragmas and return the previous values so they can be restored
+    previous = {}
+    for name, value in pragmas.items():
+        previous[name] = conn.exec_driver_sql(f"PRAGMA {name}").scalar()
+        conn.exec_driver_sql(f"PRAGMA {name} = {value}")
+    conn.commit()
+    return previous
+
+
+def _insert_sqlite(conn, model, chunk):
+    # executemany of one INSERT; rows already present are skipped so a restarted load does not duplicate them
+    stmt = sqlite.insert(model.__table__).on_conflict_do_nothing()
+    conn.execute(stmt, chunk.to_dict("records"))
+
+
+def _insert_postgres(conn, model, chunk):
+    # COPY the chunk into a temporary staging table, then move the rows that are not there yet
+    table = model.__tablename__
+    columns = ", ".join(chunk.columns)
+    buffer = io.StringIO()
+    chunk.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute(f"CREATE TEMP TABLE IF NOT EXISTS staging_{table} "
+                       f"(LIKE {table} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS")
+        cursor.copy_expert(f"COPY staging_{table} ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+        cursor.execute(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM staging_{table} "
+                       f"ON CONFLICT DO NOTHING")
+    finally:
+        cursor.close()
+
+
+def _sync_sequence_postgres(conn, model):
+    # Rows are loaded with their ids, move the serial sequence past them so that ids the
+    # database allocates later (/add_movie/, /movies/bulk) do not collide
+    column = model.__table__.autoincrement_column
+    if column is None:
+        return
+    table = model.__tablename__
+    conn.exec_driver_sql(f"SELECT setval(pg_get_serial_sequence('{table}', '{column.name}'), "
+                         f"COALESCE((SELECT MAX({column.name}) FROM {table}), 0) + 1, false)")
+
+
+def load_table(engine, model, chunks):
+    """
+    Streams DataFrame chunks into the table of model, one transaction per chunk.
+
+    SQLite gets executemany Core inserts with SQLITE_LOAD_PRAGMAS applied for the duration of
+    the load, PostgreSQL gets COPY FROM STDIN and its id sequence moved past the loaded ids. Memory is bounded by the chunk size and rows
+    that already exist are skipped, so the load can be restarted.
+
+    Returns:
+        tuple: (rows read, seconds taken)
+    """
+    dialect = engine.dialect.name
+    insert = _insert_postgres if dialect == "postgresql" else _insert_sqlite
+    start = time.perf_counter()
+    rows = 0
+    with engine.connect() as conn:
+        previous = _sqlite_pragmas(conn, SQLITE_LOAD_PRAGMAS) if dialect == "sqlite" else {}
+        try:
+            for chunk in chunks:
+                with conn.begin():
+                    insert(conn, model, chunk)
+                rows += len(chunk)
+            if dialect == "postgresql":
+                with conn.begin():
+                    _sync_sequence_postgres(conn, model)
+        finally:
+            if previous:
+                _sqlite_pragmas(conn, previous)
+    return rows, time.perf_counter() - start
+
+
+def load_movies(engine, path, chunk_size=CHUNK_SIZE):
+    """Streams a u.item file into the movies table. Returns (rows, seconds)."""
+    return load_table(engine, Movie, read_movie_chunks(path, chunk_size))
+
+
+def load_ratings(engine, path, chunk_size=CHUNK_SIZE):
+    """Streams a u.data file into the ratings table. Returns (rows, seconds)."""
+    return load_table(engine, Rating, read_rating_chunks(path, chunk_size))
@@ -0,0 +1,158 @@
+# Imports
+import logging
+import threading
+from collections import Counter
+from sqlalchemy.dialects import postgresql, sqlite
+from myapp import metrics
+from myapp.models import ClickStats
+
+logger = logging.getLogger(__name__)
+
+# Rows per INSERT statement, keeps SQLite under its bound-parameter limit
+UPSERT_BATCH_ROWS = 500
+
+
+def impression_upserts(dialect_name, counts, titles):
+    """
+    Builds the INSERT ... ON CONFLICT (movie_id) DO UPDATE statements that add impression
+    counts to ClickStats.recommendations_shown, on SQLite and PostgreSQL.
+
+    Args:
+        dialect_name (str): "sqlite" or "postgresql"
+        counts (dict): movie_id -> number of times it was recommended
+        titles (dict): movie_id -> title, used when the row does not exist yet
+
+    Returns:
+        list: statements to execute in one transaction
+    """
+    return click_stats_upserts(dialect_name, counts, {}, titles)
+
+
+def click_stats_upserts(dialect_name, shown, clicks, titles):
+    """
+    Builds the upserts that add impression and click counts to ClickStats in one statement per
+    UPSERT_BATCH_ROWS movies.
+
+    Args:
+        dialect_name (str): "sqlite" or "postgresql"
+        shown (dict): movie_id -> recommendations_shown increment
+        clicks (dict): movie_id -> clicks increment
+        titles (dict): movie_id -> title, used when the row does not exist yet
+
+    Returns:
+        list: statements to execute in one transaction
+    """
+    insert = postgresql.insert if dialect_name == "postgresql" else sqlite.insert
+    rows = [
+        {"movie_id": movie_id, "title": titles.get(movie_id, ""), "recommendations_shown": shown.get(movie_id, 0),
+         "clicks": clicks.get(movie_id, 0)}
+        for movie_id in {**shown, **clicks}
+    ]
+    statements = []
+    for start in range(0, len(rows), UPSERT_BATCH_ROWS):
+        stmt = insert(ClickStats).values(rows[start:start + UPSERT_BATCH_ROWS])
+        set_ = {"recommendations_shown": ClickStats.recommendations_shown + stmt.excluded.recommendations_shown}
+        if clicks:
+            set_["clicks"] = ClickStats.clicks + stmt.excluded.clicks
+        statements.append(stmt.on_conflict_do_update(index_elements=[ClickStats.movie_id], set_=set_))
+    return statements
+
+
+def upsert_impressions(conn, counts, titles):
+    """
+    Adds impression counts to ClickStats.recommendations_shown with bulk upserts.
+
+    The caller owns the transaction.
+
+    Args:
+        conn: SQLAlchemy connection or session
+        counts (dict): movie_id -> number of times it was recommended
+        titles (dict): movie_id -> title, used when the row does not exist yet
+    """
+    # Connections expose the dialect directly, sessions through their bind
+    dialect = conn.dialect if hasattr(conn, "dialect") else conn.get_bind().dialect
+    for stmt in impression_upserts(dialect.name, counts, titles):
+        conn.execute(stmt)
+
+
+class ImpressionBuffer:
+    """
+    In-process aggregator for recommendations_shown increments.
+
+    Increments are summed in memory and written by a background thread in one bulk upsert
+    every flush_interval seconds, or sooner once flush_size increments are pending.
+    Call stop() on shutdown to flush whatever is left.
+    """
+
+    def __init__(self, engine, flush_interval=1.0, flush_size=1000):
+        self.engine = engine
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self._lock = threading.Lock()
+        self._counts = Counter()
+        self._titles = {}
+        self._pending = 0
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def add(self, recommendations):
+        """Counts one impression for every (movie_id, title) pair."""
+        with self._lock:
+            for movie_id, title in recommendations:
+                self._counts[movie_id] += 1
+                self._titles[movie_id] = title
+                self._pending += 1
+            full = self._pending >= self.flush_size
+        if full:
+            self._wakeup.set()
+
+    def flush(self):
+        """
+        Writes all pending increments in one transaction.
+
+        Returns:
+            int: number of increments written
+        """
+        with self._lock:
+            counts, titles, pending = self._counts, self._titles, self._pending
+            self._counts, self._titles, self._pending = Counter(), {}, 0
+        if not counts:
+            return 0
+
+        try:
+            with metrics.span("db.flush.impressions"), self.engine.begin() as conn:
+                upsert_impressions(conn, counts, titles)
+        except Exception:
+            # Put the counts back so the next flush retries them
+            with self._lock:
+                self._counts.update(counts)
+                self._titles = {**titles, **self._titles}
+                self._pending += pending
+            raise
+        metrics.IMPRESSIONS_FLUSHED.inc(pending)
+        return pending
+
+    def start(self):
+        """Starts the background flush thread."""
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="impression-flush", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the background thread and flushes the remaining counts."""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Failed to flush impression counts")
@@ -0,0 +1,118 @@
+import os
+
+def _flag(name, default):
+    # Boolean environment variable: 1/true/yes/on enable it
+    return os.getenv(name, default).strip().lower() in ("1", "true", "yes", "on")
+
+# Database connection string (SQLite by default, PostgreSQL works too)
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///movie_recommender.db")
+
+# Serve /recommend/, /click/, /click_stats/ and /add_movie/ with async handlers on an async engine
+# (aiosqlite for SQLite, asyncpg for PostgreSQL)
+DB_ASYNC = _flag("DB_ASYNC", "0")
+# Connections kept open in the pool, and extra connections allowed under load
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+# Milliseconds a SQLite connection waits for a lock before failing with "database is locked"
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+# Buffer recommendations_shown increments in memory and write them in bulk
+IMPRESSION_BUFFER = _flag("IMPRESSION_BUFFER", "1")
+# Seconds between two flushes of the impression buffer
+IMPRESSION_FLUSH_INTERVAL = float(os.getenv("IMPRESSION_FLUSH_INTERVAL", "1.0"))
+# Number of pending increments that triggers a flush before the interval is up
+IMPRESSION_FLUSH_SIZE = int(os.getenv("IMPRESSION_FLUSH_SIZE", "1000"))
+
+# Ratings and new movies are folded into the served model by a background thread in one
+# update per MODEL_UPDATE_INTERVAL seconds, or sooner once MODEL_UPDATE_SIZE ratings are pending
+MODEL_UPDATE_INTERVAL = float(os.getenv("MODEL_UPDATE_INTERVAL", "0.5"))
+MODEL_UPDATE_SIZE = int(os.getenv("MODEL_UPDATE_SIZE", "1000"))
+
+# Cached /recommend/ results: most entries kept (0 disables) and seconds before they expire.
+# Model updates drop the cache regardless of the TTL
+RECOMMEND_CACHE_SIZE = int(os.getenv("RECOMMEND_CACHE_SIZE", "10000"))
+RECOMMEND_CACHE_TTL = float(os.getenv("RECOMMEND_CACHE_TTL", "300"))
+# Cached /click_stats/ counters, also sent to clients as the Cache-Control max-age
+CLICK_STATS_CACHE_SIZE = int(os.getenv("CLICK_STATS_CACHE_SIZE", "10000"))
+CLICK_STATS_CACHE_TTL = float(os.getenv("CLICK_STATS_CACHE_TTL", "2"))
+
+# Log ratings, impressions and clicks to an append-only event log in EVENT_DIR instead of
+# writing each one to the database; a rollup folds them into click_stats and ratings
+EVENT_LOG = _flag("EVENT_LOG", "0")
+EVENT_DIR = os.getenv("EVENT_DIR", "events")
+# Size at which a new segment file is started
+EVENT_SEGMENT_BYTES = int(os.getenv("EVENT_SEGMENT_BYTES", str(64 * 1024 ** 2)))
+# Seconds between two writes of the logged events, and pending events that trigger a write sooner
+EVENT_FLUSH_INTERVAL = float(os.getenv("EVENT_FLUSH_INTERVAL", "0.2"))
+EVENT_FLUSH_SIZE = int(os.getenv("EVENT_FLUSH_SIZE", "10000"))
+# Seconds between two rollups in the API process (0 leaves them to `python -m myapp.events rollup`),
+# and most events folded in one rollup transaction
+EVENT_ROLLUP_INTERVAL = float(os.getenv("EVENT_ROLLUP_INTERVAL", "5"))
+EVENT_ROLLUP_BATCH = int(os.getenv("EVENT_ROLLUP_BATCH", "1000000"))
+# Seconds between two replays of the rolled up events in every worker, see EventFollower
+EVENT_FOLLOW_INTERVAL = float(os.getenv("EVENT_FOLLOW_INTERVAL", "1.0"))
+# Seconds a rolled up segment is kept after its last write before it is deleted (0 keeps them all)
+EVENT_RETENTION = float(os.getenv("EVENT_RETENTION", "86400"))
+
+# Movies /movies/bulk inserts per transaction
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "1000"))
+
+# Per-request cProfile dumps: requests sending the header "X-Profile: <PROFILE_TOKEN>" are profiled
+# (an empty token disables the header), plus a random PROFILE_SAMPLE_RATE share of all requests.
+# Dumps are written to PROFILE_DIR
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+# Directory holding the persisted model versions built with `python -m myapp.artifact build`
+MODEL_DIR = os.getenv("MODEL_DIR", "models")
+# Serve the persisted model when one exists instead of building it at startup
+USE_MODEL_ARTIFACT = _flag("USE_MODEL_ARTIFACT", "1")
+# Seconds between two checks for a new model version, which is then swapped in without a restart
+# (0 disables; SIGUSR1 triggers a check at once)
+MODEL_POLL_INTERVAL = float(os.getenv("MODEL_POLL_INTERVAL", "2"))
+# Seconds between two scheduled rebuilds of `python -m myapp.artifact build` (0 builds once),
+# and versions kept on disk afterwards (0 keeps all)
+MODEL_REBUILD_INTERVAL = float(os.getenv("MODEL_REBUILD_INTERVAL", "0"))
+MODEL_KEEP_VERSIONS = int(os.getenv("MODEL_KEEP_VERSIONS", "3"))
+
+# Engine building the neighbour table: "exact" cosine over all pairs, or "ivf" approximate index
+SIMILARITY_INDEX = os.getenv("SIMILARITY_INDEX", "exact").strip().lower()
+# Processes building the exact neighbour table (1 builds in the API process) and movies per block.
+# A worker holds a block_size x movies similarity block at a time
+SIMILARITY_WORKERS = int(os.getenv("SIMILARITY_WORKERS", "1"))
+SIMILARITY_BLOCK_SIZE = int(os.getenv("SIMILARITY_BLOCK_SIZE", "512"))
+# IVF lists (0 picks sqrt(number of movies)) and lists probed per movie
+IVF_LISTS = int(os.getenv("IVF_LISTS", "0"))
+IVF_PROBES = int(os.getenv("IVF_PROBES", "8"))
+
+# Resolve titles /recommend/ does not know to the closest title (typos, case, punctuation, articles)
+FUZZY_TITLES = _flag("FUZZY_TITLES", "1")
+
+# Share of genre similarity in the /recommend/ scores (0 is purely collaborative), and the number
+# of ratings below which a seed movie shifts towards its genres, so new movies get useful results
+CONTENT_WEIGHT = float(os.getenv("CONTENT_WEIGHT", "0.0"))
+COLD_START_RATINGS = int(os.getenv("COLD_START_RATINGS", "10"))
+
+# Re-ranking of the /recommend/ candidates, all off at 0: MMR trade-off between relevance and
+# genre diversity (0 to 1), weight of the popularity penalty and of the click-rate boost. The
+# reranker picks top_n out of top_n * RERANK_POOL_FACTOR candidates
+RERANK_DIVERSITY = float(os.getenv("RERANK_DIVERSITY", "0"))
+RERANK_POPULARITY = float(os.getenv("RERANK_POPULARITY", "0"))
+RERANK_CTR = float(os.getenv("RERANK_CTR", "0"))
+RERANK_POOL_FACTOR = int(os.getenv("RERANK_POOL_FACTOR", "5"))
+# Seconds between two reloads of the click_stats snapshot behind the click-rate boost, and the
+# virtual impressions at the global click rate every movie starts with
+CTR_SNAPSHOT_INTERVAL = float(os.getenv("CTR_SNAPSHOT_INTERVAL", "30"))
+CTR_PRIOR_SHOWN = float(os.getenv("CTR_PRIOR_SHOWN", "20"))
+
+# Train the factorization model behind /recommend/user/{user_id} at startup and on every model
+# swap; new ratings are folded in with the model updates in between
+USER_MODEL = _flag("USER_MODEL", "1")
+# Latent factors and ALS iterations of that model
+ALS_FACTORS = int(os.getenv("ALS_FACTORS", "16"))
+ALS_ITERATIONS = int(os.getenv("ALS_ITERATIONS", "10"))
+
+'''
+Python file with the settings read from environment variables
+'''
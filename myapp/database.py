@@ -1,19 +1,61 @@
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
+from myapp.config import DATABASE_URL, DB_ASYNC, DB_MAX_OVERFLOW, DB_POOL_SIZE, SQLITE_BUSY_TIMEOUT_MS
 
-# Update the DATABASE_URL with your actual SQLite credentials
-DATABASE_URL = "sqlite:///movie_recommender.db"
+# DATABASE_URL is read from the environment (defaults to the local SQLite file), see config.py
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
 
-# Create the engine for sqlite
+# Create the engine
 engine = create_engine(
     DATABASE_URL,
-    connect_args= {"check_same_thread": False} #It allows multiple threads to use the same database connection, which SQLite does not allow by default.
+    # It allows multiple threads to use the same database connection, which SQLite does not allow by default.
+    connect_args={"check_same_thread": False} if IS_SQLITE else {},
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_pre_ping=not IS_SQLITE,
     )
 
 # Create the local session
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+
+def _sqlite_on_connect(dbapi_connection, connection_record):
+    # WAL lets readers run while a click is being written, busy_timeout makes writers wait instead of failing
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+if IS_SQLITE:
+    event.listen(engine, "connect", _sqlite_on_connect)
+
+
+def async_database_url(url):
+    # Same database, async driver
+    if url.startswith("sqlite:"):
+        return url.replace("sqlite:", "sqlite+aiosqlite:", 1)
+    if url.startswith(("postgresql:", "postgresql+psycopg2:")):
+        return "postgresql+asyncpg:" + url.split(":", 1)[1]
+    return url
+
+# Async engine and session, only created in async mode so aiosqlite/asyncpg stay optional otherwise
+async_engine = None
+AsyncSessionLocal = None
+if DB_ASYNC:
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    async_engine = create_async_engine(
+        async_database_url(DATABASE_URL),
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_pre_ping=not IS_SQLITE,
+        )
+    if IS_SQLITE:
+        event.listen(async_engine.sync_engine, "connect", _sqlite_on_connect)
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 '''
 Python file to create database connection and session
-'''
\ No newline at end of file
+'''
@@ -0,0 +1,259 @@
+# Imports
+import argparse
+import json
+import logging
+import multiprocessing as mp
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from myapp import bulk_load
+from myapp import recommender
+from myapp import reranking
+
+logger = logging.getLogger(__name__)
+
+# MovieLens files shipped with the repo
+DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+# Held-out ratings at or above this count as movies the user liked
+LIKE_THRESHOLD = 4.0
+
+
+def read_movielens(data_dir=DATA_DIR):
+    """
+    Reads u.data and u.item straight from the files, no database involved.
+
+    Returns:
+        tuple: (ratings_df with user_id, movie_id, rating and timestamp, movies_df)
+    """
+    data_dir = Path(data_dir)
+    ratings = pd.concat(bulk_load.read_rating_chunks(data_dir / "u.data"), ignore_index=True)
+    movies = pd.concat(bulk_load.read_movie_chunks(data_dir / "u.item"), ignore_index=True)
+    return ratings, movies
+
+
+def split_by_user(ratings, folds=5, test_share=0.2, seed=0):
+    """
+    User folds: every user belongs to one fold, and a fold holds out test_share of its users'
+    ratings. Everything else, the other users and the rest of the fold's users, is training.
+
+    Returns:
+        list: (train_df, test_df) per fold
+    """
+    rng = np.random.default_rng(seed)
+    users = rng.permutation(ratings["user_id"].unique())
+    user_fold = pd.Series(np.arange(len(users)) % folds, index=users)
+    fold_of_rating = user_fold.reindex(ratings["user_id"]).to_numpy()
+    held_out = rng.random(len(ratings)) < test_share
+    splits = []
+    for fold in range(folds):
+        test = (fold_of_rating == fold) & held_out
+        splits.append((ratings[~test].reset_index(drop=True), ratings[test].reset_index(drop=True)))
+    return splits
+
+
+def split_by_time(ratings, folds=5, test_share=0.2):
+    """
+    Time folds: the latest test_share of the ratings is cut into folds consecutive windows, and
+    each fold trains on every rating before its window and tests on the window, as if the model
+    had been rebuilt at that moment.
+
+    Returns:
+        list: (train_df, test_df) per fold
+    """
+    ordered = ratings.sort_values("timestamp", kind="stable").reset_index(drop=True)
+    bounds = np.linspace(len(ordered) * (1 - test_share), len(ordered), folds + 1).astype(int)
+    return [(ordered[:start], ordered[start:stop]) for start, stop in zip(bounds[:-1], bounds[1:])]
+
+
+def ndcg(hits, n_relevant, k):
+    """NDCG@k of one list with binary relevance, hits being the 0/1 flags of its ranks."""
+    discounts = 1.0 / np.log2(np.arange(2, k + 2))
+    ideal = discounts[:min(n_relevant, k)].sum()
+    return float(np.dot(hits, discounts[:len(hits)]) / ideal) if ideal > 0 else 0.0
+
+
+def evaluate_fold(fold, train, test, movies, k=10, n_seeds=3, like_threshold=LIKE_THRESHOLD,
+                  build_args=None, recommend_args=None, rerank_args=None):
+    """
+    Builds the model on train and scores its seed-movie recommendations against test.
+
+    Every test user is one query per seed: the user's n_seeds most recent liked training movies,
+    each asking for k recommendations as /recommend/ would, leaving out what the user rated in
+    training. A query hits when one of its k movies is among the user's liked held-out movies,
+    NDCG@k ranks those hits. Liked held-out movies the model never saw still count as relevant.
+
+    Args:
+        fold (int): fold number, reported back
+        train (DataFrame): ratings the model is built from
+        test (DataFrame): held-out ratings
+        movies (DataFrame): titles and genres
+        k (int): recommendations per query
+        n_seeds (int): queries per test user
+        like_threshold (float): lowest rating counted as liked
+        build_args (dict, optional): keyword arguments of RecommenderIndex.build
+        recommend_args (dict, optional): content_weight and cold_start_ratings of recommend_batch
+        rerank_args (dict, optional): keyword arguments of reranking.make_reranker
+
+    Returns:
+        dict: quality metrics and timings of the fold
+    """
+    start = time.perf_counter()
+    index = recommender.RecommenderIndex.build(train, movies, **(build_args or {}))
+    build_s = time.perf_counter() - start
+    reranker = reranking.make_reranker(**(rerank_args or {}))
+
+    # Training rows of every user, most recent last, and the liked held-out movie ids
+    train = train.assign(row=pd.Index(index.movie_ids).get_indexer(train["movie_id"]))
+    train = train.sort_values(["user_id", "timestamp"], kind="stable")
+    train_rows = dict(tuple(train.groupby("user_id")["row"]))
+    liked_rows = dict(tuple(train[train["rating"] >= like_threshold].groupby("user_id")["row"]))
+    liked_test = test[test["rating"] >= like_threshold].groupby("user_id")["movie_id"]
+
+    hits, gains, shown, users, query_s = [], [], set(), 0, 0.0
+    for user_id, relevant in liked_test:
+        seeds = liked_rows.get(user_id)
+        if seeds is None:
+            continue
+        relevant = set(relevant.tolist())
+        query_start = time.perf_counter()
+        recs = index.recommend_batch(seeds.to_numpy()[-n_seeds:], k, train_rows[user_id].to_numpy(),
+                                     reranker=reranker, **(recommend_args or {}))
+        query_s += time.perf_counter() - query_start
+        users += 1
+        for seed_recs in recs:
+            flags = np.array([movie_id in relevant for movie_id, _ in seed_recs], dtype=float)
+            hits.append(flags.any())
+            gains.append(ndcg(flags, len(relevant), k))
+            shown.update(movie_id for movie_id, _ in seed_recs)
+
+    return {
+        "fold": fold,
+        "train_ratings": len(train),
+        "test_ratings": len(test),
+        "users": users,
+        "queries": len(hits),
+        f"hit_rate@{k}": round(float(np.mean(hits)), 4) if hits else None,
+        f"ndcg@{k}": round(float(np.mean(gains)), 4) if gains else None,
+        "coverage": round(len(shown) / max(1, int(index.has_title.sum())), 4),
+        "build_s": round(build_s, 3),
+        "query_s": round(query_s, 3),
+        # Mean time of one query, the seeds of a user are scored in one recommend_batch call
+        "query_ms": round(query_s / len(hits) * 1000, 4) if hits else None,
+    }
+
+
+def evaluate(ratings, movies, split="user", folds=5, test_share=0.2, workers=None, seed=0, **fold_args):
+    """
+    Cross-validates the recommender on the ratings, one fold per process.
+
+    Args:
+        ratings (DataFrame): ratings with a timestamp column
+        movies (DataFrame): titles and genres
+        split (str): "user" (see split_by_user) or "time" (see split_by_time)
+        folds (int): number of folds
+        test_share (float): share of a fold's users' ratings held out (user split), or of all
+            ratings, the latest, spread over the folds (time split)
+        workers (int, optional): processes, defaults to one per fold up to the CPU count
+        seed (int): random seed of the user split
+        **fold_args: passed on to evaluate_fold
+
+    Returns:
+        dict: the report, with every fold's metrics and their mean
+    """
+    if split == "user":
+        splits = split_by_user(ratings, folds, test_share, seed)
+    elif split == "time":
+        splits = split_by_time(ratings, folds, test_share)
+    else:
+        raise ValueError(f"Unknown split: {split}")
+    workers = workers or min(folds, os.cpu_count() or 1)
+
+    start = time.perf_counter()
+    tasks = [(fold, train, test, movies) for fold, (train, test) in enumerate(splits)]
+    if workers <= 1:
+        results = [evaluate_fold(*task, **fold_args) for task in tasks]
+    else:
+        # Workers fork from a forkserver that imported the recommender once, as in myapp.parallel.
+        # Not this module: run with -m, the workers run it again as their main module
+        context = mp.get_context("forkserver")
+        context.set_forkserver_preload([recommender.__name__, reranking.__name__])
+        with ProcessPoolExecutor(workers, mp_context=context) as pool:
+            futures = [pool.submit(evaluate_fold, *task, **fold_args) for task in tasks]
+            results = [future.result() for future in futures]
+    seconds = time.perf_counter() - start
+
+    # Folds without a test query report None for their quality metrics and are left out of the mean
+    mean = {}
+    for key in results[0]:
+        values = [result[key] for result in results if result[key] is not None]
+        if key != "fold" and values:
+            mean[key] = round(float(np.mean(values)), 4)
+    return {
+        "split": split,
+        "folds": folds,
+        "test_share": test_share,
+        "workers": workers,
+        "ratings": len(ratings),
+        "users": int(ratings["user_id"].nunique()),
+        "movies": int(ratings["movie_id"].nunique()),
+        "settings": fold_args,
+        "results": results,
+        "mean": mean,
+        "seconds": round(seconds, 3),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cross-validate the recommender offline on the MovieLens files.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run_parser = subparsers.add_parser("run", help="evaluate every fold and print the report as JSON")
+    run_parser.add_argument("--data-dir", default=str(DATA_DIR), help="directory with u.data and u.item")
+    run_parser.add_argument("--split", choices=["user", "time"], default="user")
+    run_parser.add_argument("--folds", type=int, default=5)
+    run_parser.add_argument("--test-share", type=float, default=0.2, help="share of ratings held out, see evaluate")
+    run_parser.add_argument("--k", type=int, default=10, help="recommendations per query")
+    run_parser.add_argument("--seeds", type=int, default=3, help="liked training movies queried per test user")
+    run_parser.add_argument("--like-threshold", type=float, default=LIKE_THRESHOLD)
+    run_parser.add_argument("--top-k", type=int, default=recommender.DEFAULT_TOP_K)
+    run_parser.add_argument("--similarity", choices=["exact", "ivf"], default=None, help="defaults to SIMILARITY_INDEX")
+    run_parser.add_argument("--content-weight", type=float, default=None, help="defaults to CONTENT_WEIGHT")
+    run_parser.add_argument("--cold-start-ratings", type=int, default=None, help="defaults to COLD_START_RATINGS")
+    run_parser.add_argument("--diversity", type=float, default=None, help="defaults to RERANK_DIVERSITY")
+    run_parser.add_argument("--popularity", type=float, default=None, help="defaults to RERANK_POPULARITY")
+    run_parser.add_argument("--workers", type=int, default=None, help="processes, defaults to one per fold")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--output", default=None, help="write the report to this file instead of stdout")
+    args = parser.parse_args()
+
+    # Run through the imported module, so the folds sent to the pool pickle as myapp.evaluation functions
+    from myapp import config, evaluation
+    logging.basicConfig(level=logging.INFO)
+
+    def setting(value, default):
+        return default if value is None else value
+
+    ratings, movies = read_movielens(args.data_dir)
+    # The click-rate boost needs live click_stats, offline only the other stages apply
+    report = evaluation.evaluate(
+        ratings, movies, args.split, args.folds, args.test_share, args.workers, args.seed,
+        k=args.k, n_seeds=args.seeds, like_threshold=args.like_threshold,
+        build_args={"top_k": args.top_k, "similarity": setting(args.similarity, config.SIMILARITY_INDEX),
+                    "n_lists": config.IVF_LISTS or None, "n_probe": config.IVF_PROBES},
+        recommend_args={"content_weight": setting(args.content_weight, config.CONTENT_WEIGHT),
+                        "cold_start_ratings": setting(args.cold_start_ratings, config.COLD_START_RATINGS)},
+        rerank_args={"diversity": setting(args.diversity, config.RERANK_DIVERSITY),
+                     "popularity": setting(args.popularity, config.RERANK_POPULARITY),
+                     "pool_factor": config.RERANK_POOL_FACTOR})
+    logger.info("Evaluated %d folds in %.2f s", args.folds, report["seconds"])
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+'''
+Python file with the offline cross-validation of the recommender on the MovieLens files
+'''
@@ -0,0 +1,527 @@
+# Imports
+import argparse
+import fcntl
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from sqlalchemy import delete, select
+from sqlalchemy.dialects import postgresql, sqlite
+from myapp import metrics
+from myapp.clickstats import click_stats_upserts
+from myapp.models import EventOffset, Movie, Rating
+
+logger = logging.getLogger(__name__)
+
+# Event kinds
+RATING = 1
+IMPRESSION = 2
+CLICK = 3
+KIND_NAMES = {RATING: "rating", IMPRESSION: "impression", CLICK: "click"}
+# user_id of impressions and clicks, which the API does not attribute to a user
+NO_USER = -1
+
+# One packed, fixed-width record per event, so a segment is read back with a single np.fromfile
+EVENT_DTYPE = np.dtype([("time", "<f8"), ("kind", "u1"), ("user_id", "<i4"), ("movie_id", "<i4"), ("value", "<f4")])
+# Segment files are named <creation time in ns>-<pid>.events, so name order is creation order
+SEGMENT_SUFFIX = ".events"
+# Taken by a rollup run, so runs from several workers or processes never overlap
+ROLLUP_LOCK = ".rollup.lock"
+# Rows per ratings upsert statement, keeps SQLite under its bound-parameter limit
+UPSERT_BATCH_ROWS = 500
+
+
+class EventLog:
+    """
+    Append-only log of ratings, impressions and clicks in rotating segment files.
+
+    append() only adds the records to an in-memory list; a background thread writes everything
+    pending with one write() every flush_interval seconds, or sooner once flush_size events are
+    pending. Every process writes its own segments, so workers need no locking, and a new
+    segment is started once the current one reaches segment_bytes. Segments are never
+    rewritten: the rollup remembers how far it has read each one, and prune_segments deletes
+    them once they are rolled up. Call stop() on shutdown to write whatever is left.
+    """
+
+    def __init__(self, directory, segment_bytes=64 * 1024 ** 2, flush_interval=0.2, flush_size=10_000):
+        self.directory = Path(directory)
+        self.segment_bytes = segment_bytes
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self._lock = threading.Lock()
+        self._pending = []
+        self._pending_events = 0
+        # Serialises writes and rotation of the open segment
+        self._write_lock = threading.Lock()
+        self._fd = None
+        self._segment_size = 0
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def append(self, kind, movie_ids, user_id=NO_USER, values=0.0, at=None):
+        """
+        Logs one event of the given kind per movie id.
+
+        Args:
+            kind (int): RATING, IMPRESSION or CLICK
+            movie_ids (list): movie of every event
+            user_id (int): user of the events
+            values (float or list): the rating, unused for impressions and clicks
+            at (float, optional): Unix time of the events, defaults to now
+        """
+        records = np.empty(len(movie_ids), dtype=EVENT_DTYPE)
+        records["time"] = time.time() if at is None else at
+        records["kind"] = kind
+        records["user_id"] = user_id
+        records["movie_id"] = movie_ids
+        records["value"] = values
+        with self._lock:
+            self._pending.append(records)
+            self._pending_events += len(records)
+            full = self._pending_events >= self.flush_size
+        if full:
+            self._wakeup.set()
+
+    def flush(self):
+        """
+        Writes all pending events to the current segment.
+
+        Returns:
+            int: number of events written
+        """
+        with self._lock:
+            pending, self._pending, self._pending_events = self._pending, [], 0
+        if not pending:
+            return 0
+        records = np.concatenate(pending)
+        try:
+            with self._write_lock:
+                if self._fd is None or self._segment_size >= self.segment_bytes:
+                    self._rotate()
+                data = memoryview(records.tobytes())
+                while data:
+                    written = os.write(self._fd, data)
+                    data = data[written:]
+                    self._segment_size += written
+        except Exception:
+            # Keep the events for the next flush
+            with self._lock:
+                self._pending.insert(0, records)
+                self._pending_events += len(records)
+            raise
+        kinds, counts = np.unique(records["kind"], return_counts=True)
+        for kind, count in zip(kinds, counts):
+            metrics.EVENTS_LOGGED.inc(int(count), KIND_NAMES[int(kind)])
+        return len(records)
+
+    def _rotate(self):
+        if self._fd is not None:
+            os.close(self._fd)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"{time.time_ns():020d}-{os.getpid()}{SEGMENT_SUFFIX}"
+        self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self._segment_size = 0
+
+    def start(self):
+        """Starts the background write thread."""
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="event-log", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the background thread, writes the remaining events and closes the segment."""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        with self._write_lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Failed to write events")
+
+
+def segments(directory):
+    """Returns the segment files of an event log, oldest first."""
+    directory = Path(directory)
+    return sorted(directory.glob(f"*{SEGMENT_SUFFIX}")) if directory.exists() else []
+
+
+def read_segment(path, start=0, limit=None):
+    """
+    Reads the complete records of a segment from record number start on.
+
+    A record still being written at the end of the file is left for the next read.
+
+    Returns:
+        ndarray: EVENT_DTYPE records
+    """
+    available = os.path.getsize(path) // EVENT_DTYPE.itemsize - start
+    count = available if limit is None else min(available, limit)
+    if count <= 0:
+        return np.empty(0, dtype=EVENT_DTYPE)
+    return np.fromfile(path, dtype=EVENT_DTYPE, count=count, offset=start * EVENT_DTYPE.itemsize)
+
+
+def read_events(directory, kinds=None, since=None, until=None):
+    """
+    Returns the logged events of the given kinds in the time window [since, until), as a DataFrame.
+
+    Meant for analyses over time, e.g. the click-through rate per day:
+        events = read_events("events", [IMPRESSION, CLICK])
+        events.groupby([events["time"].dt.date, "kind"]).size()
+    """
+    frames = []
+    for path in segments(directory):
+        records = read_segment(path)
+        keep = np.ones(len(records), dtype=bool)
+        if kinds is not None:
+            keep &= np.isin(records["kind"], list(kinds))
+        if since is not None:
+            keep &= records["time"] >= since
+        if until is not None:
+            keep &= records["time"] < until
+        frames.append(pd.DataFrame(records[keep]))
+    events = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(np.empty(0, dtype=EVENT_DTYPE))
+    events["time"] = pd.to_datetime(events["time"], unit="s")
+    return events.sort_values("time", kind="stable", ignore_index=True)
+
+
+@contextmanager
+def _rollup_lock(directory):
+    # Exclusive lock on a file in the log directory, held across processes for one rollup run
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    with open(directory / ROLLUP_LOCK, "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def upsert_ratings(conn, ratings):
+    """Inserts or overwrites user_id, movie_id, rating, timestamp rows of a DataFrame in ratings."""
+    insert = postgresql.insert if conn.dialect.name == "postgresql" else sqlite.insert
+    rows = ratings.to_dict("records")
+    for start in range(0, len(rows), UPSERT_BATCH_ROWS):
+        stmt = insert(Rating).values(rows[start:start + UPSERT_BATCH_ROWS])
+        conn.execute(stmt.on_conflict_do_update(
+            index_elements=[Rating.user_id, Rating.movie_id],
+            set_={"rating": stmt.excluded.rating, "timestamp": stmt.excluded.timestamp}))
+
+
+def _titles(conn, movie_ids):
+    # movie_id -> title of the given movies, queried UPSERT_BATCH_ROWS ids at a time
+    titles = {}
+    for start in range(0, len(movie_ids), UPSERT_BATCH_ROWS):
+        chunk = movie_ids[start:start + UPSERT_BATCH_ROWS]
+        titles.update(conn.execute(select(Movie.movie_id, Movie.title).where(Movie.movie_id.in_(chunk))).all())
+    return titles
+
+
+def ratings_frame(events):
+    """The rating events as user_id, movie_id, rating, timestamp rows, the latest one per (user, movie)."""
+    ratings = events[events["kind"] == RATING]
+    ratings = ratings[np.argsort(ratings["time"], kind="stable")]
+    frame = pd.DataFrame({
+        "user_id": ratings["user_id"].astype(np.int32),
+        "movie_id": ratings["movie_id"].astype(np.int32),
+        "rating": ratings["value"].astype(np.float32),
+        "timestamp": ratings["time"].astype(np.int64),
+    })
+    return frame.drop_duplicates(["user_id", "movie_id"], keep="last").reset_index(drop=True)
+
+
+@metrics.span("events.rollup")
+def rollup(engine, directory, max_events=1_000_000):
+    """
+    Folds the events logged since the last run into click_stats and ratings.
+
+    Every movie's impressions and clicks are summed into one click_stats upsert, and the
+    latest rating per (user, movie) is upserted into ratings, so each table row is written at
+    most once per run however many events it got. The number of records read from every
+    segment is stored in event_offsets in the same transaction, so a run that fails changes
+    nothing and the next run starts where the last successful one stopped. Runs take a lock
+    file in the log directory, so concurrent runs from several workers do not overlap.
+
+    Args:
+        engine (Engine): sync engine of the database
+        directory (str): directory of the event log
+        max_events (int): most events folded in one run, the rest is left for the next
+
+    Returns:
+        ndarray: the EVENT_DTYPE records folded in by this run
+    """
+    with _rollup_lock(directory), engine.begin() as conn:
+        offsets = _offsets(conn)
+        chunks, new_offsets = [], {}
+        budget = max_events
+        for path in segments(directory):
+            if budget <= 0:
+                break
+            start = offsets.get(path.name, 0)
+            records = read_segment(path, start, budget)
+            if len(records):
+                chunks.append(records)
+                new_offsets[path.name] = start + len(records)
+                budget -= len(records)
+        if not chunks:
+            return np.empty(0, dtype=EVENT_DTYPE)
+        events = np.concatenate(chunks)
+
+        shown = dict(zip(*np.unique(events["movie_id"][events["kind"] == IMPRESSION], return_counts=True)))
+        clicks = dict(zip(*np.unique(events["movie_id"][events["kind"] == CLICK], return_counts=True)))
+        shown = {int(movie_id): int(count) for movie_id, count in shown.items()}
+        clicks = {int(movie_id): int(count) for movie_id, count in clicks.items()}
+        if shown or clicks:
+            titles = _titles(conn, sorted({**shown, **clicks}))
+            for stmt in click_stats_upserts(conn.dialect.name, shown, clicks, titles):
+                conn.execute(stmt)
+        ratings = ratings_frame(events)
+        if len(ratings):
+            upsert_ratings(conn, ratings)
+
+        insert = postgresql.insert if conn.dialect.name == "postgresql" else sqlite.insert
+        stmt = insert(EventOffset).values([{"segment": name, "records": records} for name, records in new_offsets.items()])
+        conn.execute(stmt.on_conflict_do_update(index_elements=[EventOffset.segment],
+                                                set_={"records": stmt.excluded.records}))
+
+    metrics.ROLLUP_LAG.observe(time.time() - float(events["time"].min()))
+    kinds, counts = np.unique(events["kind"], return_counts=True)
+    for kind, count in zip(kinds, counts):
+        metrics.EVENTS_ROLLED_UP.inc(int(count), KIND_NAMES[int(kind)])
+    return events
+
+
+def _offsets(conn):
+    # segment -> records rolled up, the event_offsets table is created on first use
+    EventOffset.__table__.create(conn, checkfirst=True)
+    return dict(conn.execute(select(EventOffset.segment, EventOffset.records)).all())
+
+
+def _sealed(pid, newer_pids):
+    # A segment no writer appends to any more: its process started a newer one or is gone
+    if pid in newer_pids:
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    return False
+
+
+def prune_segments(engine, directory, retention):
+    """
+    Deletes the segments every event of which is rolled up, with their event_offsets rows.
+
+    A segment is deleted once the rollup has read all of it, its writer has moved on to a newer
+    segment or exited, and it was last written more than retention seconds ago. The grace period
+    lets the EventFollower of every worker replay it first, and keeps it for read_events.
+
+    Args:
+        engine (Engine): sync engine of the database
+        directory (str): directory of the event log
+        retention (float): seconds a rolled up segment is kept
+
+    Returns:
+        int: number of segments deleted
+    """
+    with _rollup_lock(directory):
+        with engine.connect() as conn:
+            offsets = _offsets(conn)
+        paths = segments(directory)
+        # Names sort by creation time, so a pid seen later has started a newer segment
+        newer_pids, sealed = set(), []
+        for path in reversed(paths):
+            pid = int(path.stem.rsplit("-", 1)[1])
+            if _sealed(pid, newer_pids):
+                sealed.append(path)
+            newer_pids.add(pid)
+
+        deleted = 0
+        cutoff = time.time() - retention
+        for path in sealed:
+            stat = path.stat()
+            if stat.st_mtime < cutoff and offsets.get(path.name, -1) * EVENT_DTYPE.itemsize >= stat.st_size:
+                path.unlink()
+                deleted += 1
+        # Files go first: an offset row without its file is harmless, a file without its row
+        # would be rolled up again from the start
+        present = {path.name for path in segments(directory)}
+        gone = [name for name in offsets if name not in present]
+        if gone:
+            with engine.begin() as conn:
+                for start in range(0, len(gone), UPSERT_BATCH_ROWS):
+                    conn.execute(delete(EventOffset).where(EventOffset.segment.in_(gone[start:start + UPSERT_BATCH_ROWS])))
+    return deleted
+
+
+class EventFollower:
+    """
+    Replays the events the rollup committed, in every process that serves a model.
+
+    Only one process runs a given rollup, so instead of acting on its own runs every worker
+    polls event_offsets every interval seconds and reads back the records between where it
+    stopped and where the rollup stopped, calling on_events with them (e.g. to fold the ratings
+    into its model). sync() sets the starting point to what is already rolled up; call it
+    before loading the model from the database.
+    """
+
+    def __init__(self, engine, directory, interval=1.0, on_events=None):
+        self.engine = engine
+        self.directory = Path(directory)
+        self.interval = interval
+        self.on_events = on_events
+        self._positions = None
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def sync(self):
+        """Skips to the committed offsets, the events up to there are already in the database."""
+        with self.engine.connect() as conn:
+            self._positions = _offsets(conn)
+
+    def poll(self):
+        """
+        Replays the events rolled up since the last poll and calls on_events.
+
+        Returns:
+            ndarray: the EVENT_DTYPE records replayed
+        """
+        with self.engine.connect() as conn:
+            committed = _offsets(conn)
+        if self._positions is None:
+            self._positions = committed
+        chunks = []
+        for name, records in sorted(committed.items()):
+            start = self._positions.get(name, 0)
+            if records <= start:
+                continue
+            path = self.directory / name
+            if not path.exists():
+                logger.warning("Segment %s was pruned before it was replayed, %d events skipped", name, records - start)
+                continue
+            chunks.append(read_segment(path, start, records - start))
+        self._positions = committed
+        events = np.concatenate(chunks) if chunks else np.empty(0, dtype=EVENT_DTYPE)
+        if len(events) and self.on_events is not None:
+            self.on_events(events)
+        return events
+
+    def start(self):
+        """Starts the background polling thread."""
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="event-follower", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the background thread after a last poll."""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.poll()
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            try:
+                self.poll()
+            except Exception:
+                logger.exception("Failed to replay rolled up events")
+
+
+class RollupJob:
+    """
+    Background thread running rollup every interval seconds.
+
+    on_rollup, if given, is called with the records of every run that folded any in. With
+    retention above 0, rolled up segments older than that many seconds are pruned after every
+    run, see prune_segments. stop() runs a last rollup.
+    """
+
+    def __init__(self, engine, directory, interval=5.0, max_events=1_000_000, on_rollup=None, retention=0):
+        self.engine = engine
+        self.directory = directory
+        self.interval = interval
+        self.max_events = max_events
+        self.on_rollup = on_rollup
+        self.retention = retention
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def run_once(self):
+        """Runs one rollup and calls on_rollup. Returns the number of events folded in."""
+        events = rollup(self.engine, self.directory, self.max_events)
+        if len(events) and self.on_rollup is not None:
+            self.on_rollup(events)
+        if self.retention > 0:
+            prune_segments(self.engine, self.directory, self.retention)
+        return len(events)
+
+    def start(self):
+        """Starts the background thread."""
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="event-rollup", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the background thread after a last rollup."""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.run_once()
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            try:
+                # A full batch means more is waiting, go again without sleeping
+                while self.run_once() >= self.max_events and not self._stopping.is_set():
+                    pass
+            except Exception:
+                logger.exception("Event rollup failed")
+
+
+# Command line: python -m myapp.events rollup
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fold the event log into click_stats and ratings.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    rollup_parser = subparsers.add_parser("rollup", help="fold the events logged since the last run")
+    rollup_parser.add_argument("--event-dir", default=None, help="defaults to EVENT_DIR")
+    rollup_parser.add_argument("--every", type=float, default=0, help="keep running, every this many seconds")
+    args = parser.parse_args()
+
+    from myapp import config
+    from myapp.database import engine
+    logging.basicConfig(level=logging.INFO)
+    job = RollupJob(engine, args.event_dir or config.EVENT_DIR, args.every, config.EVENT_ROLLUP_BATCH,
+                    retention=config.EVENT_RETENTION)
+    while True:
+        while (folded := job.run_once()) >= job.max_events:
+            print(f"Folded {folded} events.")
+        print(f"Folded {folded} events.")
+        if args.every <= 0:
+            break
+        time.sleep(args.every)
+
+'''
+Python file with the append-only event log of ratings, impressions and clicks, and its rollup.
+'''
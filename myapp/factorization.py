@@ -0,0 +1,191 @@
+# Imports
+import numpy as np
+import pandas as pd
+from myapp import metrics
+from myapp.recommender import top_n_indices
+
+# Latent factors per user and per movie
+DEFAULT_FACTORS = 16
+# L2 penalty on the factors
+DEFAULT_REGULARIZATION = 0.1
+# Confidence of a rating is 1 + alpha * rating
+DEFAULT_ALPHA = 1.0
+# Alternating user/movie solves
+DEFAULT_ITERATIONS = 10
+# Memory budget for the Gram matrices solved in one chunk
+GRAM_CHUNK_BYTES = 32 * 1024 * 1024
+
+
+def _solve_side(weights, fixed, regularization):
+    """
+    Solves the factors of every row of weights with the other side held fixed.
+
+    Implicit-feedback ALS: every rated cell has preference 1 and confidence 1 + weight, unrated
+    cells have preference 0 and confidence 1. Row u solves
+    (Y^T Y + sum_i w_ui y_i y_i^T + reg I) x_u = sum_i (1 + w_ui) y_i.
+
+    Args:
+        weights (csr_matrix): rows x cols, alpha * rating for every rated cell
+        fixed (np.ndarray): cols x factors, the factors held fixed
+        regularization (float): L2 penalty
+
+    Returns:
+        np.ndarray: rows x factors float32
+    """
+    n_rows = weights.shape[0]
+    n_factors = fixed.shape[1]
+    gram = fixed.T @ fixed + regularization * np.eye(n_factors, dtype=np.float32)
+
+    # Right-hand sides for all rows in one sparse product
+    confidence = weights.copy()
+    confidence.data = confidence.data + 1
+    rhs = np.asarray(confidence @ fixed, dtype=np.float32)
+
+    # sum_i w_ui y_i y_i^T for all rows is the sparse weights times every column's flattened
+    # outer product y_i y_i^T, done in chunks of rows to bound the dense result
+    outer = (fixed[:, :, None] * fixed[:, None, :]).reshape(len(fixed), -1)
+    chunk_rows = max(1, GRAM_CHUNK_BYTES // (n_factors * n_factors * 4))
+    result = np.empty((n_rows, n_factors), dtype=np.float32)
+    for start in range(0, n_rows, chunk_rows):
+        stop = min(start + chunk_rows, n_rows)
+        extra = np.asarray(weights[start:stop] @ outer, dtype=np.float32).reshape(-1, n_factors, n_factors)
+        result[start:stop] = np.linalg.solve(gram + extra, rhs[start:stop, :, None])[:, :, 0]
+    return result
+
+
+def train_als(ratings, factors=DEFAULT_FACTORS, regularization=DEFAULT_REGULARIZATION,
+              alpha=DEFAULT_ALPHA, iterations=DEFAULT_ITERATIONS, seed=0):
+    """
+    Factorizes a user x movie rating matrix with implicit-feedback ALS.
+
+    Args:
+        ratings (csr_matrix): user x movie ratings, 0 where unrated
+        factors (int): latent dimensions
+        regularization (float): L2 penalty
+        alpha (float): confidence gained per rating point
+        iterations (int): alternating user/movie solves
+        seed (int): seed of the random initial factors
+
+    Returns:
+        tuple: (user_factors, item_factors) float32 arrays
+    """
+    weights = ratings.tocsr().astype(np.float32)
+    weights.data *= alpha
+    weights_t = weights.T.tocsr()
+
+    rng = np.random.default_rng(seed)
+    user_factors = np.zeros((weights.shape[0], factors), dtype=np.float32)
+    item_factors = (rng.standard_normal((weights.shape[1], factors)) * 0.01).astype(np.float32)
+    for _ in range(iterations):
+        user_factors = _solve_side(weights, item_factors, regularization)
+        item_factors = _solve_side(weights_t, user_factors, regularization)
+    return user_factors, item_factors
+
+
+class UserRecommender:
+    """
+    Personalized recommendations from a factorization of the rating matrix.
+
+    Rows of item_factors line up with movie_ids/titles, rows of user_factors with user_ids.
+    rated keeps every user's rated movies so they can be left out of the results.
+    regularization and alpha are the training settings, reused by fold_in.
+    """
+
+    def __init__(self, user_ids, movie_ids, titles, user_factors, item_factors, rated,
+                 regularization=DEFAULT_REGULARIZATION, alpha=DEFAULT_ALPHA):
+        self.user_ids = user_ids
+        self.movie_ids = movie_ids
+        self.titles = titles
+        self.user_factors = user_factors
+        self.item_factors = item_factors
+        self.rated = rated
+        self.regularization = regularization
+        self.alpha = alpha
+        self.user_to_row = {int(user_id): row for row, user_id in enumerate(user_ids)}
+        # Movies without a title cannot be shown, they are left out before the top-n pass
+        self.untitled = np.array([not title for title in titles], dtype=bool)
+
+    @classmethod
+    @metrics.span("user_model.build")
+    def from_index(cls, index, **params):
+        """
+        Trains on the rating matrix held by a RecommenderIndex.
+
+        Args:
+            index (RecommenderIndex): index built with its movie x user matrix
+            **params: passed to train_als
+
+        Returns:
+            UserRecommender: the trained model, or None if the index has no matrix
+        """
+        if index.matrix is None:
+            return None
+        ratings = index.matrix.T.tocsr()
+        user_factors, item_factors = train_als(ratings, **params)
+        return cls(index.user_ids, index.movie_ids, index.titles, user_factors, item_factors, ratings,
+                   params.get("regularization", DEFAULT_REGULARIZATION), params.get("alpha", DEFAULT_ALPHA))
+
+    @metrics.span("user_model.update")
+    def fold_in(self, index, user_ids):
+        """
+        Re-solves the factors of the given users on the ratings of an updated index, with the movie
+        factors held fixed, so new ratings and new users count without retraining.
+
+        Movies added after training have no factors yet and are not recommended until the next
+        full training; their ratings are left out of the solve.
+
+        Args:
+            index (RecommenderIndex): the model trained on, with ratings folded in by update_index
+            user_ids (array-like): users whose ratings changed
+
+        Returns:
+            UserRecommender: the updated model, or None if the index is not an update of the
+            model's (its movies or users were reordered) and a full training is needed
+        """
+        n_users, n_items = len(self.user_ids), len(self.movie_ids)
+        # update_index appends new movies and users, so the trained ones keep their rows
+        if (index.matrix is None or len(index.movie_ids) < n_items or len(index.user_ids) < n_users
+                or not np.array_equal(index.movie_ids[:n_items], self.movie_ids)
+                or not np.array_equal(index.user_ids[:n_users], self.user_ids)):
+            return None
+        ratings = index.matrix[:n_items].T.tocsr()
+        rows = pd.Index(index.user_ids).get_indexer(np.unique(np.asarray(user_ids)))
+        rows = rows[rows >= 0]
+
+        weights = ratings[rows].astype(np.float32)
+        weights.data *= self.alpha
+        user_factors = np.zeros((len(index.user_ids), self.item_factors.shape[1]), dtype=np.float32)
+        user_factors[:n_users] = self.user_factors
+        user_factors[rows] = _solve_side(weights, self.item_factors, self.regularization)
+        return UserRecommender(index.user_ids, self.movie_ids, self.titles, user_factors, self.item_factors,
+                               ratings, self.regularization, self.alpha)
+
+    @property
+    def nbytes(self):
+        """Memory held by the factors and the rated-movie lists."""
+        return (self.user_factors.nbytes + self.item_factors.nbytes
+                + self.rated.indptr.nbytes + self.rated.indices.nbytes)
+
+    def recommend(self, user_id, top_n=4):
+        """
+        Top movies for a user the user has not rated yet.
+
+        Returns:
+            list: (movie_id, title) tuples, or None if the user is unknown
+        """
+        row = self.user_to_row.get(int(user_id))
+        if row is None:
+            return None
+
+        scores = self.item_factors @ self.user_factors[row]
+        scores[self.rated.indices[self.rated.indptr[row]:self.rated.indptr[row + 1]]] = -np.inf
+        scores[self.untitled] = -np.inf
+        top = top_n_indices(scores, top_n)
+        return [(int(self.movie_ids[r]), str(self.titles[r])) for r in top[scores[top] > -np.inf]]
+
+'''
+Python file with the matrix-factorization model behind /recommend/user/{user_id}.
+
+The model is trained with implicit-feedback ALS: each half-step solves every user (or movie)
+at once with batched NumPy solves, so training needs no Python loop over users or ratings.
+'''
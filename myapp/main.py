@@ -1,12 +1,194 @@
-from fastapi import FastAPI, Depends, HTTPException
+import logging
+import os
+import re
+import time
+import zlib
+from collections import Counter
+from contextlib import asynccontextmanager
+import pandas as pd
+from fastapi import FastAPI, APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse
+from starlette.datastructures import MutableHeaders
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from myapp.database import engine, SessionLocal #import local session and engine
-from myapp.models import Base, ClickStats, Movie, Rating #import models (table schemas)
+from sqlalchemy.ext.asyncio import AsyncSession
+from myapp import config #settings read from environment variables
+from myapp.database import engine, SessionLocal, async_engine, AsyncSessionLocal #import local sessions and engines
+from myapp.models import GENRES, Base, ClickStats, Movie, Rating #import models (table schemas)
 from myapp import recommender #import recommender system from recommender.py
-from myapp.schemas import MovieCreate #get MovieCreate for the ability to add new movies
+from myapp import artifact #persisted model versions
+from myapp import serving #the model currently served, swapped atomically on updates
+from myapp.factorization import UserRecommender #per-user factorization model
+from myapp.clickstats import ImpressionBuffer, impression_upserts, upsert_impressions #batched recommendations_shown counters
+from myapp.cache import TTLCache #in-process response cache
+from myapp import metrics #timing spans and Prometheus histograms
+from myapp import profiling #opt-in per-request cProfile
+from myapp import movie_import #bulk movie import
+from myapp.model_watcher import ModelWatcher #hot-swaps new model versions
+from myapp.model_updates import ModelUpdateBuffer #batched incremental model updates
+from myapp import events #append-only event log of ratings, impressions and clicks
+from myapp import reranking #diversity, popularity and click-rate re-ranking
+from myapp.schemas import MovieCreate, RecommendBatchRequest #request bodies
+
+logger = logging.getLogger(__name__)
+
+# Aggregates recommendations_shown increments and flushes them in bulk
+impressions = ImpressionBuffer(engine, config.IMPRESSION_FLUSH_INTERVAL, config.IMPRESSION_FLUSH_SIZE)
+
+# Most movie ids accepted by /click_stats/batch
+CLICK_STATS_BATCH_MAX = 1000
+
+# Entries of an If-None-Match header: "*" or a quoted ETag, weak ones prefixed with W/
+IF_NONE_MATCH_ENTRY = re.compile(r'\*|(?:W/)?"[^"]*"')
+
+# Recommendation lists keyed by (title, top_n), click stats keyed by movie_id
+recommendation_cache = TTLCache(config.RECOMMEND_CACHE_SIZE, config.RECOMMEND_CACHE_TTL)
+click_stats_cache = TTLCache(config.CLICK_STATS_CACHE_SIZE, config.CLICK_STATS_CACHE_TTL)
+# Every model swap (/add_movie/, rebuilds) drops the cached recommendations
+serving.add_listener(lambda index: recommendation_cache.clear())
+
+def retrain_user_model(index):
+    # The user model is trained on the rating matrix of the served index, retrain it after a swap
+    if config.USER_MODEL:
+        serving.publish_user_model(UserRecommender.from_index(index, factors=config.ALS_FACTORS,
+                                                              iterations=config.ALS_ITERATIONS))
+
+def prepare_model(index):
+    # Work done once per loaded model: build the title resolver up front, so the first mistyped
+    # title does not pay for it, and retrain the user model
+    if config.FUZZY_TITLES:
+        index.title_resolver
+    retrain_user_model(index)
+
+# Follows the model directory, so every worker serves the version the builder published last
+model_watcher = ModelWatcher(config.MODEL_DIR, config.MODEL_POLL_INTERVAL, on_swap=prepare_model)
+
+def fold_in_users(index, ratings):
+    # Re-solve the users who rated against the trained movie factors; new movies reach the user
+    # model with the next full training, at startup or when a new model version is swapped in
+    model = serving.current_user_model()
+    if model is None or serving.current() is not index:
+        return
+    updated = model.fold_in(index, ratings["user_id"])
+    if updated is None:
+        retrain_user_model(index)
+    else:
+        serving.publish_user_model(updated)
+
+# New ratings and movies are folded into the served model in the background, one update per batch
+model_updates = ModelUpdateBuffer(config.MODEL_UPDATE_INTERVAL, config.MODEL_UPDATE_SIZE, on_update=fold_in_users)
+
+def known_movie(movie_id):
+    # Movies of the served model, and new movies waiting for the next model update
+    return movie_id in serving.current().id_to_row or model_updates.pending_movie(movie_id)
+
+def fold_rolled_up_events(rolled_up):
+    # Fold the ratings of a rollup, whichever process ran it, into the served model and drop the
+    # cached stats of clicked or shown movies
+    ratings = events.ratings_frame(rolled_up)
+    ratings = ratings[ratings["movie_id"].isin(list(serving.current().id_to_row))]
+    if len(ratings):
+        model_updates.add(ratings)
+    for movie_id in set(rolled_up["movie_id"][rolled_up["kind"] != events.RATING].tolist()):
+        click_stats_cache.pop(movie_id)
+
+# Ratings, impressions and clicks go to the event log when EVENT_LOG is set, and are rolled up in the background
+event_log = events.EventLog(config.EVENT_DIR, config.EVENT_SEGMENT_BYTES, config.EVENT_FLUSH_INTERVAL, config.EVENT_FLUSH_SIZE)
+rollup_job = events.RollupJob(engine, config.EVENT_DIR, config.EVENT_ROLLUP_INTERVAL, config.EVENT_ROLLUP_BATCH,
+                              retention=config.EVENT_RETENTION)
+# Every worker replays what the rollups committed, not only the one that ran them
+event_follower = events.EventFollower(engine, config.EVENT_DIR, config.EVENT_FOLLOW_INTERVAL,
+                                      on_events=fold_rolled_up_events)
+
+# Click rates for the re-ranking stage, reloaded in the background; a reload changes the rankings
+ctr_snapshot = reranking.ClickStatsSnapshot(engine, config.CTR_SNAPSHOT_INTERVAL, config.CTR_PRIOR_SHOWN,
+                                            on_refresh=lambda snapshot: recommendation_cache.clear())
+# None unless a re-ranking weight is set
+reranker = reranking.make_reranker(config.RERANK_DIVERSITY, config.RERANK_POPULARITY, config.RERANK_CTR,
+                                   ctr_snapshot, config.RERANK_POOL_FACTOR)
+
+@asynccontextmanager
+async def lifespan(app):
+    model_updates.start()
+    if config.IMPRESSION_BUFFER:
+        impressions.start()
+    if config.USE_MODEL_ARTIFACT and config.MODEL_POLL_INTERVAL > 0:
+        model_watcher.start()
+    if config.EVENT_LOG:
+        event_log.start()
+        if config.EVENT_ROLLUP_INTERVAL > 0:
+            rollup_job.start()
+        event_follower.start()
+    if config.RERANK_CTR:
+        ctr_snapshot.start()
+    yield
+    model_watcher.stop()
+    ctr_snapshot.stop()
+    # Write the logged events, then fold them in with a last rollup and replay
+    if config.EVENT_LOG:
+        event_log.stop()
+        if config.EVENT_ROLLUP_INTERVAL > 0:
+            rollup_job.stop()
+        event_follower.stop()
+    # Write pending counts before the process exits
+    if config.IMPRESSION_BUFFER:
+        impressions.stop()
+    # Fold in the ratings still queued, e.g. from the last rollup
+    model_updates.stop()
 
 # Create app instance
-app = FastAPI(title="Movie Recommender API")
+app = FastAPI(title="Movie Recommender API", lifespan=lifespan)
+# Endpoints can be run under cProfile, see ObserveRequests
+app.router.route_class = profiling.ProfiledRoute
+
+
+class ObserveRequests:
+    """
+    Records the latency of every request in the REQUESTS histogram and profiles the requests
+    picked by profiling.wants_profile, naming the dump in the X-Profile-File response header.
+
+    Plain ASGI instead of @app.middleware("http"), which runs every request through an extra
+    task and response stream.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        request = Request(scope)
+        profiles = None
+        if profiling.wants_profile(request, config.PROFILE_TOKEN, config.PROFILE_SAMPLE_RATE):
+            profiles = profiling.start()
+        status = 500
+
+        async def send_observed(message):
+            nonlocal profiles, status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                # The endpoint has returned by now, so the profile is complete
+                if profiles is not None:
+                    profile_file = profiling.finish(profiles, request, config.PROFILE_DIR)
+                    profiles = None
+                    if profile_file:
+                        MutableHeaders(scope=message)[profiling.PROFILE_FILE_HEADER] = profile_file
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_observed)
+        finally:
+            if profiles is not None:
+                profiling.finish(profiles, request, config.PROFILE_DIR)
+            # The router stores the matched route in the scope
+            route = scope.get("route")
+            metrics.REQUESTS.observe(time.perf_counter() - start, request.method,
+                                     route.path if route else "unmatched", str(status))
+
+
+app.add_middleware(ObserveRequests)
 
 # Dependency to get DB session for endpoints
 def get_db():
@@ -16,103 +198,545 @@ def get_db():
     finally:
         db.close()
 
-# Load the dataset and precompute the similarity matrix once at startup
-ratings, movies = recommender.load_data()
-similarity_df = recommender.create_similarity_matrix(ratings)
+# Async counterpart, used when DB_ASYNC is set
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+# The database endpoints are registered twice, once per engine mode, and only the router
+# matching DB_ASYNC is mounted on the app at the bottom of this file
+router = APIRouter(route_class=profiling.ProfiledRoute)
+async_router = APIRouter(route_class=profiling.ProfiledRoute)
+
+# Replay starts after the events already rolled up, which the model loaded below holds
+if config.EVENT_LOG:
+    event_follower.sync()
+
+# Memory-map the persisted model if one was built, otherwise load the dataset and
+# precompute the top-K neighbour table once at startup
+version = artifact.current_version(config.MODEL_DIR) if config.USE_MODEL_ARTIFACT else None
+index = stale = None
+if version:
+    try:
+        index, _ = artifact.load_artifact(config.MODEL_DIR, version)
+    except artifact.StaleArtifactError:
+        # Left behind by an older deploy: build in-process instead of refusing to start
+        logger.warning("Model %s was written in another format, building the model at startup", version, exc_info=True)
+        stale, version = version, None
+if index is None:
+    ratings, movies = recommender.load_data()
+    index = recommender.RecommenderIndex.build(ratings, movies, block_size=config.SIMILARITY_BLOCK_SIZE,
+                                               similarity=config.SIMILARITY_INDEX, n_lists=config.IVF_LISTS or None,
+                                               n_probe=config.IVF_PROBES, workers=config.SIMILARITY_WORKERS)
+    if stale:
+        # Replace the stale version, so the other workers and the next start load this build
+        version = artifact.save_artifact(index, config.MODEL_DIR, artifact.source_checksum(ratings, movies),
+                                         config.SIMILARITY_INDEX)
+        artifact.prune_versions(config.MODEL_DIR, config.MODEL_KEEP_VERSIONS)
+serving.publish(index, version)
+
+# Title resolver, and the per-user factorization model on the same rating matrix
+prepare_model(index)
+
+
+def new_movie_rows(movie_title, category, release_date, user_rating):
+    """Builds the Movie row and the seed Rating row for a movie added through the API.
+
+    The movie id is left to the database; set the rating's movie_id once the movie is flushed.
+
+    Args:
+        movie_title (str): title of the movie
+        category (str): genre flag to set on the movie
+        release_date (str): release date in 'DD-Mth-YYYY' format
+        user_rating (float): rating given by the (anonymous) user 999
+
+    Returns:
+        tuple: the new Movie and Rating instances
+    """
+    new_movie = Movie(
+        title=str.lower(movie_title),
+        release_date=release_date,
+        unknown= 1 if category == "unknown" else 0,
+        action= 1 if category == "action" else 0,
+        adventure=1 if category == "adventure" else 0,
+        animation=1 if category == "animation" else 0,
+        children=1 if category == "children" else 0,
+        comedy=1 if category == "comedy" else 0,
+        crime=1 if category == "crime" else 0,
+        documentary=1 if category == "documentary" else 0,
+        drama=1 if category == "drama" else 0,
+        fantasy=1 if category == "fantasy" else 0,
+        filmnoir=1 if category == "filmnoir" else 0,
+        horror=1 if category == "horror" else 0,
+        musical=1 if category == "musical" else 0,
+        mystery=1 if category == "mystery" else 0,
+        romance=1 if category == "romance" else 0,
+        scifi=1 if category == "scifi" else 0,
+        thriller=1 if category == "thriller" else 0,
+        war=1 if category == "war" else 0,
+        western=1 if category == "western" else 0
+        )
+    new_rating = Rating(
+        user_id=movie_import.RATING_USER_ID,
+        rating= user_rating,
+        timestamp=int(time.time())
+    )
+    return new_movie, new_rating
+
+
+def fold_new_rating(new_movie, new_rating):
+    # Queue a committed rating for the served model so the movie can be recommended within MODEL_UPDATE_INTERVAL
+    new_ratings = pd.DataFrame({"user_id": [new_rating.user_id], "movie_id": [new_movie.movie_id], "rating": [new_rating.rating]})
+    new_genres = {new_movie.movie_id: [getattr(new_movie, genre) for genre in GENRES]}
+    model_updates.add(new_ratings, {new_movie.movie_id: new_movie.title}, new_genres)
+
+
+def fold_imported_movies(inserted):
+    # Queue the rated movies of one imported batch for the served model
+    rated = [(movie_id, title, row) for movie_id, title, row in inserted if row.user_rating is not None]
+    if not rated:
+        return
+    new_ratings = pd.DataFrame({"user_id": movie_import.RATING_USER_ID,
+                                "movie_id": [movie_id for movie_id, _, _ in rated],
+                                "rating": [row.user_rating for _, _, row in rated]})
+    new_titles = {movie_id: title for movie_id, title, _ in rated}
+    new_genres = {movie_id: [getattr(row, genre) for genre in GENRES] for movie_id, _, row in rated}
+    model_updates.add(new_ratings, new_titles, new_genres)
+
+
+def insert_movie_batch(rows):
+    # One batch of /movies/bulk in its own transaction on the sync engine
+    with engine.begin() as conn:
+        return movie_import.insert_batch(conn, rows)
+
+
+async def import_movie_batch(rows, summary):
+    # Insert one batch on the engine of the current DB mode, fold it into the model and count it in summary
+    with metrics.span("db.write.bulk_movies"):
+        if config.DB_ASYNC:
+            async with async_engine.begin() as conn:
+                inserted, skipped = await conn.run_sync(movie_import.insert_batch, rows)
+        else:
+            inserted, skipped = await run_in_threadpool(insert_movie_batch, rows)
+    await run_in_threadpool(fold_imported_movies, inserted)
+    summary["inserted"] += len(inserted)
+    summary["ratings"] += sum(row.user_rating is not None for _, _, row in inserted)
+    summary["skipped"] += len(skipped)
+    summary["movie_ids"] += [movie_id for movie_id, _, _ in inserted]
+
+
+def record_impressions(db, shown):
+    # Count one recommendations_shown for every (movie_id, title) pair: logged, buffered or in one upsert
+    if config.EVENT_LOG:
+        event_log.append(events.IMPRESSION, [mid for mid, _ in shown])
+    elif config.IMPRESSION_BUFFER:
+        impressions.add(shown)
+    elif shown:
+        with metrics.span("db.write.impressions"):
+            upsert_impressions(db, Counter(mid for mid, _ in shown), dict(shown))
+            db.commit()
+
+
+async def record_impressions_async(db, shown):
+    # Async counterpart of record_impressions
+    if config.EVENT_LOG:
+        event_log.append(events.IMPRESSION, [mid for mid, _ in shown])
+    elif config.IMPRESSION_BUFFER:
+        impressions.add(shown)
+    elif shown:
+        with metrics.span("db.write.impressions"):
+            for statement in impression_upserts(async_engine.dialect.name, Counter(mid for mid, _ in shown), dict(shown)):
+                await db.execute(statement)
+            await db.commit()
+
+
+def etag_matches(if_none_match, etag):
+    """True if an If-None-Match header matches etag.
+
+    Uses the weak comparison of RFC 9110: the header may list several ETags, W/ prefixes are
+    ignored on both sides and "*" matches any ETag.
+    """
+    if not if_none_match:
+        return False
+    etag = etag.removeprefix("W/")
+    return any(entry == "*" or entry.removeprefix("W/") == etag
+               for entry in IF_NONE_MATCH_ENTRY.findall(if_none_match))
+
+
+def not_modified(request, response, etag, cache_control):
+    """Sets the ETag and Cache-Control headers, and answers 304 when the client's copy is current.
+
+    Returns:
+        Response: an empty 304 response if If-None-Match matches etag, otherwise None
+    """
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+
+def cached_recommendations(movie, top_n):
+    """Recommendations for a title, from the cache when possible.
+
+    A title that is not in the model is resolved to the closest one when FUZZY_TITLES is set.
+
+    Returns:
+        tuple: (title the recommendations are for, list of (movie_id, title) pairs, ETag of that list)
+    """
+    index = serving.current()
+    cached = recommendation_cache.get((movie, top_n))
+    # An entry computed from a model that has been replaced since is recomputed
+    if cached is not None and cached[0] is index:
+        return cached[1:]
+
+    title = movie
+    with metrics.span("score.recommend"):
+        recs = index.recommend(title, top_n, config.CONTENT_WEIGHT, config.COLD_START_RATINGS, reranker)
+    if recs is None and config.FUZZY_TITLES:
+        with metrics.span("search.resolve"):
+            match = index.title_resolver.best(movie)
+        if match is not None:
+            title = match.title
+            with metrics.span("score.recommend"):
+                recs = index.recommend(title, top_n, config.CONTENT_WEIGHT, config.COLD_START_RATINGS, reranker)
+    if recs is None:
+        raise HTTPException(status_code=404, detail="Movie not found.")
+    etag = f'"{zlib.crc32(repr((title, recs)).encode()):08x}"'
+    recommendation_cache.set((movie, top_n), (index, title, recs, etag))
+    return title, recs, etag
+
+
+def click_stats_body(movie_id, clicks, shown):
+    # Response of /click_stats/ from the two counters
+    if shown == 0:
+        return {"movie_id": movie_id, "click_percentage": 0}
+    return {"movie_id": movie_id, "click_percentage": (clicks / shown) * 100}
+
+
+def parse_ids(ids):
+    # Comma-separated movie ids of /click_stats/batch, deduplicated in request order
+    try:
+        movie_ids = list(dict.fromkeys(int(movie_id) for movie_id in ids.split(",") if movie_id.strip()))
+    except ValueError:
+        raise HTTPException(status_code=422, detail="ids must be comma-separated integers.")
+    if len(movie_ids) > CLICK_STATS_BATCH_MAX:
+        raise HTTPException(status_code=422, detail=f"At most {CLICK_STATS_BATCH_MAX} ids per request.")
+    return movie_ids
+
+
+def cached_click_stats(movie_ids):
+    """Looks the ids up in the click stats cache.
+
+    Returns:
+        tuple: (movie_id -> (clicks, shown) for the cached ids, list of the ids to query)
+    """
+    stats = {movie_id: click_stats_cache.get(movie_id) for movie_id in movie_ids}
+    return stats, [movie_id for movie_id, counts in stats.items() if counts is None]
+
+
+def fill_click_stats(stats, rows):
+    # Fills in the queried (movie_id, clicks, shown) rows, movies without a row have no clicks yet
+    found = {movie_id: (clicks, shown) for movie_id, clicks, shown in rows}
+    for movie_id, counts in stats.items():
+        if counts is None:
+            stats[movie_id] = found.get(movie_id, (0, 0))
+            click_stats_cache.set(movie_id, stats[movie_id])
+    return stats
+
+
+def click_stats_batch_body(request, response, stats, rows):
+    """Fills in the queried (movie_id, clicks, shown) rows and builds the /click_stats/batch response."""
+    fill_click_stats(stats, rows)
+    etag = f'"{zlib.crc32(repr(sorted(stats.items())).encode()):08x}"'
+    reply = not_modified(request, response, etag, f"max-age={int(config.CLICK_STATS_CACHE_TTL)}")
+    if reply:
+        return reply
+    return {"stats": [click_stats_body(movie_id, *counts) for movie_id, counts in stats.items()]}
+
+
+def recommendations_body(request, response, title, recs, etag, stats=None):
+    """Builds the /recommend/ response, with every movie's click percentage when stats are given.
+
+    Args:
+        title (str): title the recommendations are for
+        recs (list): (movie_id, title) pairs
+        etag (str): ETag of the recommendations
+        stats (dict, optional): movie_id -> (clicks, shown) of every recommended movie
+
+    Returns:
+        dict or Response: the response body, or an empty 304 if the client's copy is current
+    """
+    if stats is not None:
+        etag = f'"{zlib.crc32(repr((etag, sorted(stats.items()))).encode()):08x}"'
+    reply = not_modified(request, response, etag, "no-cache")
+    if reply:
+        return reply
+    recommendations = [{"movie_id": rec_movie_id, "title": rec_title} for rec_movie_id, rec_title in recs]
+    if stats is not None:
+        for rec in recommendations:
+            rec.update(click_stats_body(rec["movie_id"], *stats[rec["movie_id"]]))
+    return {"movie": title, "recommendations": recommendations}
+
+
+def user_recommendations(user_id, top_n):
+    """Runs the served user model, raising 503 when it is disabled and 404 for unknown users."""
+    model = serving.current_user_model()
+    if model is None:
+        raise HTTPException(status_code=503, detail="User model is not available.")
+    with metrics.span("score.user"):
+        recs = model.recommend(user_id, top_n)
+    if recs is None:
+        raise HTTPException(status_code=404, detail="User not found.")
+    return recs
+
+
+def batch_recommendations(request):
+    """Runs a /recommend/batch request against the served model.
+
+    Args:
+        request (RecommendBatchRequest): seed titles/ids, top_n and exclusions
+
+    Returns:
+        tuple: the response body and every (movie_id, title) pair shown
+    """
+    index = serving.current()
+    seeds = list(request.titles) + list(request.movie_ids)
+    rows = index.rows_for(request.titles, request.movie_ids)
+    found = [i for i, row in enumerate(rows) if row is not None]
+    exclude = [row for row in index.rows_for(request.exclude_titles, request.exclude_ids) if row is not None]
+
+    with metrics.span("score.batch"):
+        recs = index.recommend_batch([rows[i] for i in found], request.top_n, exclude,
+                                     config.CONTENT_WEIGHT, config.COLD_START_RATINGS, reranker)
+    results = [{"movie": seeds[i],
+                "recommendations": [{"movie_id": rec_movie_id, "title": rec_title} for rec_movie_id, rec_title in seed_recs]}
+               for i, seed_recs in zip(found, recs)]
+    not_found = [seeds[i] for i, row in enumerate(rows) if row is None]
+    return {"results": results, "not_found": not_found}, [rec for seed_recs in recs for rec in seed_recs]
 
 
 @app.get("/")
 def read_root():
     return {"message": "Welcome to the Movie Recommender API"}
 
+# Paginated prefix search over the titles of the served model
+@app.get("/movies/search")
+def search_movies(q: str = "", offset: int = Query(0, ge=0), limit: int = Query(20, ge=1, le=100)):
+    """
+    Finds the movies whose title starts with q, case-insensitive, in alphabetical order.
+
+    Args:
+        q (str): start of the title, empty to list every movie
+        offset (int): matches to skip. Defaults to 0.
+        limit (int): page size. Defaults to 20.
+
+    Returns:
+        dict: the query, the total number of matches and one page of {"movie_id", "title"}
+    """
+    with metrics.span("search.titles"):
+        total, matches = serving.current().title_index.search(q, offset, limit)
+    return {"query": q, "total": total, "offset": offset, "limit": limit,
+            "results": [{"movie_id": movie_id, "title": title} for movie_id, title in matches]}
+
+@app.get("/movies/resolve")
+def resolve_movie(q: str, limit: int = Query(5, ge=1, le=50)):
+    """
+    Resolves a possibly mistyped title to the movie it most likely means.
+
+    Case, accents, punctuation, a bracketed year and leading or trailing articles are ignored,
+    and typos within a few characters are tolerated, see TitleResolver.
+
+    Args:
+        q (str): title as typed
+        limit (int): most candidates returned. Defaults to 5.
+
+    Returns:
+        dict: the query, the best "match" (null when no title is close enough) and the
+        "candidates", each with movie_id, title, edit distance and trigram similarity
+    """
+    with metrics.span("search.resolve"):
+        match, candidates = serving.current().title_resolver.lookup(q, limit)
+    return {"query": q, "match": match and vars(match), "candidates": [vars(candidate) for candidate in candidates]}
+
+# Timing spans and request latencies in the Prometheus text format
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+# Model version served by the worker that answers, e.g. to follow a rollout across workers
+@app.get("/model/")
+def get_model_info():
+    return {"version": serving.current_version(), "movies": len(serving.current().movie_ids), "pid": os.getpid()}
+
+# Hit, miss and eviction counters of the response caches
+@app.get("/cache_stats/")
+def get_cache_stats():
+    return {"recommendations": recommendation_cache.stats(), "click_stats": click_stats_cache.stats()}
+
 # Recommendation endpoint
-@app.get("/recommend/")
-def get_recommendations(movie: str, db: Session = Depends(get_db)):
+@router.get("/recommend/")
+def get_recommendations(movie: str, request: Request, response: Response,
+                        top_n: int = Query(4, ge=1, le=100), with_stats: bool = False, db: Session = Depends(get_db)):
     # Get the recommendations
     """
     Get movie recommendations given a movie title.
 
+    Results are cached per (movie, top_n) and carry an ETag, so clients can revalidate with
+    If-None-Match and get an empty 304 back.
+
     Args:
         movie (str): movie title to get recommendations for
+        top_n (int): number of recommendations. Defaults to 4.
+        with_stats (bool): add every movie's click_percentage, as /click_stats/batch would
         db (Session, optional): database session. Defaults to Depends(get_db).
 
     Returns:
         dict: containing the movie title and a list of recommendations
     """
-    rec_titles = recommender.get_recommendations(movie, movies, similarity_df)
-    
-    # queried_movie_id = movies[movies['title'] == movie]['movie_id'].values[0]
-    
-    # Empty list to store the recommendations
-    recommendations = []
-    
-    for rec_title in rec_titles:
-        # Retrieve movie_id for the recommended movie from the movies dataframe
-        rec_movie_id = movies[movies['title'] == rec_title]['movie_id'].values[0]
-        
-        # Update the recommendation
-        # s_shown counter for this movie
-        record = db.query(ClickStats).filter(ClickStats.movie_id == str(rec_movie_id)).first()
-        if not record:
-            record = ClickStats(movie_id=str(rec_movie_id), 
-                                title = rec_title,
-                                recommendations_shown=1, 
-                                clicks=0)
-            db.add(record)
-        else:
-            record.recommendations_shown += 1
-        db.commit()
-        
-        # Append the recommendation details (movie_id and title)
-        recommendations.append({"movie_id": str(rec_movie_id), "title": rec_title})
+    title, recs, etag = cached_recommendations(movie, top_n)
     
-    return {"movie": movie, "recommendations": recommendations}
+    # Update the recommendations_shown counters, buffered or in a single upsert
+    record_impressions(db, recs)
+
+    stats = None
+    if with_stats:
+        stats, missing = cached_click_stats([rec_movie_id for rec_movie_id, _ in recs])
+        rows = []
+        if missing:
+            with metrics.span("db.read.click_stats"):
+                rows = (db.query(ClickStats.movie_id, ClickStats.clicks, ClickStats.recommendations_shown)
+                        .filter(ClickStats.movie_id.in_(missing)).all())
+        fill_click_stats(stats, rows)
+
+    # Recommendation details (movie_id and title)
+    return recommendations_body(request, response, title, recs, etag, stats)
+
+# Recommendations for many seed movies in one call
+@router.post("/recommend/batch")
+def get_batch_recommendations(request: RecommendBatchRequest, db: Session = Depends(get_db)):
+    """
+    Get recommendations for a list of seed titles and/or movie ids.
+
+    All seeds are scored in one pass and their impressions are written together.
+
+    Args:
+        request (RecommendBatchRequest): seeds, top_n and optional exclude_titles/exclude_ids
+        db (Session, optional): database session. Defaults to Depends(get_db).
+
+    Returns:
+        dict: one entry per known seed under "results", unknown seeds under "not_found"
+    """
+    body, shown = batch_recommendations(request)
+    record_impressions(db, shown)
+    return body
+
+# Personalized recommendations from the factorization model
+@router.get("/recommend/user/{user_id}")
+def get_user_recommendations(user_id: int, top_n: int = Query(4, ge=1, le=100), db: Session = Depends(get_db)):
+    """
+    Get recommendations for a user, leaving out the movies the user already rated.
+
+    Args:
+        user_id (int): user to recommend for
+        top_n (int): number of recommendations. Defaults to 4.
+        db (Session, optional): database session. Defaults to Depends(get_db).
+
+    Returns:
+        dict: containing the user_id and a list of recommendations
+    """
+    recs = user_recommendations(user_id, top_n)
+    record_impressions(db, recs)
+    return {"user_id": user_id, "recommendations": [{"movie_id": mid, "title": title} for mid, title in recs]}
 
 # Click tracking endpoint
-@app.post("/click/")
-def update_click(movie_id: str, db: Session = Depends(get_db)):
+@router.post("/click/")
+def update_click(movie_id: int, db: Session = Depends(get_db)):
     """
     Updates the click count for a given movie_id.
 
     Args:
-        movie_id (str): the movie_id to update the click count for
+        movie_id (int): the movie_id to update the click count for
         db (Session, optional): database session. Defaults to Depends(get_db).
 
     Returns:
-        dict: containing the movie_id and the updated click count
+        dict: containing the movie_id and the updated click count, or "logged" when EVENT_LOG
+        is set and the click is counted by the next rollup
+
+    Raises:
+        HTTPException: 404 if there is no movie with this id
     """
-    record = db.query(ClickStats).filter(ClickStats.movie_id == movie_id).first()
-    if not record:
-        record = ClickStats(movie_id=movie_id, 
-                            title = db.query(Movie).filter(Movie.movie_id == movie_id).first().title,
-                            recommendations_shown=0, 
-                            clicks=0)
-        db.add(record)
-    record.clicks += 1
-    db.commit()
+    if config.EVENT_LOG:
+        # Not checked against the database here, the served model and the update queue know every movie
+        if not known_movie(movie_id):
+            raise HTTPException(status_code=404, detail="Movie not found.")
+        event_log.append(events.CLICK, [movie_id])
+        return {"movie_id": movie_id, "logged": True}
+    with metrics.span("db.write.click"):
+        record = db.query(ClickStats).filter(ClickStats.movie_id == movie_id).first()
+        if not record:
+            title = db.query(Movie.title).filter(Movie.movie_id == movie_id).scalar()
+            if title is None:
+                raise HTTPException(status_code=404, detail="Movie not found.")
+            record = ClickStats(movie_id=movie_id, title=title, recommendations_shown=0, clicks=0)
+            db.add(record)
+        record.clicks += 1
+        db.commit()
+    click_stats_cache.pop(movie_id)
     return {"movie_id": movie_id, "clicks": record.clicks}
 
 # Endpoint to fetch click statistics (click percentage)
-@app.get("/click_stats/")
-def get_click_stats(movie_id: str, db: Session = Depends(get_db)):
+@router.get("/click_stats/")
+def get_click_stats(movie_id: int, request: Request, response: Response, db: Session = Depends(get_db)):
     """Returns the click percentage for the given movie_id.
 
+    The counters are cached for CLICK_STATS_CACHE_TTL seconds and the response carries an
+    ETag and a matching max-age.
+
     Args:
-        movie_id (str): The movie_id to retrieve click percentage for.
+        movie_id (int): The movie_id to retrieve click percentage for.
         db (Session): The database session object.
 
 
     Returns:
         dict: A dictionary with the movie_id and the click percentage.
     """
-    record = db.query(ClickStats).filter(ClickStats.movie_id == movie_id).first()
-    if not record or record.recommendations_shown == 0:
-        return {"movie_id": movie_id, "click_percentage": 0}
-    percentage = (record.clicks / record.recommendations_shown) * 100
-    return {"movie_id": movie_id, "click_percentage": percentage}
+    stats = click_stats_cache.get(movie_id)
+    if stats is None:
+        with metrics.span("db.read.click_stats"):
+            record = db.query(ClickStats).filter(ClickStats.movie_id == movie_id).first()
+        stats = (record.clicks, record.recommendations_shown) if record else (0, 0)
+        click_stats_cache.set(movie_id, stats)
 
+    reply = not_modified(request, response, f'"{movie_id}-{stats[0]}-{stats[1]}"',
+                         f"max-age={int(config.CLICK_STATS_CACHE_TTL)}")
+    if reply:
+        return reply
+    return click_stats_body(movie_id, *stats)
 
-@app.post("/add_movie/")
+
+# Click statistics of many movies in one call
+@router.get("/click_stats/batch")
+def get_click_stats_batch(ids: str, request: Request, response: Response, db: Session = Depends(get_db)):
+    """Returns the click percentage of every movie in ids, read with a single query.
+
+    Args:
+        ids (str): comma-separated movie ids, at most CLICK_STATS_BATCH_MAX
+        db (Session): The database session object.
+
+    Returns:
+        dict: "stats", one {"movie_id", "click_percentage"} per id in request order
+    """
+    stats, missing = cached_click_stats(parse_ids(ids))
+    rows = []
+    if missing:
+        with metrics.span("db.read.click_stats"):
+            rows = (db.query(ClickStats.movie_id, ClickStats.clicks, ClickStats.recommendations_shown)
+                    .filter(ClickStats.movie_id.in_(missing)).all())
+    return click_stats_batch_body(request, response, stats, rows)
+
+
+@router.post("/add_movie/")
 def add_movie(movie_title:str, category: str, release_date: str, user_rating: float, db: Session = Depends(get_db)):
     """
     Adds a new movie to the database.
@@ -134,52 +758,202 @@ def add_movie(movie_title:str, category: str, release_date: str, user_rating: fl
     Raises:
     - HTTPException: If the movie already exists in the database.
     """
-    # Check if the movie already exists
-    
-    existing_movie = db.query(Movie).filter(Movie.title == movie_title).first()
-    if existing_movie:
-        raise HTTPException(status_code=400, detail="Movie already exists")
+    # Check if the movie already exists; titles are stored lowercase, as /movies/bulk compares them
+    with metrics.span("db.write.add_movie"):
+        existing_movie = db.query(Movie).filter(Movie.title == movie_title.lower()).first()
+        if existing_movie:
+            raise HTTPException(status_code=400, detail="Movie already exists")
 
-    # Create a new Movie instance
-    new_movie = Movie(
-        # movie_id is generated by the database
-        movie_id=str(db.query(Movie).count() + 1),
-        title=str.lower(movie_title),
-        release_date=release_date,
-        unknown= 1 if category == "unknown" else 0,
-        action= 1 if category == "action" else 0,
-        adventure=1 if category == "adventure" else 0,
-        animation=1 if category == "animation" else 0,
-        children=1 if category == "children" else 0,
-        comedy=1 if category == "comedy" else 0,
-        crime=1 if category == "crime" else 0,
-        documentary=1 if category == "documentary" else 0,
-        drama=1 if category == "drama" else 0,
-        fantasy=1 if category == "fantasy" else 0,
-        filmnoir=1 if category == "filmnoir" else 0,
-        horror=1 if category == "horror" else 0,
-        musical=1 if category == "musical" else 0,
-        mystery=1 if category == "mystery" else 0,
-        romance=1 if category == "romance" else 0,
-        scifi=1 if category == "scifi" else 0,
-        thriller=1 if category == "thriller" else 0,
-        war=1 if category == "war" else 0,
-        western=1 if category == "western" else 0
-        )
-    
-    # Create a new Rating instance
-    new_rating = Rating(
-        user_id='999',
-        movie_id=str(db.query(Movie).count() + 1),
-        rating= user_rating
-    )
-                     
-
-    # Add the new movie to the database
-    db.add(new_movie)
-    # Add the new movie to the database
-    db.add(new_rating)
-    db.commit()
-    db.refresh(new_movie)
-    db.refresh(new_rating)
-    return {"message": "Movie added successfully."}
\ No newline at end of file
+        new_movie, new_rating = new_movie_rows(movie_title, category, release_date, user_rating)
+
+        # Add the new movie and its rating to the database; the flush has the database allocate the id
+        db.add(new_movie)
+        db.flush()
+        new_rating.movie_id = new_movie.movie_id
+        db.add(new_rating)
+        db.commit()
+        db.refresh(new_movie)
+        db.refresh(new_rating)
+
+    fold_new_rating(new_movie, new_rating)
+    return {"message": "Movie added successfully."}
+
+def store_rating(user_id, movie_id, rating):
+    # Insert or overwrite one rating on the sync engine and queue it for the served model
+    ratings = pd.DataFrame({"user_id": [user_id], "movie_id": [movie_id], "rating": [rating],
+                            "timestamp": [int(time.time())]})
+    with metrics.span("db.write.rating"), engine.begin() as conn:
+        events.upsert_ratings(conn, ratings)
+    model_updates.add(ratings)
+
+# Served in both DB modes: a logged rating never touches the database in the request
+@app.post("/rating/")
+def add_rating(user_id: int, movie_id: int, rating: float = Query(ge=0, le=5)):
+    """
+    Stores a user's rating of a movie, replacing an earlier rating of the same movie.
+
+    With EVENT_LOG set the rating is appended to the event log and reaches the ratings table
+    and the served model with the next rollup; otherwise it is written at once and folded into
+    the model within MODEL_UPDATE_INTERVAL seconds.
+
+    Returns:
+    - dict: the rating and whether it was only logged.
+
+    Raises:
+    - HTTPException: 404 if the movie is neither in the served model nor waiting to be added.
+    """
+    if not known_movie(movie_id):
+        raise HTTPException(status_code=404, detail="Movie not found")
+    if config.EVENT_LOG:
+        event_log.append(events.RATING, [movie_id], user_id, rating)
+    else:
+        store_rating(user_id, movie_id, rating)
+    return {"user_id": user_id, "movie_id": movie_id, "rating": rating, "logged": config.EVENT_LOG}
+
+# Served in both DB modes: the body is streamed, so the handler is async and each batch runs on
+# the engine of the current mode
+@app.post("/movies/bulk")
+async def import_movies(request: Request):
+    """
+    Imports many movies in one call.
+
+    The body is a JSON array of MovieCreate objects, or NDJSON (Content-Type
+    application/x-ndjson) with one object per line, which is read as it streams in. movie_id
+    is allocated by the database. Rows are inserted BULK_BATCH_SIZE at a time, each batch in
+    one transaction together with the seed ratings of its rows, and then folded into the
+    served model. Titles that already exist are skipped and invalid rows are reported with
+    their row number (line number for NDJSON).
+
+    Returns:
+    - dict: inserted, ratings, skipped and invalid counts, the ids of the inserted movies in
+      body order, and up to 100 row errors.
+
+    Raises:
+    - HTTPException: 400 if a JSON body is not an array.
+    """
+    summary = {"inserted": 0, "ratings": 0, "skipped": 0, "invalid": 0, "movie_ids": [], "errors": []}
+    batch = []
+    try:
+        async for number, value in movie_import.read_rows(request):
+            row, error = movie_import.validate(value)
+            if error:
+                summary["invalid"] += 1
+                if len(summary["errors"]) < movie_import.MAX_REPORTED_ERRORS:
+                    summary["errors"].append({"row": number, "error": error})
+                continue
+            batch.append(row)
+            if len(batch) >= config.BULK_BATCH_SIZE:
+                await import_movie_batch(batch, summary)
+                batch = []
+    except movie_import.ImportBodyError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+    if batch:
+        await import_movie_batch(batch, summary)
+    return summary
+
+# Async versions of the database endpoints, served on aiosqlite/asyncpg when DB_ASYNC is set
+@async_router.get("/recommend/")
+async def get_recommendations_async(movie: str, request: Request, response: Response,
+                                    top_n: int = Query(4, ge=1, le=100), with_stats: bool = False,
+                                    db: AsyncSession = Depends(get_async_db)):
+    """Async version of /recommend/."""
+    title, recs, etag = cached_recommendations(movie, top_n)
+    await record_impressions_async(db, recs)
+
+    stats = None
+    if with_stats:
+        stats, missing = cached_click_stats([rec_movie_id for rec_movie_id, _ in recs])
+        rows = []
+        if missing:
+            with metrics.span("db.read.click_stats"):
+                rows = (await db.execute(select(ClickStats.movie_id, ClickStats.clicks, ClickStats.recommendations_shown)
+                                         .where(ClickStats.movie_id.in_(missing)))).all()
+        fill_click_stats(stats, rows)
+    return recommendations_body(request, response, title, recs, etag, stats)
+
+@async_router.post("/recommend/batch")
+async def get_batch_recommendations_async(request: RecommendBatchRequest, db: AsyncSession = Depends(get_async_db)):
+    """Async version of /recommend/batch."""
+    body, shown = batch_recommendations(request)
+    await record_impressions_async(db, shown)
+    return body
+
+@async_router.get("/recommend/user/{user_id}")
+async def get_user_recommendations_async(user_id: int, top_n: int = Query(4, ge=1, le=100), db: AsyncSession = Depends(get_async_db)):
+    """Async version of /recommend/user/{user_id}."""
+    recs = user_recommendations(user_id, top_n)
+    await record_impressions_async(db, recs)
+    return {"user_id": user_id, "recommendations": [{"movie_id": mid, "title": title} for mid, title in recs]}
+
+@async_router.post("/click/")
+async def update_click_async(movie_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Async version of /click/."""
+    if config.EVENT_LOG:
+        # Not checked against the database here, the served model and the update queue know every movie
+        if not known_movie(movie_id):
+            raise HTTPException(status_code=404, detail="Movie not found.")
+        event_log.append(events.CLICK, [movie_id])
+        return {"movie_id": movie_id, "logged": True}
+    with metrics.span("db.write.click"):
+        record = await db.scalar(select(ClickStats).where(ClickStats.movie_id == movie_id))
+        if not record:
+            title = await db.scalar(select(Movie.title).where(Movie.movie_id == movie_id))
+            if title is None:
+                raise HTTPException(status_code=404, detail="Movie not found.")
+            record = ClickStats(movie_id=movie_id, title=title, recommendations_shown=0, clicks=0)
+            db.add(record)
+        record.clicks += 1
+        await db.commit()
+    click_stats_cache.pop(movie_id)
+    return {"movie_id": movie_id, "clicks": record.clicks}
+
+@async_router.get("/click_stats/")
+async def get_click_stats_async(movie_id: int, request: Request, response: Response,
+                                db: AsyncSession = Depends(get_async_db)):
+    """Async version of /click_stats/."""
+    stats = click_stats_cache.get(movie_id)
+    if stats is None:
+        with metrics.span("db.read.click_stats"):
+            record = await db.scalar(select(ClickStats).where(ClickStats.movie_id == movie_id))
+        stats = (record.clicks, record.recommendations_shown) if record else (0, 0)
+        click_stats_cache.set(movie_id, stats)
+
+    reply = not_modified(request, response, f'"{movie_id}-{stats[0]}-{stats[1]}"',
+                         f"max-age={int(config.CLICK_STATS_CACHE_TTL)}")
+    if reply:
+        return reply
+    return click_stats_body(movie_id, *stats)
+
+@async_router.get("/click_stats/batch")
+async def get_click_stats_batch_async(ids: str, request: Request, response: Response,
+                                      db: AsyncSession = Depends(get_async_db)):
+    """Async version of /click_stats/batch."""
+    stats, missing = cached_click_stats(parse_ids(ids))
+    rows = []
+    if missing:
+        with metrics.span("db.read.click_stats"):
+            rows = (await db.execute(select(ClickStats.movie_id, ClickStats.clicks, ClickStats.recommendations_shown)
+                                     .where(ClickStats.movie_id.in_(missing)))).all()
+    return click_stats_batch_body(request, response, stats, rows)
+
+@async_router.post("/add_movie/")
+async def add_movie_async(movie_title:str, category: str, release_date: str, user_rating: float, db: AsyncSession = Depends(get_async_db)):
+    """Async version of /add_movie/."""
+    with metrics.span("db.write.add_movie"):
+        existing_movie = await db.scalar(select(Movie.movie_id).where(Movie.title == movie_title.lower()))
+        if existing_movie is not None:
+            raise HTTPException(status_code=400, detail="Movie already exists")
+
+        new_movie, new_rating = new_movie_rows(movie_title, category, release_date, user_rating)
+        db.add(new_movie)
+        await db.flush()
+        new_rating.movie_id = new_movie.movie_id
+        db.add(new_rating)
+        await db.commit()
+
+    # The model update is CPU-bound, keep it off the event loop
+    await run_in_threadpool(fold_new_rating, new_movie, new_rating)
+    return {"message": "Movie added successfully."}
+
+
+app.include_router(async_router if config.DB_ASYNC else router)
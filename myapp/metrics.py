@@ -0,0 +1,151 @@
+# Imports
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds in seconds, from sub-millisecond lookups to multi-minute model builds
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+# Every metric created below, in the order /metrics lists them
+_registry = []
+
+
+def _escape(value):
+    # Label values escape backslashes, double quotes and newlines in the text format
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in (*zip(names, values), *extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    """
+    Thread-safe Prometheus histogram with one series per combination of label values.
+
+    Bucket counts are kept per bucket and only made cumulative when rendered.
+    """
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        """
+        Args:
+            name (str): metric name, should end in _seconds for timings
+            documentation (str): HELP text
+            labelnames (tuple): names of the labels every observation passes values for
+            buckets (tuple): increasing upper bounds, +Inf is added
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, *labelvalues):
+        """Records one observation for the given label values."""
+        # Index of the first bucket whose bound holds value, len(buckets) is +Inf
+        bucket = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._series.get(labelvalues, (None, 0.0))
+            if counts is None:
+                counts = [0] * (len(self.buckets) + 1)
+            counts[bucket] += 1
+            self._series[labelvalues] = (counts, total + value)
+
+    def samples(self):
+        """Returns {label values: (cumulative bucket counts, sum, count)}."""
+        with self._lock:
+            series = {labels: (list(counts), total) for labels, (counts, total) in self._series.items()}
+        result = {}
+        for labels, (counts, total) in series.items():
+            cumulative, running = [], 0
+            for count in counts:
+                running += count
+                cumulative.append(running)
+            result[labels] = (cumulative, total, running)
+        return result
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, (cumulative, total, count) in sorted(self.samples().items()):
+            bounds = [repr(float(bound)) for bound in self.buckets] + ["+Inf"]
+            for bound, running in zip(bounds, cumulative):
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, [('le', bound)])} {running}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class Counter:
+    """Thread-safe Prometheus counter with one series per combination of label values."""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, *labelvalues):
+        """Adds amount to the series of the given label values."""
+        with self._lock:
+            self._series[labelvalues] = self._series.get(labelvalues, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            series = sorted(self._series.items())
+        lines += [f"{self.name}{_labels(self.labelnames, labels)} {value}" for labels, value in series]
+        return lines
+
+
+# Timings of the instrumented code paths, one series per span name
+SPANS = Histogram("movie_recommender_span_seconds",
+                  "Time spent in instrumented code paths (data load, model build, scoring, database reads and writes).",
+                  ["span"])
+# End-to-end latency of every API request, by route template
+REQUESTS = Histogram("movie_recommender_http_request_duration_seconds",
+                     "Latency of API requests, from the first middleware to the response.",
+                     ["method", "route", "status"])
+IMPRESSIONS_FLUSHED = Counter("movie_recommender_impressions_flushed_total",
+                              "recommendations_shown increments written by the impression buffer.")
+RATINGS_FOLDED = Counter("movie_recommender_ratings_folded_total",
+                         "Ratings folded into the served model by the model update buffer.")
+# Event log: records appended and rolled up by kind, and how old the oldest event of a rollup was
+EVENTS_LOGGED = Counter("movie_recommender_events_logged_total", "Events written to the event log.", ["kind"])
+EVENTS_ROLLED_UP = Counter("movie_recommender_events_rolled_up_total",
+                           "Events folded into click_stats and ratings by the rollup.", ["kind"])
+ROLLUP_LAG = Histogram("movie_recommender_event_rollup_lag_seconds",
+                       "Time from the oldest event of a rollup run being logged to the run committing.")
+
+
+@contextmanager
+def span(name):
+    """
+    Times the enclosed block into the SPANS histogram under name.
+
+    Works as a context manager (with span("db.read"): ...) and as a decorator (@span("load_data")).
+    The time is recorded even if the block raises.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        SPANS.observe(time.perf_counter() - start, name)
+
+
+def render():
+    """Returns every metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+'''
+Python file with the timing spans and Prometheus metrics served on /metrics
+'''
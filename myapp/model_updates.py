@@ -0,0 +1,123 @@
+# Imports
+import logging
+import threading
+import pandas as pd
+from myapp import metrics
+from myapp import recommender
+from myapp import serving
+
+logger = logging.getLogger(__name__)
+
+# Columns update_index reads from the new ratings
+RATING_COLUMNS = ["user_id", "movie_id", "rating"]
+
+
+class ModelUpdateBuffer:
+    """
+    Ratings and new movies waiting to be folded into the served model.
+
+    One update_index call copies the rating matrix and the neighbour table however few ratings
+    it folds in, so requests only queue their ratings here and a background thread folds
+    everything pending into the model with one update every flush_interval seconds, or sooner
+    once flush_size ratings are pending. Before start() and after stop(), add() folds the
+    ratings in at once. on_update, if given, is called with the new model and the folded
+    ratings after every update (e.g. to update the user model).
+    """
+
+    def __init__(self, flush_interval=0.5, flush_size=1000, on_update=None):
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.on_update = on_update
+        self._lock = threading.Lock()
+        self._ratings = []
+        self._titles = {}
+        self._genres = {}
+        self._pending = 0
+        # Serialises flushes, so folded batches keep their order
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def add(self, ratings, titles=None, genres=None):
+        """
+        Queues ratings, and the titles and genre flags of the movies they add, see update_index.
+
+        Args:
+            ratings (DataFrame): user_id, movie_id and rating rows
+            titles (dict, optional): movie_id -> title of new movies
+            genres (dict, optional): movie_id -> GENRES flags of new movies
+        """
+        with self._lock:
+            self._ratings.append(ratings[RATING_COLUMNS])
+            self._titles.update(titles or {})
+            self._genres.update(genres or {})
+            self._pending += len(ratings)
+            full = self._pending >= self.flush_size
+        if self._thread is None:
+            self.flush()
+        elif full:
+            self._wakeup.set()
+
+    def pending_movie(self, movie_id):
+        """True if movie_id is a new movie waiting to be folded into the model."""
+        with self._lock:
+            return movie_id in self._titles
+
+    def flush(self):
+        """
+        Folds every pending rating into the served model with one update_index call.
+
+        Returns:
+            int: number of ratings folded in
+        """
+        with self._flush_lock:
+            with self._lock:
+                ratings, titles, genres = self._ratings, self._titles, self._genres
+                self._ratings, self._titles, self._genres, self._pending = [], {}, {}, 0
+            if not ratings:
+                return 0
+            ratings = pd.concat(ratings, ignore_index=True)
+            try:
+                with metrics.span("model.update"):
+                    index = serving.update(lambda index: recommender.update_index(index, ratings, titles, genres))
+            except Exception:
+                # Put the ratings back, in front of the ones queued since, so the next flush retries them
+                with self._lock:
+                    self._ratings.insert(0, ratings)
+                    self._titles = {**titles, **self._titles}
+                    self._genres = {**genres, **self._genres}
+                    self._pending += len(ratings)
+                raise
+            metrics.RATINGS_FOLDED.inc(len(ratings))
+        if self.on_update is not None:
+            self.on_update(index, ratings)
+        return len(ratings)
+
+    def start(self):
+        """Starts the background update thread."""
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="model-update", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the background thread and folds in the remaining ratings."""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Failed to fold ratings into the model")
+
+'''
+Python file with the buffer that batches incremental updates of the served model
+'''
@@ -0,0 +1,94 @@
+# Imports
+import logging
+import os
+import signal
+import threading
+from pathlib import Path
+from myapp import artifact
+from myapp import metrics
+from myapp import serving
+
+logger = logging.getLogger(__name__)
+
+
+class ModelWatcher:
+    """
+    Hot-swaps the served model when the model directory points to a new artifact version.
+
+    A background thread checks the 'current' pointer every poll_interval seconds, or at once
+    when the process receives SIGUSR1. A new version is memory-mapped and published with
+    serving.publish; requests already running keep the model they started with, so none is
+    dropped, and the old mapping is released when the last of them finishes. on_swap, if
+    given, is called with the new index afterwards (e.g. to retrain the user model).
+    """
+
+    def __init__(self, model_dir, poll_interval=2.0, on_swap=None):
+        self.model_dir = Path(model_dir)
+        self.poll_interval = poll_interval
+        self.on_swap = on_swap
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        # (inode, mtime) of the pointer file at the last check, so unchanged pointers are not re-read
+        self._pointer_stat = None
+
+    def check(self):
+        """
+        Loads and publishes the current version if it is not the one being served. A version that
+        fails to load is not loaded again until the pointer changes.
+
+        Returns:
+            str: the newly published version, or None if nothing changed
+        """
+        try:
+            stat = os.stat(self.model_dir / artifact.CURRENT_POINTER)
+        except FileNotFoundError:
+            return None
+        if (stat.st_ino, stat.st_mtime_ns) == self._pointer_stat:
+            return None
+        self._pointer_stat = (stat.st_ino, stat.st_mtime_ns)
+
+        version = artifact.current_version(self.model_dir)
+        if version is None or version == serving.current_version():
+            return None
+        with metrics.span("model.swap"):
+            index, _ = artifact.load_artifact(self.model_dir, version)
+            serving.publish(index, version)
+        logger.info("Serving model %s", version)
+        if self.on_swap is not None:
+            self.on_swap(index)
+        return version
+
+    def start(self):
+        """Starts the background thread, and makes SIGUSR1 trigger a check when called from the main thread."""
+        self._stopping.clear()
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGUSR1, lambda signum, frame: self._wakeup.set())
+        self._thread = threading.Thread(target=self._run, name="model-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the background thread."""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            if self._stopping.is_set():
+                break
+            try:
+                self.check()
+            except Exception:
+                # A half-deleted, corrupt or stale version must not take the worker down, keep serving
+                # the old one. check() has recorded the pointer, so the version is not retried until
+                # the pointer changes
+                logger.exception("Failed to load the current model version, retrying once the pointer changes")
+
+'''
+Python file with the background thread that hot-swaps a worker to new model versions.
+'''
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float
+from sqlalchemy import Column, Index, Integer, String, Float
 from sqlalchemy.orm import declarative_base
 
 Base = declarative_base()
@@ -6,9 +6,9 @@ Base = declarative_base()
 class ClickStats(Base):
     __tablename__ = "click_stats"
     
-    # Using movie_id as a string (you can change to Integer if your movie ids are numeric)
-    movie_id = Column(String, primary_key=True, index=True)
-    title = Column(String, unique=True, index=True, default="")
+    movie_id = Column(Integer, primary_key=True, autoincrement=False)
+    # Not unique: different movies can share a title (MovieLens has duplicates)
+    title = Column(String, index=True, default="")
     recommendations_shown = Column(Integer, default=0)
     clicks = Column(Integer, default=0)
 
@@ -16,7 +16,7 @@ class Movie(Base):
     __tablename__ = "movies"
 
     # Table columns
-    movie_id= Column(String, primary_key=True, index=True)
+    movie_id= Column(Integer, primary_key=True)
     title= Column(String, default="", index=True)
     release_date= Column(String, default="")
     unknown= Column(Integer, default=0)
@@ -39,11 +39,32 @@ class Movie(Base):
     war = Column(Integer, default=0)
     western = Column(Integer, default=0)
 
+# Genre flag columns of Movie, in table order
+GENRES = ("unknown", "action", "adventure", "animation", "children", "comedy", "crime", "documentary", "drama",
+          "fantasy", "filmnoir", "horror", "musical", "mystery", "romance", "scifi", "thriller", "war", "western")
+
 
 class Rating(Base):
     __tablename__ = "ratings"
 
     # Table columns
-    user_id = Column(String, primary_key=True, index=True)
-    movie_id = Column(String, primary_key=True, index=True)
-    rating = Column(Float, default=0)
\ No newline at end of file
+    user_id = Column(Integer, primary_key=True, autoincrement=False)
+    movie_id = Column(Integer, primary_key=True, autoincrement=False)
+    rating = Column(Float, default=0)
+    # Unix seconds, as in u.data
+    timestamp = Column(Integer, default=0)
+
+    # Covering indexes: the recommender scans ratings by movie and by user and only needs these columns
+    __table_args__ = (
+        Index("ix_ratings_movie_user_rating", "movie_id", "user_id", "rating"),
+        Index("ix_ratings_user_movie_rating", "user_id", "movie_id", "rating"),
+    )
+
+
+class EventOffset(Base):
+    __tablename__ = "event_offsets"
+
+    # Segment file of the event log and how many of its records the rollup has applied.
+    # Updated in the same transaction as the rolled up counts, so no event is applied twice
+    segment = Column(String, primary_key=True)
+    records = Column(Integer, default=0)
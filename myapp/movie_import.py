@@ -0,0 +1,125 @@
+# Imports
+import json
+import time
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from myapp.models import GENRES, Movie, Rating
+from myapp.schemas import MovieCreate
+
+# Content types read as one JSON object per line; anything else is parsed as a JSON array
+NDJSON_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl", "application/x-jsonlines")
+# Invalid rows reported back in detail, the rest are only counted
+MAX_REPORTED_ERRORS = 100
+# Anonymous user the seed ratings are stored for, as in /add_movie/
+RATING_USER_ID = 999
+
+
+class ImportBodyError(ValueError):
+    """The request body is not a JSON array of movies."""
+
+
+async def read_rows(request):
+    """
+    Yields (row number, parsed JSON value) for every movie in the request body.
+
+    NDJSON bodies are parsed line by line as they arrive, so their size is not bounded by
+    memory; a line that is not valid JSON is yielded as its json.JSONDecodeError. Other bodies
+    must be a JSON array and are read in full.
+
+    Raises:
+        ImportBodyError: if a non-NDJSON body is not a JSON array
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type not in NDJSON_TYPES:
+        try:
+            rows = json.loads(await request.body())
+        except json.JSONDecodeError as error:
+            raise ImportBodyError(f"Body is not valid JSON: {error}") from None
+        if not isinstance(rows, list):
+            raise ImportBodyError("Body must be a JSON array of movies, or NDJSON with one movie per line.")
+        for number, row in enumerate(rows, start=1):
+            yield number, row
+        return
+
+    number, pending = 0, b""
+    async for chunk in request.stream():
+        *lines, pending = (pending + chunk).split(b"\n")
+        for line in lines:
+            number += 1
+            if line.strip():
+                yield number, _parse_line(line)
+    if pending.strip():
+        yield number + 1, _parse_line(pending)
+
+
+def _parse_line(line):
+    try:
+        return json.loads(line)
+    except json.JSONDecodeError as error:
+        return error
+
+
+def validate(value):
+    """
+    Validates one parsed row against MovieCreate.
+
+    Returns:
+        tuple: (MovieCreate, None) for a valid row, (None, error message) otherwise
+    """
+    if isinstance(value, json.JSONDecodeError):
+        return None, f"invalid JSON: {value}"
+    try:
+        row = MovieCreate.model_validate(value)
+    except ValidationError as error:
+        return None, "; ".join(f"{'.'.join(map(str, e['loc']))}: {e['msg']}" for e in error.errors())
+    if row.movie_id is not None:
+        return None, "movie_id is allocated by the server, leave it out"
+    return row, None
+
+
+def insert_batch(conn, rows):
+    """
+    Inserts one batch of movies, and the seed ratings of those that carry one, on a Core connection.
+
+    Titles are stored in lowercase like /add_movie/ does. Titles already in the database or
+    earlier in the batch are skipped. Ids are allocated by the database in the same INSERT
+    that stores the movies (the INTEGER PRIMARY KEY rowid in SQLite, the serial sequence in
+    PostgreSQL), so concurrent imports and /add_movie/ calls never hand out the same id. The
+    caller owns the transaction; an async caller runs this through AsyncConnection.run_sync.
+
+    Args:
+        conn (Connection): connection inside a transaction
+        rows (list): MovieCreate rows
+
+    Returns:
+        tuple: (list of (movie_id, title, MovieCreate) for the inserted movies, list of skipped titles)
+    """
+    titles = [row.title.lower() for row in rows]
+    seen = set(conn.scalars(select(Movie.title).where(Movie.title.in_(set(titles)))))
+    new_rows, skipped = [], []
+    for row, title in zip(rows, titles):
+        if title in seen:
+            skipped.append(title)
+            continue
+        seen.add(title)
+        new_rows.append((title, row))
+    if not new_rows:
+        return [], skipped
+
+    movie_ids = conn.scalars(
+        insert(Movie).returning(Movie.movie_id, sort_by_parameter_order=True),
+        [{"title": title, "release_date": row.release_date, **{genre: getattr(row, genre) for genre in GENRES}}
+         for title, row in new_rows],
+    ).all()
+    inserted = [(movie_id, title, row) for movie_id, (title, row) in zip(movie_ids, new_rows)]
+
+    timestamp = int(time.time())
+    ratings = [{"user_id": RATING_USER_ID, "movie_id": movie_id, "rating": row.user_rating, "timestamp": timestamp}
+               for movie_id, _, row in inserted if row.user_rating is not None]
+    if ratings:
+        conn.execute(insert(Rating), ratings)
+    return inserted, skipped
+
+'''
+Python file with the bulk movie import behind POST /movies/bulk
+'''
@@ -0,0 +1,93 @@
+# Imports
+import multiprocessing as mp
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import numpy as np
+from scipy import sparse
+from myapp.recommender import DEFAULT_BLOCK_SIZE, DEFAULT_TOP_K, NeighbourTable, _top_k_rows, normalize_rows
+
+# Files shared with the workers: the normalised matrix and its transpose as CSR arrays
+INPUTS = ("rows_data", "rows_indices", "rows_indptr", "cols_data", "cols_indices", "cols_indptr")
+
+# Worker state set by _init_worker: (normalized, transposed, neighbours, scores)
+_worker_arrays = None
+
+
+def _init_worker(directory, n_movies, n_users):
+    # Memory-map the inputs read-only and the output tables writable, once per worker
+    global _worker_arrays
+    directory = Path(directory)
+    arrays = {name: np.load(directory / f"{name}.npy", mmap_mode="r") for name in INPUTS}
+    normalized = sparse.csr_matrix((arrays["rows_data"], arrays["rows_indices"], arrays["rows_indptr"]),
+                                   shape=(n_movies, n_users))
+    transposed = sparse.csr_matrix((arrays["cols_data"], arrays["cols_indices"], arrays["cols_indptr"]),
+                                   shape=(n_users, n_movies))
+    neighbours = np.load(directory / "neighbours.npy", mmap_mode="r+")
+    scores = np.load(directory / "scores.npy", mmap_mode="r+")
+    _worker_arrays = (normalized, transposed, neighbours, scores)
+
+
+def _build_block(start, stop):
+    # Similarities of rows start..stop, reduced to top-K and written straight into the shared tables
+    normalized, transposed, neighbours, scores = _worker_arrays
+    rows = np.arange(start, stop)
+    block = (normalized[start:stop] @ transposed).toarray()
+    neighbours[start:stop], scores[start:stop] = _top_k_rows(block, rows, neighbours.shape[1])
+
+
+def parallel_neighbours(matrix, movie_ids, top_k=DEFAULT_TOP_K, block_size=DEFAULT_BLOCK_SIZE, workers=2):
+    """
+    Builds the same NeighbourTable as recommender.neighbours_from_matrix on a pool of processes.
+
+    The normalised matrix and its transpose are written once to .npy files in a temporary
+    directory and memory-mapped by every worker, so they share one copy through the page cache.
+    Each worker takes one block of block_size rows at a time, computes its block_size x N
+    similarities and writes only their top-K into the memory-mapped output tables. Peak memory
+    per worker is therefore bounded by the block size, not by N x N.
+
+    Args:
+        matrix (csr_matrix): movie x user rating matrix
+        movie_ids (array-like): movie id of every matrix row
+        top_k (int): number of neighbours kept per movie
+        block_size (int): rows whose similarities a worker computes at once
+        workers (int): number of processes
+
+    Returns:
+        NeighbourTable: compact top-K neighbour arrays
+    """
+    normalized = normalize_rows(matrix).tocsr()
+    transposed = normalized.T.tocsr()
+    n_movies, n_users = normalized.shape
+    k = max(min(top_k, n_movies - 1), 0)
+
+    with tempfile.TemporaryDirectory(prefix="neighbours_") as directory:
+        inputs = dict(zip(INPUTS, (normalized.data, normalized.indices, normalized.indptr,
+                                   transposed.data, transposed.indices, transposed.indptr)))
+        for name, array in inputs.items():
+            np.save(Path(directory) / f"{name}.npy", array)
+        np.lib.format.open_memmap(Path(directory) / "neighbours.npy", mode="w+", dtype=np.int32, shape=(n_movies, k))
+        np.lib.format.open_memmap(Path(directory) / "scores.npy", mode="w+", dtype=np.float32, shape=(n_movies, k))
+
+        # Workers fork from a forkserver that imported this module once, not from the API process,
+        # which may be running threads
+        context = mp.get_context("forkserver")
+        context.set_forkserver_preload([__name__])
+        starts = range(0, n_movies, block_size)
+        with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(directory, n_movies, n_users)) as pool:
+            # list() waits for every block and re-raises a worker's exception here
+            list(pool.map(_build_block, starts, [min(start + block_size, n_movies) for start in starts]))
+
+        # Copy the results out of the files before the directory is removed
+        neighbours = np.load(Path(directory) / "neighbours.npy")
+        scores = np.load(Path(directory) / "scores.npy")
+
+    return NeighbourTable(movie_ids=np.asarray(movie_ids), neighbours=neighbours, scores=scores)
+
+'''
+Python file with the multi-process build of the exact neighbour table.
+
+Splits the movies into row blocks that a process pool computes in parallel against
+memory-mapped copies of the normalised rating matrix.
+'''
@@ -0,0 +1,145 @@
+# Imports
+import cProfile
+import functools
+import inspect
+import pstats
+import random
+import re
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from pathlib import Path
+from fastapi.routing import APIRoute
+
+# Header that asks for a profile of the request; its value must equal the configured token
+PROFILE_HEADER = "x-profile"
+# Response header naming the written profile
+PROFILE_FILE_HEADER = "X-Profile-File"
+
+# Profiles of the current request, one per thread that ran part of it; None when not profiled
+_request_profiles = ContextVar("request_profiles", default=None)
+# Guards appends to a request's profile list from several threads
+_lock = threading.Lock()
+# Held while a request is profiled; one at a time keeps the overhead bounded and the profiles apart
+_active = threading.Lock()
+
+
+def wants_profile(request, token, sample_rate):
+    """
+    Decides whether to profile a request: it carries the profile header with the token, or it
+    falls in the sampled share. An empty token disables the header.
+    """
+    if token and request.headers.get(PROFILE_HEADER) == token:
+        return True
+    return sample_rate > 0 and random.random() < sample_rate
+
+
+def start():
+    """
+    Marks the current request as profiled.
+
+    Returns:
+        list: the list its profiles are collected in, or None if another request is being profiled
+    """
+    if not _active.acquire(blocking=False):
+        return None
+    profiles = []
+    _request_profiles.set(profiles)
+    return profiles
+
+
+def _profile(profiles):
+    # A fresh profiler for the calling thread, cProfile only sees the thread that enabled it
+    profile = cProfile.Profile()
+    with _lock:
+        profiles.append(profile)
+    return profile
+
+
+def profiled(endpoint):
+    """
+    Wraps an endpoint so it runs under cProfile when its request was marked by start().
+
+    Sync endpoints run in a threadpool thread, so the profiler is enabled inside the wrapper, in
+    the same thread. The request's context, and with it the mark, is copied into that thread.
+    Async endpoints are profiled on the event loop, so other requests' coroutines that run while
+    they await show up in the profile too.
+    """
+    # include_router re-creates routes from already wrapped endpoints
+    if getattr(endpoint, "__profiled__", False):
+        return endpoint
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            profiles = _request_profiles.get()
+            if profiles is None:
+                return await endpoint(*args, **kwargs)
+            profile = _profile(profiles)
+            profile.enable()
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                profile.disable()
+        wrapper.__profiled__ = True
+        return wrapper
+
+    @functools.wraps(endpoint)
+    def wrapper(*args, **kwargs):
+        profiles = _request_profiles.get()
+        if profiles is None:
+            return endpoint(*args, **kwargs)
+        profile = _profile(profiles)
+        profile.enable()
+        try:
+            return endpoint(*args, **kwargs)
+        finally:
+            profile.disable()
+    wrapper.__profiled__ = True
+    return wrapper
+
+
+class ProfiledRoute(APIRoute):
+    """APIRoute whose endpoint is wrapped with profiled(), used as the route_class of the app and routers."""
+
+    def __init__(self, path, endpoint, **kwargs):
+        super().__init__(path, profiled(endpoint), **kwargs)
+
+
+def finish(profiles, request, directory):
+    """
+    Merges the profiles of one request, writes them as a pstats file and lets the next request be profiled.
+
+    Args:
+        profiles (list): the list returned by start()
+        request (Request): the profiled request, used in the file name
+        directory (str): where profiles are written, created if missing
+
+    Returns:
+        str: path of the written file, "" if no endpoint ran
+    """
+    try:
+        return _dump(profiles, request, directory)
+    finally:
+        _request_profiles.set(None)
+        _active.release()
+
+
+def _dump(profiles, request, directory):
+    if not profiles:
+        return ""
+    stats = pstats.Stats(profiles[0])
+    for profile in profiles[1:]:
+        stats.add(profile)
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    slug = re.sub(r"[^a-zA-Z0-9]+", "_", request.url.path).strip("_") or "root"
+    path = directory / f"{time.strftime('%Y%m%d-%H%M%S')}-{request.method.lower()}-{slug}-{uuid.uuid4().hex[:8]}.prof"
+    stats.dump_stats(path)
+    return str(path)
+
+'''
+Python file with the opt-in per-request cProfile hook.
+
+Read a dump with: python -m pstats <file>, or snakeviz <file>.
+'''
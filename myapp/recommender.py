@@ -1,19 +1,125 @@
 # Imports
+from dataclasses import dataclass
+from functools import cached_property
 import pandas as pd
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
+from scipy import sparse
+from myapp import metrics
 from myapp.database import engine
+from myapp.models import GENRES
+from myapp.titles import TitleIndex, TitleResolver
 
-# Function to load data from the SQLite database
-def load_data():
+# Number of most similar movies kept for every movie in the sparse engine
+DEFAULT_TOP_K = 50
+# Number of movies whose similarities are computed in one block
+DEFAULT_BLOCK_SIZE = 512
+# Rows fetched from the database per round trip by load_data
+LOAD_CHUNK_SIZE = 50_000
+# Seed movies with fewer ratings than this lean on genre similarity instead of co-ratings
+COLD_START_RATINGS = 10
+# Added to the genre similarity, scaled by log popularity, so equal genre matches favour movies with more ratings
+GENRE_TIE_BREAK = 0.01
+
+
+@dataclass(frozen=True)
+class NeighbourTable:
     """
-    Loads movies and ratings data from SQLite into Pandas DataFrames.
+    Top-K most similar movies for every movie in the catalog.
+
+    Row i belongs to movie_ids[i]. neighbours holds int32 row positions sorted by
+    descending similarity, scores holds the matching float32 cosine similarities.
     """
-    # Load movies from the movies table
-    movies_df = pd.read_sql("SELECT * FROM movies", con=engine)
-    # Load ratings from the ratings table
-    ratings_df = pd.read_sql("SELECT * FROM ratings", con=engine)
-    
+    movie_ids: np.ndarray
+    neighbours: np.ndarray
+    scores: np.ndarray
+
+
+@dataclass(frozen=True)
+class RatingArrays:
+    """
+    Rating rows as parallel NumPy arrays.
+
+    Columns can be read like DataFrame columns (ratings["movie_id"]), so the model
+    builders accept either.
+    """
+    user_id: np.ndarray
+    movie_id: np.ndarray
+    rating: np.ndarray
+
+    def __getitem__(self, column):
+        return getattr(self, column)
+
+    def __len__(self):
+        return len(self.rating)
+
+
+@dataclass(frozen=True)
+class MovieArrays:
+    """Movie ids, titles and a movies x GENRES uint8 matrix of genre flags as parallel NumPy arrays."""
+    movie_id: np.ndarray
+    title: np.ndarray
+    genres: np.ndarray
+
+    def __getitem__(self, column):
+        return getattr(self, column)
+
+    def __len__(self):
+        return len(self.movie_id)
+
+
+# Stream a query into one preallocated NumPy array per column
+def _read_columns(table, columns, dtypes, chunk_size):
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        cursor.execute(f"SELECT COUNT(*) FROM {table}")
+        count = cursor.fetchone()[0]
+        cursor.close()
+
+        # A server-side cursor on PostgreSQL, otherwise psycopg2 buffers every row client-side
+        cursor = raw.cursor(name=f"load_{table}") if engine.dialect.name == "postgresql" else raw.cursor()
+        cursor.execute(f"SELECT {', '.join(columns)} FROM {table}")
+        arrays = [np.empty(count, dtype=dtype) for dtype in dtypes]
+        filled = 0
+        while rows := cursor.fetchmany(chunk_size):
+            stop = filled + len(rows)
+            # Rows inserted after the count was taken
+            if stop > len(arrays[0]):
+                arrays = [np.concatenate([array, np.empty(stop - len(array), dtype=array.dtype)]) for array in arrays]
+            for array, values in zip(arrays, zip(*rows)):
+                array[filled:stop] = values
+            filled = stop
+        cursor.close()
+        return [array[:filled] for array in arrays]
+    finally:
+        raw.close()
+
+# Function to load data from the database
+@metrics.span("load_data")
+def load_data(as_arrays=False, chunk_size=LOAD_CHUNK_SIZE):
+    """
+    Loads the movie and rating columns the model needs from the database.
+
+    Only user_id, movie_id, rating and movie_id, title and the genre flags are selected.
+    Rows are fetched chunk_size at a time straight into int32/float32/uint8 arrays, so no
+    intermediate object-dtype frame is built.
+
+    Args:
+        as_arrays (bool): return RatingArrays and MovieArrays instead of DataFrames
+        chunk_size (int): rows fetched per round trip
+
+    Returns:
+        tuple: (ratings, movies)
+    """
+    user_ids, movie_ids, values = _read_columns(
+        "ratings", ["user_id", "movie_id", "rating"], [np.int32, np.int32, np.float32], chunk_size)
+    ids, titles, *flags = _read_columns(
+        "movies", ["movie_id", "title", *GENRES], [np.int32, object] + [np.uint8] * len(GENRES), chunk_size)
+
+    if as_arrays:
+        return RatingArrays(user_ids, movie_ids, values), MovieArrays(ids, titles, np.stack(flags, axis=1))
+    ratings_df = pd.DataFrame({"user_id": user_ids, "movie_id": movie_ids, "rating": values}, copy=False)
+    movies_df = pd.DataFrame({"movie_id": ids, "title": titles, **dict(zip(GENRES, flags))}, copy=False)
     return ratings_df, movies_df
 
 # Function to get movies list
@@ -28,8 +134,12 @@ def get_movies_list():
     
     return movies_list
 
-# Calculate cosine similarity matrix
+# Calculate cosine similarity matrix (dense, kept for comparison with the sparse engine)
+@metrics.span("model.build_dense")
 def create_similarity_matrix(ratings):
+    # Imported here so serving a persisted model does not pay for loading scikit-learn
+    from sklearn.metrics.pairwise import cosine_similarity
+
     # Create a pivot table with movies as rows and users as columns
     movie_matrix = ratings.pivot_table(index="movie_id", columns="user_id", values="rating").fillna(0)
     
@@ -41,8 +151,552 @@ def create_similarity_matrix(ratings):
     
     return similarity_df
 
+# Build a sparse movie x user rating matrix
+def build_rating_matrix(ratings, movie_ids=None):
+    """
+    Builds a CSR movie x user matrix straight from the rating rows.
+
+    Args:
+        ratings (DataFrame or RatingArrays): rating rows with user_id, movie_id and rating columns
+        movie_ids (array-like, optional): movie ids in row order. Defaults to the sorted
+            unique movie ids found in ratings. Ratings of other movies are ignored.
+
+    Returns:
+        tuple: (csr_matrix, movie_ids, user_ids)
+    """
+    if movie_ids is None:
+        movie_ids = np.unique(np.asarray(ratings["movie_id"]))
+    movie_ids = np.asarray(movie_ids)
+
+    # Map every rating to its matrix row and column
+    rows = pd.Index(movie_ids).get_indexer(np.asarray(ratings["movie_id"]))
+    user_ids, cols = np.unique(np.asarray(ratings["user_id"]), return_inverse=True)
+    keep = rows >= 0
+
+    matrix = sparse.csr_matrix(
+        (np.asarray(ratings["rating"], dtype=np.float32)[keep], (rows[keep], cols[keep])),
+        shape=(len(movie_ids), len(user_ids)),
+        dtype=np.float32,
+    )
+    return matrix, movie_ids, user_ids
+
+# L2-normalise the rows of a sparse matrix so dot products become cosine similarities
+def normalize_rows(matrix):
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    # Movies without ratings keep an all-zero row
+    inverse = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+    return sparse.diags(inverse.astype(np.float32)) @ matrix
+
+# Top-K columns of every row of a dense similarity block
+def _top_k_rows(block, self_columns, k):
+    """
+    Returns the k best (neighbour, score) pairs of every row of a dense similarity block.
+
+    self_columns gives, for every row, the column of the movie itself, which is excluded.
+    """
+    local_rows = np.arange(block.shape[0])
+    block[local_rows, self_columns] = -np.inf
+
+    # Select the k best columns without sorting the whole row, then order just those.
+    # Negated in place, a negated copy would double the block's memory
+    np.negative(block, out=block)
+    candidates = np.argpartition(block, k - 1, axis=1)[:, :k]
+    candidate_scores = -np.take_along_axis(block, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1, kind="stable")
+    neighbours = np.take_along_axis(candidates, order, axis=1).astype(np.int32)
+    scores = np.take_along_axis(candidate_scores, order, axis=1).astype(np.float32)
+    return neighbours, scores
+
+# Top-K neighbours for one block of rows
+def neighbour_block(normalized, start, stop, top_k=DEFAULT_TOP_K):
+    """
+    Computes the top_k most similar movies for rows start..stop of a normalised matrix.
+
+    Only a (stop - start) x N block of similarities is held in memory at once.
+
+    Returns:
+        tuple: (neighbours int32 array, scores float32 array), both (stop - start) x k
+    """
+    return neighbour_rows(normalized, np.arange(start, stop), top_k)
+
+# Top-K neighbours for an arbitrary set of rows
+def neighbour_rows(normalized, rows, top_k=DEFAULT_TOP_K):
+    """Same as neighbour_block for the given row positions."""
+    k = min(top_k, normalized.shape[0] - 1)
+    if k <= 0:
+        return np.empty((len(rows), 0), dtype=np.int32), np.empty((len(rows), 0), dtype=np.float32)
+
+    block = (normalized[rows] @ normalized.T).toarray()
+    return _top_k_rows(block, rows, k)
+
+# Top-K neighbour table of a rating matrix
+def neighbours_from_matrix(matrix, movie_ids, top_k=DEFAULT_TOP_K, block_size=DEFAULT_BLOCK_SIZE, workers=1):
+    """
+    Builds a NeighbourTable from a movie x user rating matrix, one block of rows at a time.
+
+    With workers > 1 the blocks are computed on a process pool, see myapp.parallel.
+
+    Returns:
+        NeighbourTable: compact top-K neighbour arrays
+    """
+    if workers > 1:
+        from myapp.parallel import parallel_neighbours
+        return parallel_neighbours(matrix, movie_ids, top_k, block_size, workers)
+    normalized = normalize_rows(matrix)
+
+    n_movies = len(movie_ids)
+    k = max(min(top_k, n_movies - 1), 0)
+    neighbours = np.empty((n_movies, k), dtype=np.int32)
+    scores = np.empty((n_movies, k), dtype=np.float32)
+    for start in range(0, n_movies, block_size):
+        stop = min(start + block_size, n_movies)
+        neighbours[start:stop], scores[start:stop] = neighbour_block(normalized, start, stop, k)
+
+    return NeighbourTable(movie_ids=movie_ids, neighbours=neighbours, scores=scores)
+
+# Calculate the top-K cosine neighbours of every movie with the sparse engine
+def create_neighbour_table(ratings, top_k=DEFAULT_TOP_K, block_size=DEFAULT_BLOCK_SIZE, movie_ids=None, workers=1):
+    """
+    Builds a NeighbourTable from rating rows without materialising the N x N matrix.
+
+    Args:
+        ratings (DataFrame): rating rows with user_id, movie_id and rating columns
+        top_k (int): number of neighbours kept per movie
+        block_size (int): number of movies whose similarities are computed at once
+        movie_ids (array-like, optional): movie ids in row order, see build_rating_matrix
+        workers (int): processes computing the blocks, 1 builds in this process
+
+    Returns:
+        NeighbourTable: compact top-K neighbour arrays
+    """
+    matrix, movie_ids, _ = build_rating_matrix(ratings, movie_ids)
+    return neighbours_from_matrix(matrix, movie_ids, top_k, block_size, workers)
+
+# Genre flags of the given movies as a uint8 matrix
+def genre_matrix(movies, movie_ids):
+    """
+    Returns the GENRES flags of movie_ids as a (movies, len(GENRES)) uint8 matrix.
+
+    Args:
+        movies (DataFrame): movie rows with movie_id and the genre columns
+        movie_ids (array-like): movie ids in row order, movies missing from movies get no genre
+
+    Returns:
+        ndarray: the genre matrix, or None if movies has no genre columns
+    """
+    if not set(GENRES).issubset(movies.columns):
+        return None
+    flags = movies.set_index("movie_id")[list(GENRES)].reindex(movie_ids).fillna(0)
+    return (flags.to_numpy() > 0).astype(np.uint8)
+
+# Cosine similarities between the genre vectors of some rows and every movie
+def content_similarity(genres, inverse_norms, rows):
+    """
+    Returns a (len(rows), movies) float32 block of genre cosine similarities.
+
+    The shared genres are counted with a product of 0/1 values, which is exact in float32, and
+    only then scaled, so a movie gets the same score whether it is scored alone or in a batch.
+
+    Args:
+        genres (ndarray): float32 0/1 genre flags of every movie
+        inverse_norms (ndarray): 1 / sqrt(number of genres) of every movie, 0 for movies without one
+        rows (array-like): rows to compare with every movie
+    """
+    shared = genres[rows] @ genres.T
+    return shared * inverse_norms[rows, None] * inverse_norms[None, :]
+
+# Indices of the n largest scores, best first
+def top_n_indices(scores, n):
+    """
+    Returns the positions of the n largest scores in descending order.
+
+    Uses argpartition so only the selected n entries are sorted, not the whole array.
+    """
+    n = min(n, len(scores))
+    if n <= 0:
+        return np.empty(0, dtype=np.intp)
+    candidates = np.argpartition(-scores, n - 1)[:n]
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def top_n_columns(scores, n):
+    """
+    Row-wise top_n_indices for a 2-D score array.
+
+    Returns an (rows, n) array with the column positions of every row's n largest scores,
+    in descending order.
+    """
+    n = min(n, scores.shape[1])
+    if n <= 0:
+        return np.empty((len(scores), 0), dtype=np.intp)
+    candidates = np.argpartition(-scores, n - 1, axis=1)[:, :n]
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+class RecommenderIndex:
+    """
+    Serving-side lookup structure built once at startup.
+
+    Holds title -> row and row -> (movie_id, title) arrays aligned with the rows of a
+    NeighbourTable so a recommendation needs no DataFrame scans.
+
+    With genres, recommendations blend the collaborative score of the neighbour table with
+    the genre cosine similarity, see seed_weights.
+    """
+
+    def __init__(self, neighbour_table, titles, matrix=None, user_ids=None, genres=None):
+        """
+        Args:
+            neighbour_table (NeighbourTable): precomputed top-K neighbours
+            titles (array-like): title of every neighbour table row, "" if unknown
+            matrix (csr_matrix, optional): movie x user rating matrix the table was built from,
+                needed for incremental updates and to find cold-start movies
+            user_ids (array-like, optional): user id of every matrix column
+            genres (ndarray, optional): uint8 movies x GENRES flags, without them recommendations
+                are purely collaborative
+        """
+        self.neighbour_table = neighbour_table
+        self.movie_ids = neighbour_table.movie_ids
+        self.titles = titles
+        self.matrix = matrix
+        self.user_ids = user_ids
+        self.genres = genres
+
+        # Title -> row. On duplicate titles the last row wins
+        self.title_to_row = {str(title): row for row, title in enumerate(titles) if title}
+        self.id_to_row = {int(movie_id): row for row, movie_id in enumerate(self.movie_ids)}
+
+    @classmethod
+    def from_movies(cls, neighbour_table, movies, matrix=None, user_ids=None):
+        """Indexes a neighbour table with the titles and genres from the movies DataFrame."""
+        titles = movies.set_index("movie_id")["title"].reindex(neighbour_table.movie_ids).fillna("")
+        return cls(neighbour_table, titles.to_numpy(dtype=str), matrix, user_ids,
+                   genre_matrix(movies, neighbour_table.movie_ids))
+
+    @classmethod
+    @metrics.span("model.build")
+    def build(cls, ratings, movies, top_k=DEFAULT_TOP_K, block_size=DEFAULT_BLOCK_SIZE,
+              similarity="exact", n_lists=None, n_probe=None, workers=1):
+        """
+        Builds the neighbour table from rating rows and indexes it.
+
+        similarity picks the engine: "exact" compares every pair of movies, block_size rows at
+        a time on workers processes, "ivf" uses the approximate index in myapp.ann with n_lists
+        lists and n_probe probes per movie.
+        """
+        matrix, movie_ids, user_ids = build_rating_matrix(ratings)
+        if similarity == "ivf":
+            from myapp.ann import ivf_neighbours
+            neighbour_table = ivf_neighbours(matrix, movie_ids, top_k, n_lists, n_probe)
+        elif similarity == "exact":
+            neighbour_table = neighbours_from_matrix(matrix, movie_ids, top_k, block_size, workers)
+        else:
+            raise ValueError(f"Unknown similarity engine: {similarity}")
+        return cls.from_movies(neighbour_table, movies, matrix, user_ids)
+
+    @cached_property
+    def title_index(self):
+        """Sorted TitleIndex over this model's titles, built on first use."""
+        return TitleIndex(self.titles, self.movie_ids)
+
+    @cached_property
+    @metrics.span("model.title_resolver")
+    def title_resolver(self):
+        """Trigram TitleResolver over this model's titles, built on first use."""
+        return TitleResolver(self.titles, self.movie_ids)
+
+    @cached_property
+    def has_title(self):
+        """Boolean mask of the rows with a title, the only ones ever recommended."""
+        return np.asarray(self.titles) != ""
+
+    @cached_property
+    def genre_vectors(self):
+        """Float32 copy of the genre flags and their inverse L2 norms, built on first use."""
+        genres = np.asarray(self.genres, dtype=np.float32)
+        norms = np.sqrt(genres.sum(axis=1))
+        return genres, np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+
+    @cached_property
+    def rating_counts(self):
+        """Number of ratings of every movie, None without a rating matrix."""
+        return None if self.matrix is None else np.diff(self.matrix.indptr)
+
+    @cached_property
+    def popularity(self):
+        """log(1 + ratings) of every movie scaled to [0, 1], zeros without a rating matrix."""
+        if self.rating_counts is None or not self.rating_counts.any():
+            return np.zeros(len(self.movie_ids), dtype=np.float32)
+        return (np.log1p(self.rating_counts) / np.log1p(self.rating_counts.max())).astype(np.float32)
+
+    def seed_weights(self, rows, content_weight=0.0, cold_start_ratings=COLD_START_RATINGS):
+        """
+        Share of the collaborative score in the hybrid score of every seed row.
+
+        A seed gets (1 - content_weight), scaled down linearly when it has fewer than
+        cold_start_ratings ratings, so a movie with few co-ratings falls back to its genres. The
+        genre similarity gets the rest. Without genres every seed is purely collaborative.
+
+        Returns:
+            ndarray: float32 weights in [0, 1], one per row
+        """
+        rows = np.asarray(rows, dtype=np.intp)
+        if self.genres is None:
+            return np.ones(len(rows), dtype=np.float32)
+        weights = np.full(len(rows), 1.0 - content_weight, dtype=np.float32)
+        if self.rating_counts is not None and cold_start_ratings > 0:
+            weights *= np.minimum(self.rating_counts[rows] / cold_start_ratings, 1.0).astype(np.float32)
+        return weights
+
+    def _hybrid_scores(self, rows, weights):
+        """
+        Dense (len(rows), movies) hybrid scores: weight * collaborative + (1 - weight) * genre similarity.
+
+        Movies outside a seed's stored neighbours have no collaborative score and are ranked by
+        their genre similarity alone; seeds with weight 1 only rank their neighbours.
+        """
+        neighbours = self.neighbour_table.neighbours[rows]
+        content = content_similarity(*self.genre_vectors, rows) + GENRE_TIE_BREAK * self.popularity
+        scores = (1.0 - weights)[:, None] * content
+        scores[weights >= 1.0] = -np.inf
+
+        # Blend in the neighbour table, skipping the -1 padding slots
+        seed_idx, slot_idx = np.nonzero(neighbours >= 0)
+        cols = neighbours[seed_idx, slot_idx]
+        seed_weight = weights[seed_idx]
+        scores[seed_idx, cols] = (seed_weight * self.neighbour_table.scores[rows][seed_idx, slot_idx]
+                                  + (1.0 - seed_weight) * content[seed_idx, cols])
+        scores[np.arange(len(rows)), rows] = -np.inf
+        scores[:, ~self.has_title] = -np.inf
+        return scores
+
+    def candidates(self, row, n, content_weight=0.0, cold_start_ratings=COLD_START_RATINGS):
+        """
+        The n best scored movies for one seed row, best first.
+
+        Returns:
+            tuple: (rows, scores) arrays, shorter than n when fewer movies have a score
+        """
+        weights = self.seed_weights([row], content_weight, cold_start_ratings)
+        if weights[0] < 1.0:
+            # Hybrid: one top-n pass over the blended scores of every movie
+            scores = self._hybrid_scores(np.array([row]), weights)[0]
+            top = top_n_indices(scores, n)
+            top = top[scores[top] > -np.inf]
+            return top, scores[top]
+
+        slots = top_n_indices(self.neighbour_table.scores[row], n)
+        rows = self.neighbour_table.neighbours[row][slots]
+        # -1 marks padding slots of rows with fewer than K neighbours
+        keep = rows >= 0
+        keep[keep] = self.has_title[rows[keep]]
+        return rows[keep], self.neighbour_table.scores[row][slots][keep]
+
+    def recommend(self, movie_title, top_n=4, content_weight=0.0, cold_start_ratings=COLD_START_RATINGS,
+                  reranker=None):
+        """
+        Given a movie title, return top_n recommended movies.
+
+        content_weight and cold_start_ratings set the share of genre similarity, see seed_weights.
+        A reranker (see myapp.reranking) picks the top_n from a larger pool of candidates.
+
+        Returns:
+            list: (movie_id, title) tuples, or None if the title is unknown
+        """
+        row = self.title_to_row.get(movie_title)
+        if row is None:
+            return None
+
+        if reranker is None:
+            rows, _ = self.candidates(row, top_n, content_weight, cold_start_ratings)
+        else:
+            rows, scores = self.candidates(row, reranker.pool_size(top_n), content_weight, cold_start_ratings)
+            rows = reranker.rerank(self, rows, scores, top_n)
+        return [(int(self.movie_ids[r]), str(self.titles[r])) for r in rows]
+
+    def rows_for(self, titles=(), movie_ids=()):
+        """Maps titles, then movie ids, to neighbour table rows. Unknown entries map to None."""
+        return [self.title_to_row.get(title) for title in titles] + [self.id_to_row.get(int(movie_id)) for movie_id in movie_ids]
+
+    def recommend_batch(self, rows, top_n=4, exclude_rows=(), content_weight=0.0,
+                        cold_start_ratings=COLD_START_RATINGS, reranker=None):
+        """
+        Recommends for many seed movies in one vectorized pass over the neighbour table.
+
+        Seeds with a genre share (see seed_weights) are scored against every movie instead, all
+        of them in one block with one top-n pass.
+
+        Args:
+            rows (array-like): neighbour table rows of the seed movies
+            top_n (int): recommendations per seed
+            exclude_rows (array-like): rows never recommended, for any seed
+            content_weight (float): share of genre similarity, see seed_weights
+            cold_start_ratings (int): ratings below which a seed falls back to its genres
+            reranker (Reranker, optional): picks every seed's top_n from a larger candidate pool
+
+        Returns:
+            list: one list of (movie_id, title) tuples per seed row
+        """
+        n = top_n if reranker is None else reranker.pool_size(top_n)
+        picks = self._candidate_batch(np.asarray(rows, dtype=np.intp), n, exclude_rows, content_weight,
+                                      cold_start_ratings)
+        if reranker is not None:
+            picks = [reranker.rerank(self, seed_rows, seed_scores, top_n) for seed_rows, seed_scores in picks]
+        else:
+            picks = [seed_rows for seed_rows, _ in picks]
+        return [[(int(self.movie_ids[r]), str(self.titles[r])) for r in seed_rows] for seed_rows in picks]
+
+    def _candidate_batch(self, rows, top_n, exclude_rows, content_weight, cold_start_ratings):
+        # (rows, scores) of the top_n candidates of every seed, best first
+        recs = self._neighbour_batch(rows, top_n, exclude_rows)
+
+        # Seeds that lean on their genres are rescored over every movie, in one block
+        weights = self.seed_weights(rows, content_weight, cold_start_ratings)
+        hybrid = np.flatnonzero(weights < 1.0)
+        if len(hybrid):
+            scores = self._hybrid_scores(rows[hybrid], weights[hybrid])
+            if len(exclude_rows):
+                scores[:, np.asarray(exclude_rows, dtype=np.intp)] = -np.inf
+            picked = top_n_columns(scores, top_n)
+            picked_scores = np.take_along_axis(scores, picked, axis=1)
+            keep = picked_scores > -np.inf
+            for i, seed_rows, seed_scores, seed_keep in zip(hybrid, picked, picked_scores, keep):
+                recs[i] = (seed_rows[seed_keep], seed_scores[seed_keep])
+        return recs
+
+    def _neighbour_batch(self, rows, top_n, exclude_rows):
+        # Purely collaborative recommend_batch: one top-n pass over the stored neighbours
+        neighbours = self.neighbour_table.neighbours[rows]
+        # Copy, the table may be memory-mapped read-only
+        scores = np.array(self.neighbour_table.scores[rows], dtype=np.float32)
+
+        # Mask padding slots, rows without a title and the excluded movies
+        valid = neighbours >= 0
+        valid &= self.has_title[np.where(valid, neighbours, 0)]
+        if len(exclude_rows):
+            valid &= ~np.isin(neighbours, np.asarray(exclude_rows, dtype=neighbours.dtype))
+        scores[~valid] = -np.inf
+
+        top = top_n_columns(scores, top_n)
+        picked = np.take_along_axis(neighbours, top, axis=1)
+        picked_scores = np.take_along_axis(scores, top, axis=1)
+        keep = picked_scores > -np.inf
+        return [(seed_rows[seed_keep], seed_scores[seed_keep])
+                for seed_rows, seed_scores, seed_keep in zip(picked, picked_scores, keep)]
+
+# Append the values not present yet, keeping the existing order
+def _append_new(existing, values):
+    values = pd.unique(np.asarray(values))
+    new = values[~np.isin(values, existing)].astype(existing.dtype)
+    return np.concatenate([existing, new]) if len(new) else np.asarray(existing)
+
+# Fold new ratings into an index without a full rebuild
+@metrics.span("model.update")
+def update_index(index, new_ratings, new_titles=None, new_genres=None):
+    """
+    Returns a new RecommenderIndex with new_ratings folded in, without rebuilding the N x N similarities.
+
+    Only the similarities of the movies whose rating vector changed are recomputed, and only the
+    neighbour lists those movies enter or leave are touched. A list that loses an entry it cannot
+    replace from its stored candidates is recomputed in full. The given index is not modified, so
+    readers holding it keep a consistent model.
+
+    Args:
+        index (RecommenderIndex): index that keeps its rating matrix
+        new_ratings (DataFrame): user_id, movie_id and rating rows to insert or overwrite
+        new_titles (dict, optional): movie_id -> title for movies not in the index yet
+        new_genres (dict, optional): movie_id -> GENRES flags for movies not in the index yet
+
+    Returns:
+        RecommenderIndex: the updated index
+    """
+    if index.matrix is None:
+        raise ValueError("The index was built without its rating matrix and cannot be updated.")
+    table = index.neighbour_table
+    new_titles = new_titles or {}
+    new_genres = new_genres or {}
+    n_old = len(table.movie_ids)
+    k = table.neighbours.shape[1]
+
+    # New movies become new rows and new users new columns, appended at the end
+    movie_ids = _append_new(table.movie_ids, new_ratings["movie_id"])
+    user_ids = _append_new(index.user_ids, new_ratings["user_id"])
+    titles = np.concatenate([np.asarray(index.titles, dtype=str),
+                             np.asarray([new_titles.get(mid, "") for mid in movie_ids[n_old:]], dtype=str)])
+    genres = None
+    if index.genres is not None:
+        genres = np.concatenate([np.asarray(index.genres, dtype=np.uint8),
+                                 np.asarray([new_genres.get(mid, [0] * len(GENRES)) for mid in movie_ids[n_old:]],
+                                            dtype=np.uint8).reshape(-1, len(GENRES))])
+    n_movies, n_users = len(movie_ids), len(user_ids)
+
+    # Rating matrix with the new entries replacing existing ones for the same (movie, user)
+    new_entries = pd.DataFrame({
+        "row": pd.Index(movie_ids).get_indexer(new_ratings["movie_id"]),
+        "col": pd.Index(user_ids).get_indexer(new_ratings["user_id"]),
+        "rating": new_ratings["rating"].to_numpy(dtype=np.float32),
+    }).drop_duplicates(["row", "col"], keep="last")
+    old = index.matrix.tocoo()
+    keep = ~np.isin(old.row.astype(np.int64) * n_users + old.col,
+                    new_entries["row"].to_numpy(np.int64) * n_users + new_entries["col"].to_numpy())
+    matrix = sparse.csr_matrix(
+        (np.concatenate([old.data[keep], new_entries["rating"]]),
+         (np.concatenate([old.row[keep], new_entries["row"]]), np.concatenate([old.col[keep], new_entries["col"]]))),
+        shape=(n_movies, n_users), dtype=np.float32)
+
+    # Lists that hold every other movie cannot be extended incrementally, tiny catalogs are simply rebuilt
+    if k >= n_old - 1:
+        neighbour_table = neighbours_from_matrix(matrix, movie_ids, max(k, DEFAULT_TOP_K))
+        return _keep_title_indexes(index, RecommenderIndex(neighbour_table, titles, matrix, user_ids, genres))
+
+    normalized = normalize_rows(matrix)
+    neighbours = np.full((n_movies, k), -1, dtype=np.int32)
+    scores = np.full((n_movies, k), -np.inf, dtype=np.float32)
+    neighbours[:n_old] = table.neighbours
+    scores[:n_old] = table.scores
+
+    # Movies whose rating vector changed get their whole row recomputed
+    changed = np.unique(new_entries["row"].to_numpy())
+    changed_sims = (normalized[changed] @ normalized.T).toarray()
+    neighbours[changed], scores[changed] = _top_k_rows(changed_sims.copy(), changed, k)
+
+    # Other lists change only if they hold a changed movie or a changed movie now beats their K-th entry
+    others = np.setdiff1d(np.arange(n_old), changed)
+    sims_to_changed = changed_sims[:, others].T
+    touches = np.isin(neighbours[others], changed)
+    kth_score = scores[others, -1]
+    affected = touches.any(axis=1) | (sims_to_changed > kth_score[:, None]).any(axis=1)
+    rows = others[affected]
+    if len(rows):
+        touched = touches[affected]
+        candidates = np.concatenate(
+            [np.where(touched, -1, neighbours[rows]), np.broadcast_to(changed, (len(rows), len(changed)))], axis=1)
+        candidate_scores = np.concatenate(
+            [np.where(touched, -np.inf, scores[rows]), sims_to_changed[affected]], axis=1)
+        order = np.argsort(-candidate_scores, axis=1, kind="stable")[:, :k]
+        neighbours[rows] = np.take_along_axis(candidates, order, axis=1)
+        scores[rows] = np.take_along_axis(candidate_scores, order, axis=1)
+
+        # A list whose K-th score dropped may be missing a movie that was never stored, recompute it
+        incomplete = rows[scores[rows, -1] < kth_score[affected]]
+        if len(incomplete):
+            neighbours[incomplete], scores[incomplete] = neighbour_rows(normalized, incomplete, k)
+
+    neighbour_table = NeighbourTable(movie_ids=movie_ids, neighbours=neighbours, scores=scores)
+    return _keep_title_indexes(index, RecommenderIndex(neighbour_table, titles, matrix, user_ids, genres))
+
+
+def _keep_title_indexes(old, new):
+    # Rating-only updates keep the titles, so the new index reuses the title indexes already built
+    if len(new.movie_ids) == len(old.movie_ids):
+        for name in ("title_index", "title_resolver"):
+            if name in old.__dict__:
+                new.__dict__[name] = old.__dict__[name]
+    return new
+
 # Make recommendations
-def get_recommendations(movie_title, movies, similarity_df, top_n=4):
+def get_recommendations(movie_title, movies, neighbour_table, top_n=4):
     """
     Given a movie title, return top_n recommended movies.
     """
@@ -55,15 +709,16 @@ def get_recommendations(movie_title, movies, similarity_df, top_n=4):
     # Lookup movie_id for the given movie name
     movie_id = movie_lookup[movie_title]
     
-    if movie_id not in similarity_df.index:
+    row_lookup = pd.Index(neighbour_table.movie_ids)
+    if movie_id not in row_lookup:
         return "Movie not found."
     
-    # Retrieve similarity scores for the given movie
-    scores = similarity_df[movie_id]
-    
-    # Sort scores in descending order. Exclude the movie itself.
-    sorted_scores = scores.sort_values(ascending=False)
-    similar_movie_ids = sorted_scores.index[1:top_n+1].tolist()
+    # Neighbours are stored sorted by descending similarity and exclude the movie itself.
+    # Short rows (IVF tables, incremental updates) are padded with -1 at the end
+    row = row_lookup.get_loc(movie_id)
+    neighbour_rows = neighbour_table.neighbours[row, :top_n]
+    neighbour_rows = neighbour_rows[neighbour_rows >= 0]
+    similar_movie_ids = neighbour_table.movie_ids[neighbour_rows].tolist()
     
     # Map movie_ids back to movie titles for the recommendations
     id_to_title = movies.set_index("movie_id")["title"].to_dict()
@@ -74,8 +729,8 @@ def get_recommendations(movie_title, movies, similarity_df, top_n=4):
 # Test
 # if __name__ == "__main__":
 #     ratings, movies = load_data()
-#     similarity_df = create_similarity_matrix(ratings)
+#     neighbour_table = create_neighbour_table(ratings)
 #     test_movie = str.lower("back to the future")  # Change this to a title that exists in your database
-#     recs = get_recommendations(test_movie, ratings, movies, similarity_df)
+#     recs = get_recommendations(test_movie, movies, neighbour_table)
 #     print(f"Recommendations for '{test_movie}': {recs}")
 
@@ -0,0 +1,247 @@
+# Imports
+import logging
+import threading
+import numpy as np
+from sqlalchemy import select
+from myapp import metrics
+from myapp.models import ClickStats
+from myapp.recommender import top_n_indices
+
+logger = logging.getLogger(__name__)
+
+# Candidates scored per recommendation shown, the reranker picks top_n out of top_n * this
+DEFAULT_POOL_FACTOR = 5
+# Impressions a movie needs before its own click rate outweighs the global one
+DEFAULT_PRIOR_SHOWN = 20
+
+
+def relevance(scores):
+    """Candidate scores scaled to [0, 1] within the pool, so the adjustments share one scale."""
+    scores = np.asarray(scores, dtype=np.float32)
+    if not len(scores):
+        return scores
+    low, high = scores.min(), scores.max()
+    if high - low <= 0:
+        return np.ones_like(scores)
+    return (scores - low) / (high - low)
+
+
+def mmr(index, rows, relevance, top_n, diversity):
+    """
+    Maximal marginal relevance: picks top_n of the candidate rows one at a time, each time the
+    one maximizing (1 - diversity) * relevance - diversity * (highest genre cosine similarity
+    to a movie picked before).
+
+    Args:
+        index (RecommenderIndex): index the rows belong to, for its genre vectors
+        rows (ndarray): candidate rows, best first
+        relevance (ndarray): relevance of every candidate in [0, 1]
+        top_n (int): rows picked
+        diversity (float): 0 ranks by relevance alone, 1 by novelty alone
+
+    Returns:
+        ndarray: the picked rows, in pick order
+    """
+    top_n = min(top_n, len(rows))
+    if top_n <= 0:
+        return rows[:0]
+    genres, inverse_norms = index.genre_vectors
+    # Genre cosine similarities within the pool, a pool x pool block
+    vectors = genres[rows] * inverse_norms[rows, None]
+    similarity = vectors @ vectors.T
+
+    gain = (1.0 - diversity) * relevance
+    picked = [int(np.argmax(gain))]
+    closest = similarity[picked[0]].copy()
+    available = np.ones(len(rows), dtype=bool)
+    available[picked[0]] = False
+    while len(picked) < top_n:
+        scores = np.where(available, gain - diversity * closest, -np.inf)
+        pick = int(np.argmax(scores))
+        picked.append(pick)
+        available[pick] = False
+        np.maximum(closest, similarity[pick], out=closest)
+    return rows[picked]
+
+
+class PopularityPenalty:
+    """Lowers the relevance of widely rated movies: weight * log popularity in [0, 1] is subtracted."""
+
+    def __init__(self, weight):
+        self.weight = weight
+
+    def adjust(self, index, rows, relevance):
+        return relevance - self.weight * index.popularity[rows]
+
+
+class CtrBoost:
+    """
+    Raises the relevance of movies clicked more often than average when recommended, and lowers
+    it for those clicked less: weight * click-rate lift, read from a ClickStatsSnapshot.
+    """
+
+    def __init__(self, snapshot, weight):
+        self.snapshot = snapshot
+        self.weight = weight
+
+    def adjust(self, index, rows, relevance):
+        return relevance + self.weight * self.snapshot.lift(index.movie_ids[rows])
+
+
+class Reranker:
+    """
+    Re-ranking stage run over a larger candidate pool than the recommendations shown.
+
+    The candidate scores are scaled to [0, 1], every adjuster (any object with an
+    adjust(index, rows, relevance) method returning new relevances) is applied in order, and the
+    top_n rows are picked by relevance, or by maximal marginal relevance over the genre vectors
+    when diversity is above 0.
+    """
+
+    def __init__(self, adjusters=(), diversity=0.0, pool_factor=DEFAULT_POOL_FACTOR):
+        """
+        Args:
+            adjusters (list): relevance adjustments, e.g. PopularityPenalty and CtrBoost
+            diversity (float): MMR trade-off in [0, 1], 0 skips MMR
+            pool_factor (int): candidates scored per recommendation shown
+        """
+        self.adjusters = list(adjusters)
+        self.diversity = diversity
+        self.pool_factor = pool_factor
+
+    def pool_size(self, top_n):
+        """Candidates fetched for top_n recommendations."""
+        return top_n * max(1, self.pool_factor)
+
+    def rerank(self, index, rows, scores, top_n):
+        """
+        Picks top_n of the candidates.
+
+        Args:
+            index (RecommenderIndex): index the rows belong to
+            rows (ndarray): candidate rows, best first
+            scores (ndarray): their scores from the recommender
+            top_n (int): rows returned
+
+        Returns:
+            ndarray: the picked rows, best first
+        """
+        with metrics.span("score.rerank"):
+            weights = relevance(scores)
+            for adjuster in self.adjusters:
+                weights = adjuster.adjust(index, rows, weights)
+            if self.diversity > 0 and index.genres is not None:
+                return mmr(index, rows, weights, top_n, self.diversity)
+            return rows[top_n_indices(weights, top_n)]
+
+
+def make_reranker(diversity=0.0, popularity=0.0, ctr=0.0, snapshot=None, pool_factor=DEFAULT_POOL_FACTOR):
+    """
+    Builds the Reranker for the given stage weights.
+
+    Returns:
+        Reranker: the stage, or None when every weight is 0 and the raw ranking is kept
+    """
+    adjusters = []
+    if popularity:
+        adjusters.append(PopularityPenalty(popularity))
+    if ctr and snapshot is not None:
+        adjusters.append(CtrBoost(snapshot, ctr))
+    if not adjusters and diversity <= 0:
+        return None
+    return Reranker(adjusters, diversity, pool_factor)
+
+
+class ClickStatsSnapshot:
+    """
+    In-memory copy of the click_stats counters, reloaded by a background thread every
+    interval seconds, so re-ranking by click rate costs no query per request.
+
+    Click rates are smoothed towards the global one with prior_shown virtual impressions,
+    so a movie shown twice and clicked once does not jump to the top.
+    """
+
+    def __init__(self, engine, interval=30.0, prior_shown=DEFAULT_PRIOR_SHOWN, on_refresh=None):
+        """
+        Args:
+            engine (Engine): database the counters are read from
+            interval (float): seconds between two reloads
+            prior_shown (float): virtual impressions at the global click rate added to every movie
+            on_refresh (callable, optional): called with the snapshot after every reload
+        """
+        self.engine = engine
+        self.interval = interval
+        self.prior_shown = prior_shown
+        self.on_refresh = on_refresh
+        # (sorted movie ids, their click-rate lifts), swapped as one tuple
+        self._lifts = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32))
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def refresh(self):
+        """
+        Reloads the counters.
+
+        Returns:
+            int: number of movies with counters
+        """
+        with metrics.span("db.read.click_stats_snapshot"), self.engine.connect() as conn:
+            rows = conn.execute(select(ClickStats.movie_id, ClickStats.clicks, ClickStats.recommendations_shown)
+                                .order_by(ClickStats.movie_id)).all()
+        counts = np.array(rows, dtype=np.float64).reshape(-1, 3)
+        movie_ids, clicks, shown = counts[:, 0].astype(np.int64), counts[:, 1], counts[:, 2]
+        # Clicks can outnumber impressions when the buffered impressions lag behind, cap the rate at 1
+        clicks = np.minimum(clicks, shown)
+        lifts = np.zeros(len(movie_ids), dtype=np.float32)
+        if shown.sum() > 0 and clicks.sum() > 0:
+            overall = clicks.sum() / shown.sum()
+            smoothed = (clicks + self.prior_shown * overall) / (shown + self.prior_shown)
+            # Relative to the global rate, clipped so one outlier cannot dominate the relevance
+            lifts = np.clip(smoothed / overall - 1.0, -1.0, 1.0).astype(np.float32)
+        self._lifts = (movie_ids, lifts)
+        if self.on_refresh is not None:
+            self.on_refresh(self)
+        return len(movie_ids)
+
+    def lift(self, movie_ids):
+        """Smoothed click rate of every movie relative to the global one, minus 1; 0 without counters."""
+        known, lifts = self._lifts
+        movie_ids = np.asarray(movie_ids, dtype=np.int64)
+        if not len(known):
+            return np.zeros(len(movie_ids), dtype=np.float32)
+        found = np.minimum(np.searchsorted(known, movie_ids), len(known) - 1)
+        return np.where(known[found] == movie_ids, lifts[found], 0.0).astype(np.float32)
+
+    def start(self):
+        """Loads the counters once, then starts the background reload thread."""
+        try:
+            self.refresh()
+        except Exception:
+            logger.exception("Failed to load click stats snapshot")
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="click-stats-snapshot", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the background thread."""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            if self._stopping.is_set():
+                break
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("Failed to refresh click stats snapshot")
+
+'''
+Python file with the re-ranking stage behind /recommend/: MMR over genres, a popularity penalty and a click-rate boost
+'''
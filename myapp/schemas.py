@@ -1,26 +1,39 @@
 # file to create schemas for the API
-from pydantic import BaseModel
+from typing import Optional
+from pydantic import BaseModel, Field
 
 class MovieCreate(BaseModel):
-    movie_id: int
-    title: str
-    release_date: str
-    unknown: int
-    action: int
-    adventure: int
-    animation: int
-    children: int
-    comedy: int
-    crime: int
-    documentary: int
-    drama: int
-    fantasy: int
-    filmnoir: int
-    horror: int
-    musical: int
-    mystery: int
-    romance: int
-    scifi: int
-    thriller: int
-    war: int
-    western: int
+    # Allocated by the database, /movies/bulk rejects rows that set it
+    movie_id: Optional[int] = None
+    title: str = Field(min_length=1)
+    release_date: str = ""
+    unknown: int = 0
+    action: int = 0
+    adventure: int = 0
+    animation: int = 0
+    children: int = 0
+    comedy: int = 0
+    crime: int = 0
+    documentary: int = 0
+    drama: int = 0
+    fantasy: int = 0
+    filmnoir: int = 0
+    horror: int = 0
+    musical: int = 0
+    mystery: int = 0
+    romance: int = 0
+    scifi: int = 0
+    thriller: int = 0
+    war: int = 0
+    western: int = 0
+    # Seed rating stored for user 999, as /add_movie/ does; without one the movie is only
+    # recommended after the next model build that sees a rating of it
+    user_rating: Optional[float] = None
+
+
+class RecommendBatchRequest(BaseModel):
+    titles: list[str] = []
+    movie_ids: list[int] = []
+    top_n: int = Field(4, ge=1, le=100)
+    exclude_titles: list[str] = []
+    exclude_ids: list[int] = []
@@ -0,0 +1,76 @@
+# Imports
+import threading
+
+_index = None
+# Artifact version _index was loaded from, None when it was built in this process
+_version = None
+# Factorization model for per-user recommendations, None when disabled
+_user_model = None
+# Serialises writers so two updates never start from the same old model
+_write_lock = threading.Lock()
+# Called with the new model after every publish/update, e.g. to drop cached results
+_listeners = []
+
+
+def current():
+    """Returns the RecommenderIndex being served."""
+    return _index
+
+
+def current_version():
+    """Returns the artifact version being served, None if the model was built in this process."""
+    return _version
+
+
+def publish(index, version=None):
+    """Replaces the served model, loaded from artifact version if given."""
+    global _index, _version
+    with _write_lock:
+        _index, _version = index, version
+        _notify(index)
+
+
+def update(fn):
+    """
+    Applies fn to the served model and publishes the result.
+
+    Args:
+        fn (callable): takes the current RecommenderIndex and returns a new one
+
+    Returns:
+        RecommenderIndex: the published model
+    """
+    global _index
+    with _write_lock:
+        _index = fn(_index)
+        _notify(_index)
+        return _index
+
+
+def add_listener(fn):
+    """Registers fn to be called with the new RecommenderIndex whenever the served model changes."""
+    _listeners.append(fn)
+
+
+def _notify(index):
+    for fn in _listeners:
+        fn(index)
+
+
+def current_user_model():
+    """Returns the UserRecommender being served, or None."""
+    return _user_model
+
+
+def publish_user_model(model):
+    """Replaces the served user model."""
+    global _user_model
+    _user_model = model
+
+'''
+Python file holding the model the API currently serves.
+
+Readers take one reference with current() and use it for the whole request. Writers build
+a complete new model and publish it with a single assignment, so a request never sees a
+half-updated model.
+'''
@@ -0,0 +1,283 @@
+# Imports
+import math
+import re
+import unicodedata
+from dataclasses import dataclass
+import numpy as np
+
+# Sorts after every character, closes the range of titles starting with a prefix
+_PREFIX_END = "\U0010ffff"
+# Articles dropped from the start of a title, or its end after a comma as in "abyss, the"
+_ARTICLES = "the|a|an|la|le|les|il|el|das|der|die"
+_LEADING_ARTICLE = re.compile(rf"^(?:{_ARTICLES})\s+")
+_TRAILING_ARTICLE = re.compile(rf",\s*(?:{_ARTICLES})$")
+# Bracketed parts, a release year "(1995)" or an alternative title "(id4)"
+_BRACKETED = re.compile(r"\([^)]*\)")
+_NON_WORD = re.compile(r"[\W_]+")
+# Code points fit in 21 bits, so a trigram packs into one int64
+_CODE_BITS = 21
+# Dice similarity a typo of a title usually keeps, candidates are looked for above it first
+SIMILARITY_FLOOR = 0.5
+
+
+class TitleIndex:
+    """
+    Movie titles sorted by their lowercase form, for prefix search.
+
+    A prefix maps to one contiguous slice of the sorted keys, found with two binary searches,
+    so a lookup is O(log n) plus the size of the returned page.
+    """
+
+    def __init__(self, titles, movie_ids):
+        """
+        Args:
+            titles (array-like): movie titles, "" for rows without a title
+            movie_ids (array-like): movie id of every title
+        """
+        titles = np.asarray(titles, dtype=str)
+        keys = np.char.lower(titles)
+        present = np.flatnonzero(keys != "")
+        order = present[np.argsort(keys[present], kind="stable")]
+        self.keys = keys[order]
+        self.titles = titles[order]
+        self.movie_ids = np.asarray(movie_ids)[order]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def prefix_range(self, prefix):
+        """Returns (start, stop) of the titles starting with prefix, case-insensitive."""
+        prefix = prefix.lower()
+        start = int(np.searchsorted(self.keys, prefix, side="left"))
+        stop = int(np.searchsorted(self.keys, prefix + _PREFIX_END, side="left"))
+        return start, stop
+
+    def search(self, prefix, offset=0, limit=20):
+        """
+        One page of the titles starting with prefix, in alphabetical order.
+
+        Args:
+            prefix (str): start of the title, "" matches every title
+            offset (int): matches to skip
+            limit (int): most matches returned
+
+        Returns:
+            tuple: (total number of matches, list of (movie_id, title) pairs)
+        """
+        start, stop = self.prefix_range(prefix)
+        page = slice(min(start + offset, stop), min(start + offset + limit, stop))
+        return stop - start, [(int(movie_id), str(title)) for movie_id, title in zip(self.movie_ids[page], self.titles[page])]
+
+
+def normalize_title(title):
+    """
+    Key a title is matched on: lowercase, without accents, punctuation, bracketed parts (years,
+    alternative titles) or a leading or trailing article, with single spaces. "The Abyss (1989)"
+    and "abyss, the" both become "abyss".
+    """
+    title = title.lower()
+    if not title.isascii():
+        title = "".join(char for char in unicodedata.normalize("NFKD", title) if not unicodedata.combining(char))
+    title = _BRACKETED.sub(" ", title).strip()
+    title = _TRAILING_ARTICLE.sub("", _LEADING_ARTICLE.sub("", title))
+    return _NON_WORD.sub(" ", title).strip()
+
+
+def _trigrams(key):
+    # Packed trigrams of a key padded like pg_trgm, so short keys and word starts get trigrams too
+    codes = [ord(char) for char in f"  {key} "]
+    return {(a << 2 * _CODE_BITS) | (b << _CODE_BITS) | c for a, b, c in zip(codes, codes[1:], codes[2:])}
+
+
+def edit_distance(a, b, max_distance):
+    """
+    Optimal string alignment distance of a and b (insertions, deletions, substitutions and
+    swaps of adjacent characters), computed only within max_distance of the diagonal.
+
+    Returns:
+        int: the distance, or max_distance + 1 once it is known to be larger
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    if len(a) > len(b):
+        a, b = b, a
+    over = max_distance + 1
+    before, previous = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [over] * (len(b) + 1)
+        current[0] = i if i <= max_distance else over
+        char, last = a[i - 1], a[i - 2] if i > 1 else None
+        lowest = current[0]
+        # Plain comparisons instead of min(), this loop is the hot part of a resolve
+        for j in range(max(1, i - max_distance), min(len(b), i + max_distance) + 1):
+            value = previous[j - 1] + (char != b[j - 1])
+            if previous[j] + 1 < value:
+                value = previous[j] + 1
+            if current[j - 1] + 1 < value:
+                value = current[j - 1] + 1
+            if j > 1 and char == b[j - 2] and last == b[j - 1] and before[j - 2] + 1 < value:
+                value = before[j - 2] + 1
+            current[j] = value
+            if value < lowest:
+                lowest = value
+        if lowest > max_distance:
+            return over
+        before, previous = previous, current
+    return min(previous[-1], over)
+
+
+@dataclass
+class TitleMatch:
+    movie_id: int
+    title: str
+    # Edit distance of the normalized keys (max_distance + 1 for every title further away than
+    # max_distance), and the trigram (Dice) similarity in [0, 1]
+    distance: int
+    similarity: float
+
+
+class TitleResolver:
+    """
+    Resolves mistyped titles to movies through a trigram index of the normalized titles.
+
+    Every normalized title is cut into character trigrams, stored as an inverted index: the
+    sorted distinct trigrams and, per trigram, the titles containing it (CSR layout, built with
+    numpy only). A query counts the trigrams it shares with every title through one bincount
+    over the postings of its own trigrams, keeps the pool titles with the highest Dice
+    similarity and ranks those by edit distance, computed within max_distance only.
+    """
+
+    def __init__(self, titles, movie_ids, pool=16, min_similarity=0.2):
+        """
+        Args:
+            titles (array-like): movie titles, "" for rows without a title
+            movie_ids (array-like): movie id of every title
+            pool (int): titles ranked by edit distance per query
+            min_similarity (float): Dice similarity below which a title is never a candidate
+        """
+        self.pool = pool
+        self.min_similarity = min_similarity
+        # Titles stay Python strings, a fixed-width array would pad them all to the longest one
+        titles = np.asarray([str(title) for title in titles], dtype=object)
+        rows = np.flatnonzero(titles != "")
+        self.titles = titles[rows]
+        self.movie_ids = np.asarray(movie_ids)[rows]
+        self.keys = [normalize_title(title) for title in self.titles]
+        # Exact key -> positions, for titles typed right up to case, punctuation and articles
+        self.exact = {}
+        for position, key in enumerate(self.keys):
+            self.exact.setdefault(key, []).append(position)
+
+        # Code points of all padded keys in one array, the trigram starting at every position, and
+        # of those the ones that end inside the key they start in
+        padded = [f"  {key} " for key in self.keys]
+        lengths = np.fromiter(map(len, padded), dtype=np.int64, count=len(padded))
+        codes = np.frombuffer("".join(padded).encode("utf-32-le"), dtype=np.uint32).astype(np.int64)
+        trigrams = (codes[:-2] << 2 * _CODE_BITS) | (codes[1:-1] << _CODE_BITS) | codes[2:]
+        del codes
+        inside = np.ones(len(trigrams) + 2, dtype=bool)
+        ends = np.cumsum(lengths)
+        inside[ends - 1] = inside[ends - 2] = False
+        trigrams = trigrams[inside[:-2]]
+        owner = np.repeat(np.arange(len(padded), dtype=np.int32), lengths - 2)
+
+        # Distinct (trigram, title) pairs sorted by trigram give the postings
+        order = np.lexsort((owner, trigrams))
+        trigrams, owner = trigrams[order], owner[order]
+        distinct = np.ones(len(trigrams), dtype=bool)
+        distinct[1:] = (trigrams[1:] != trigrams[:-1]) | (owner[1:] != owner[:-1])
+        trigrams, self.postings = trigrams[distinct], owner[distinct]
+        self.trigrams, first = np.unique(trigrams, return_index=True)
+        self.indptr = np.append(first, len(trigrams))
+        self.trigram_counts = np.bincount(self.postings, minlength=len(self.keys))
+
+    def __len__(self):
+        return len(self.keys)
+
+    @staticmethod
+    def max_distance(key):
+        """Edit distance still accepted as a typo of key: 1 up to 7 characters, 2 up to 11, then 3."""
+        return max(1, min(3, len(key) // 4))
+
+    def resolve(self, query, limit=5):
+        """
+        Candidate movies for a possibly mistyped title, best first.
+
+        Titles with the same normalized key come first, then the closest titles by edit distance
+        and trigram similarity; titles further than max_distance are listed after those.
+
+        Args:
+            query (str): title as typed
+            limit (int): most candidates returned
+
+        Returns:
+            list: TitleMatch candidates
+        """
+        key = normalize_title(query)
+        # An empty catalog has no trigrams to search
+        if not key or not len(self.trigrams):
+            return []
+        exact = self.exact.get(key, [])
+        grams = np.fromiter(_trigrams(key), dtype=np.int64)
+        found = np.minimum(np.searchsorted(self.trigrams, grams), len(self.trigrams) - 1)
+        found = found[self.trigrams[found] == grams]
+        postings = [self.postings[self.indptr[t]:self.indptr[t + 1]] for t in found]
+        shared = np.bincount(np.concatenate(postings), minlength=len(self.keys)) if postings else np.zeros(len(self.keys), int)
+
+        # A Dice similarity of at least floor needs shared >= floor * len(grams) / (2 - floor), so a
+        # threshold on shared leaves only the few titles worth computing the similarity of. Titles
+        # above SIMILARITY_FLOOR are looked at first, the floor drops to min_similarity only when
+        # fewer than limit titles clear it
+        for floor in sorted({max(SIMILARITY_FLOOR, self.min_similarity), self.min_similarity}, reverse=True):
+            candidates = np.flatnonzero(shared >= max(1, math.ceil(floor * len(grams) / (2 - floor))))
+            similarity = 2 * shared[candidates] / (len(grams) + self.trigram_counts[candidates])
+            keep = similarity >= floor
+            if keep.sum() >= limit:
+                break
+        candidates, similarity = candidates[keep], similarity[keep]
+        if len(candidates) > self.pool:
+            top = np.argpartition(-similarity, self.pool - 1)[:self.pool]
+            candidates, similarity = candidates[top], similarity[top]
+        scores = dict(zip(candidates.tolist(), similarity.tolist()))
+        for position in exact:
+            scores[position] = 1.0
+
+        # Most similar first. Every edit changes at most 4 of the padded trigrams, so the trigrams
+        # a title misses bound its distance from below; titles whose bound cannot beat the
+        # limit-th best distance so far are skipped without computing it
+        max_distance = self.max_distance(key)
+        query_repeats = len(key) + 1 - len(grams)
+        ranked = []
+        for position, score in sorted(scores.items(), key=lambda item: -item[1]):
+            if position in exact:
+                distance = 0
+            else:
+                if len(ranked) >= limit:
+                    size = max(len(key), len(self.keys[position])) + 1
+                    repeats = min(query_repeats, size - self.trigram_counts[position])
+                    if -(-(size - shared[position] - repeats) // 4) >= ranked[limit - 1][0]:
+                        continue
+                distance = edit_distance(key, self.keys[position], max_distance)
+            ranked.append((distance, -score, position))
+            ranked.sort()
+        return [TitleMatch(int(self.movie_ids[position]), str(self.titles[position]), distance, round(-score, 4))
+                for distance, score, position in ranked[:limit]]
+
+    def lookup(self, query, limit=5):
+        """
+        Returns:
+            tuple: (the TitleMatch query most likely means, None when no title is within
+            max_distance of it, and the list of candidates from resolve)
+        """
+        candidates = self.resolve(query, limit)
+        if candidates and candidates[0].distance <= self.max_distance(normalize_title(query)):
+            return candidates[0], candidates
+        return None, candidates
+
+    def best(self, query):
+        """The movie query most likely means, or None when no title is within max_distance of it."""
+        return self.lookup(query, limit=1)[0]
+
+'''
+Python file with the title indexes behind /movies/search and /movies/resolve
+'''
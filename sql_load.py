@@ -1,6 +1,8 @@
 # Imports
+import argparse
 import pandas as pd
 from sqlalchemy.orm import Session
+from myapp import bulk_load
 from myapp.database import SessionLocal, engine
 from myapp.models import Base, Movie, Rating
 
@@ -11,23 +13,15 @@ Base.metadata.create_all(bind=engine)
 movies_path = "./data/u.item"  # Adjust this if your dataset is stored elsewhere
 ratings_path = "./data/u.data"
 
-# Load Movies with Pandas
-colnames = ['movie_id', 'title', 'release_date','unknown', 'action', 'adventure', 'animation', 'children',
-            'comedy', 'crime', 'documentary', 'drama', 'fantasy','filmnoir', 'horror', 'musical','mystery',
-            'romance', 'scifi', 'thriller', 'war', 'western']
-
-movies_df = pd.read_csv(movies_path, sep="|", header=None, usecols=[0,1,2,5,6,7,8,9,10,11,12,13,14,15,16,17,18,19,20,21,22,23], names=colnames)
-
-# Load Ratings with Pandas
-ratings_df = pd.read_csv(ratings_path, sep="\t", header=None, usecols=[0,1,2], names=["user_id", "movie_id", "rating"])
-
-# Insert movies into PostgreSQL
-def insert_movies():
+# Insert movies row by row through the ORM (slow, kept with --orm)
+def insert_movies(path=movies_path):
+    # Load Movies with Pandas
+    movies_df = pd.read_csv(path, sep="|", header=None, usecols=bulk_load.MOVIE_USECOLS, names=bulk_load.MOVIE_COLUMNS)
 
     # Open local session with the database
     with SessionLocal() as session:
         movies = [
-            Movie(movie_id=str(row["movie_id"]), title=row["title"], release_date=row["release_date"], unknown=row["unknown"],
+            Movie(movie_id=int(row["movie_id"]), title=row["title"], release_date=row["release_date"], unknown=row["unknown"],
                   action=row["action"], adventure=row["adventure"], animation=row["animation"], children=row["children"],
                   comedy=row["comedy"],crime=row["crime"], documentary=row["documentary"], drama=row["drama"], fantasy=row["fantasy"],
                   filmnoir=row["filmnoir"], horror = row["horror"], musical= row["musical"], mystery=row["mystery"], romance=row["romance"],
@@ -40,15 +34,19 @@ def insert_movies():
         session.commit()
     print("Movies inserted successfully.")
 
-# Insert ratings into PostgreSQL
-def insert_ratings():
+# Insert ratings row by row through the ORM (slow, kept with --orm)
+def insert_ratings(path=ratings_path):
+    # Load Ratings with Pandas
+    ratings_df = pd.read_csv(path, sep="\t", header=None, usecols=[0,1,2,3], names=bulk_load.RATING_COLUMNS)
+
     # Open local session with the database
     with SessionLocal() as session:
         ratings = [
             Rating(
-                user_id=str(row["user_id"]),
-                movie_id=str(row["movie_id"]), 
-                rating=float(row["rating"]) )
+                user_id=int(row["user_id"]),
+                movie_id=int(row["movie_id"]), 
+                rating=float(row["rating"]),
+                timestamp=int(row["timestamp"]) )
             # Add ratings                   
             for _, row in ratings_df.iterrows()
         ]
@@ -57,7 +55,26 @@ def insert_ratings():
         session.commit()
     print("Ratings inserted successfully.")
 
+# Stream both files into the database in chunks
+def bulk_insert(movies=movies_path, ratings=ratings_path, chunk_size=bulk_load.CHUNK_SIZE):
+    for name, load, path in (("Movies", bulk_load.load_movies, movies), ("Ratings", bulk_load.load_ratings, ratings)):
+        rows, seconds = load(engine, path, chunk_size)
+        print(f"{name} inserted successfully. {rows} rows in {seconds:.2f}s ({rows / max(seconds, 1e-9):,.0f} rows/s)")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load the MovieLens files into the database.")
+    parser.add_argument("--movies", default=movies_path, help="u.item file")
+    parser.add_argument("--ratings", default=ratings_path, help="u.data file")
+    parser.add_argument("--chunk-size", type=int, default=bulk_load.CHUNK_SIZE, help="rows per chunk in bulk mode")
+    parser.add_argument("--orm", action="store_true", help="use the old row-by-row ORM insert")
+    args = parser.parse_args(argv)
+
+    if args.orm:
+        insert_movies(args.movies)
+        insert_ratings(args.ratings)
+    else:
+        bulk_insert(args.movies, args.ratings, args.chunk_size)
+
 # Run data insertion
 if __name__ == "__main__":
-    insert_movies()
-    insert_ratings()
\ No newline at end of file
+    main()
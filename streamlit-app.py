@@ -1,29 +1,80 @@
 # imports
+import os
 import streamlit as st
 import requests
-from myapp import recommender
 
 
 # Base URL for your FastAPI server
-API_URL = "http://127.0.0.1:8000"
+API_URL = os.getenv("API_URL", "http://127.0.0.1:8000")
 # API_URL = "http://backend:8000" #when using docker
 
+
+# One pooled HTTP session per server process, so reruns reuse open connections
+@st.cache_resource
+def get_session():
+    return requests.Session()
+
+
+session = get_session()
+
+# Number of matching titles offered in the movie picker
+SEARCH_LIMIT = 50
+
+
+# Titles starting with the typed prefix, from the backend. Cached so reruns do not call the API again
+@st.cache_data(ttl=60, show_spinner=False)
+def search_movies(prefix):
+    response = get_session().get(f"{API_URL}/movies/search", params={"q": prefix, "limit": SEARCH_LIMIT})
+    if response.status_code != 200:
+        return [], 0
+    data = response.json()
+    return [movie["title"] for movie in data["results"]], data["total"]
+
+
+# Closest titles to a mistyped one, from the backend's fuzzy resolver
+@st.cache_data(ttl=60, show_spinner=False)
+def resolve_movie(query):
+    response = get_session().get(f"{API_URL}/movies/resolve", params={"q": query, "limit": 10})
+    if response.status_code != 200:
+        return []
+    return [movie["title"] for movie in response.json()["candidates"]]
+
+
 st.title("Movie Recommender")
 
+# Typeahead: the prefix narrows the options, the search itself runs on the backend
+prefix = st.text_input("Search for a movie", help="Type the start of a title")
+titles, total = search_movies(prefix.strip().lower())
+# Nothing starts with the typed text, offer the closest titles instead
+if prefix.strip() and not titles:
+    titles = resolve_movie(prefix.strip())
+    if titles:
+        st.caption("No title starts with that, showing the closest matches.")
+
 # Input for movie name and transform to lowercase
 movie_input = st.selectbox(label="Select a Movie", index=None,
-                           options=recommender.get_movies_list(),
+                           options=titles,
                            help="Select a movie to get recommendations") 
+if total > len(titles):
+    st.caption(f"Showing {len(titles)} of {total} matching movies, type more of the title to narrow it down.")
 
 if movie_input:
     movie_input = movie_input.lower()
 
+
+# Register a click for a recommendation
+def click_response(rec):
+    click_response = session.post(f"{API_URL}/click/", params={"movie_id": rec["movie_id"]})
+    if click_response.status_code == 200:
+        st.success(f"Registered click for {rec['title']}")
+
+
 # If user clicks "Get Recommendations"
 if st.button("Get Recommendations"):
     # And movie name is not empty
     if movie_input:
-        # Call the /recommend/ endpoint
-        response = requests.get(f"{API_URL}/recommend/", params={"movie": movie_input})
+        # Call the /recommend/ endpoint, with the click percentages in the same response
+        response = session.get(f"{API_URL}/recommend/", params={"movie": movie_input, "with_stats": 1})
         
         # If the response is successful
         if response.status_code == 200:
@@ -36,96 +87,19 @@ if st.button("Get Recommendations"):
             # Write recommendations. For each recommendation, display title and movie_id
             st.write("### Recommendations:")
 
-            # Enumerate to get recommendation number, movie ID, and title
-            hashmap = {n:{"movie_id": rec["movie_id"], "title": rec["title"]} for n, rec in enumerate(recs, start=1)}
-            
-            # Create columns
-            col1, col2, col3, col4 = st.columns(4)
-
-            with col1:
-                # Choose a recommended movie
-                st.write(str.capitalize(hashmap[1]["title"]))
-                # Button to register a click for the recommendation
-                def click_response(): 
-                    click_response = requests.post(f"{API_URL}/click/", params={"movie_id": hashmap[1]["movie_id"]})
-                    if click_response.status_code == 200:
-                        st.success(f"Registered click for {hashmap[1]['title']}")
-                # If clicked, add a click to counter
-                if st.button(label=hashmap[1]["movie_id"], on_click=click_response):
-                    pass
-
-                # Click percentage
-                # Fetch and display the click percentage
-                stats_response = requests.get(f"{API_URL}/click_stats/", params={"movie_id": hashmap[1]["movie_id"]})
-                if stats_response.status_code == 200:
-                    stats = stats_response.json()
-                    click_percentage = stats.get("click_percentage", 0)
-                    st.write(f"Click Rate: {click_percentage:.1f}%")
-
-            
-            with col2:
-                #Choose movie 2
-                st.write(str.capitalize(hashmap[2]["title"]))
-                # Button to register a click for the recommendation
-                def click_response(): 
-                    click_response = requests.post(f"{API_URL}/click/", params={"movie_id": hashmap[2]["movie_id"]})
-                    if click_response.status_code == 200:
-                        st.success(f"Registered click for {hashmap[2]['title']}")
-                # If clicked, add a click to counter
-                if st.button(label=hashmap[2]["movie_id"], on_click=click_response):
-                    pass
-
-                # Click percentage
-                # Fetch and display the click percentage
-                stats_response = requests.get(f"{API_URL}/click_stats/", params={"movie_id": hashmap[2]["movie_id"]})
-                if stats_response.status_code == 200:
-                    stats = stats_response.json()
-                    click_percentage = stats.get("click_percentage", 0)
-                    st.write(f"Click Rate: {click_percentage:.1f}%")
-
-
-                
-            with col3:
-                # 3
-                st.write(str.capitalize(hashmap[3]["title"]))
-                # Button to register a click for the recommendation
-                def click_response(): 
-                    click_response = requests.post(f"{API_URL}/click/", params={"movie_id": hashmap[3]["movie_id"]})
-                    if click_response.status_code == 200:
-                        st.success(f"Registered click for {hashmap[3]['title']}")
-                # If clicked, add a click to counter
-                if st.button(label=hashmap[3]["movie_id"], on_click=click_response):
-                    pass
-                
-                # Click percentage
-                # Fetch and display the click percentage
-                stats_response = requests.get(f"{API_URL}/click_stats/", params={"movie_id": hashmap[3]["movie_id"]})
-                if stats_response.status_code == 200:
-                    stats = stats_response.json()
-                    click_percentage = stats.get("click_percentage", 0)
-                    st.write(f"Click Rate: {click_percentage:.1f}%")
-
-            with col4:
-                #4
-                st.write(str.capitalize(hashmap[4]["title"]))
-                # Button to register a click for the recommendation
-                def click_response(): 
-                    click_response = requests.post(f"{API_URL}/click/", params={"movie_id": hashmap[4]["movie_id"]})
-                    if click_response.status_code == 200:
-                        st.success(f"Registered click for {hashmap[4]['title']}")
-                # If clicked, add a click to counter
-                if st.button(label=hashmap[4]["movie_id"], on_click=click_response):
-                    pass
-
-                # Click percentage
-                # Fetch and display the click percentage
-                stats_response = requests.get(f"{API_URL}/click_stats/", params={"movie_id": hashmap[4]["movie_id"]})
-                if stats_response.status_code == 200:
-                    stats = stats_response.json()
-                    click_percentage = stats.get("click_percentage", 0)
-                    st.write(f"Click Rate: {click_percentage:.1f}%")
-
-                      
+            if not recs:
+                st.info("No recommendations for this movie yet.")
+            else:
+                # One column per recommendation, however many came back
+                for col, rec in zip(st.columns(len(recs)), recs):
+                    with col:
+                        st.write(str.capitalize(rec["title"]))
+                        # If clicked, add a click to counter
+                        st.button(label=str(rec["movie_id"]), key=f"click-{rec['movie_id']}",
+                                  on_click=click_response, args=(rec,))
+                        # Click percentage
+                        if "click_percentage" in rec:
+                            st.write(f"Click Rate: {rec['click_percentage']:.1f}%")
             
         else:
             st.error("Movie not listed. Please try again.")
@@ -153,7 +127,7 @@ with st.sidebar:
     # Button to add movie
     if st.button("Add Movie"):
         # Call the /add_movie/ endpoint
-        response = requests.post(f"{API_URL}/add_movie/", params={"movie_title": new_movie, 'category': new_category,
+        response = session.post(f"{API_URL}/add_movie/", params={"movie_title": new_movie, 'category': new_category,
                                                                   'release_date': new_release_dt, 'user_rating': new_rating})
         if response.status_code == 200:
             st.success("Movie added successfully.")
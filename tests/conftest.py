@@ -0,0 +1,59 @@
+# Imports
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine, insert
+
+# myapp reads its settings once, at import: point them at a throwaway directory before any test
+# imports it, so the API tests never touch the real database, models or event log
+API_DIR = tempfile.mkdtemp(prefix="myapp-tests-")
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{API_DIR}/api.db",
+    "MODEL_DIR": os.path.join(API_DIR, "models"),
+    "EVENT_DIR": os.path.join(API_DIR, "events"),
+    "PROFILE_DIR": os.path.join(API_DIR, "profiles"),
+    "USE_MODEL_ARTIFACT": "0",
+    "DB_ASYNC": "0",
+    "EVENT_LOG": "0",
+    "USER_MODEL": "0",
+})
+
+from myapp.models import GENRES, Base, Movie
+
+
+def make_data(n_movies=40, n_users=80, density=0.3, seed=0):
+    """Random ratings (no ties, so neighbour lists are unique) and titled movies with genres."""
+    rng = np.random.default_rng(seed)
+    movie_ids, user_ids = np.nonzero(rng.random((n_movies, n_users)) < density)
+    ratings = pd.DataFrame({
+        "user_id": user_ids + 1,
+        "movie_id": movie_ids + 1,
+        "rating": rng.uniform(0.5, 5.0, len(movie_ids)).astype(np.float32),
+    })
+    movies = pd.DataFrame({"movie_id": np.arange(1, n_movies + 1),
+                           "title": [f"movie {i}" for i in range(1, n_movies + 1)]})
+    for genre in GENRES:
+        movies[genre] = (rng.random(n_movies) < 0.2).astype(np.uint8)
+    return ratings, movies
+
+
+@pytest.fixture
+def data():
+    return make_data()
+
+
+@pytest.fixture
+def engine(tmp_path):
+    """SQLite database with every table and movies 1 to 5."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(Movie), [{"movie_id": i, "title": f"movie {i}"} for i in range(1, 6)])
+    yield engine
+    engine.dispose()
+
+'''
+Python file with the fixtures shared by the tests
+'''
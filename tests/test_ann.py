@@ -0,0 +1,61 @@
+# Imports
+import numpy as np
+from conftest import make_data
+from myapp import recommender
+from myapp.ann import IVFIndex, ivf_neighbours
+
+TOP_K = 10
+
+
+def recall(approximate, exact):
+    """Share of the exact neighbours the approximate table found."""
+    found = [len(np.intersect1d(a[a >= 0], e)) for a, e in zip(approximate.neighbours, exact.neighbours)]
+    return sum(found) / exact.neighbours.size
+
+
+def matrix():
+    ratings, _ = make_data(n_movies=200, n_users=300, density=0.1)
+    return recommender.build_rating_matrix(ratings)[:2]
+
+
+def test_ivf_table_is_well_formed():
+    ratings_matrix, movie_ids = matrix()
+    table = ivf_neighbours(ratings_matrix, movie_ids, TOP_K, n_lists=16, n_probe=2)
+
+    assert table.neighbours.shape == table.scores.shape == (200, TOP_K)
+    rows = np.arange(200)[:, None]
+    found = table.neighbours >= 0
+    assert found.any(axis=1).all()
+    # Valid rows other than the movie itself, padding only at the end with -inf scores
+    assert (table.neighbours[found] < 200).all()
+    assert not (table.neighbours == rows).any()
+    assert np.isneginf(table.scores[~found]).all()
+    assert (np.diff(found.astype(int), axis=1) <= 0).all()
+    # Sorted by descending similarity
+    assert (np.diff(table.scores, axis=1)[np.isfinite(table.scores[:, 1:])] <= 0).all()
+
+
+def test_ivf_recall_against_the_exact_table():
+    ratings_matrix, movie_ids = matrix()
+    exact = recommender.neighbours_from_matrix(ratings_matrix, movie_ids, TOP_K)
+
+    assert recall(ivf_neighbours(ratings_matrix, movie_ids, TOP_K, n_lists=16, n_probe=8), exact) >= 0.6
+    # Probing every list scores every movie
+    everything = ivf_neighbours(ratings_matrix, movie_ids, TOP_K, n_lists=16, n_probe=16)
+    assert recall(everything, exact) >= 0.99
+    np.testing.assert_allclose(everything.scores, exact.scores, rtol=1e-5, atol=1e-6)
+
+
+def test_search_matches_search_rows():
+    ratings_matrix, _ = matrix()
+    index = IVFIndex.build(ratings_matrix, n_lists=16)
+    neighbours, scores = index.search_rows(np.arange(20), TOP_K, n_probe=4)
+
+    for row in range(20):
+        row_neighbours, row_scores = index.search(row, TOP_K, n_probe=4)
+        np.testing.assert_allclose(row_scores, scores[row], rtol=1e-5)
+        assert set(row_neighbours[row_neighbours >= 0]) == set(neighbours[row][neighbours[row] >= 0])
+
+'''
+Python file with the tests of the approximate (IVF) neighbour index
+'''
@@ -0,0 +1,77 @@
+# Imports
+import pandas as pd
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import insert
+from conftest import make_data
+from myapp import database
+from myapp import recommender
+from myapp import serving
+from myapp.models import Base, Movie, Rating
+
+
+@pytest.fixture(scope="module")
+def main():
+    """myapp.main serving make_data() from the throwaway database set up in conftest."""
+    ratings, movies = make_data()
+    Base.metadata.create_all(database.engine)
+    with database.engine.begin() as conn:
+        conn.execute(insert(Movie), movies.to_dict("records"))
+        conn.execute(insert(Rating), ratings.astype({"rating": float}).to_dict("records"))
+    # Imported here: the module loads its model from the database at import
+    from myapp import main
+    return main
+
+
+@pytest.fixture(scope="module")
+def client(main):
+    with TestClient(main.app) as client:
+        yield client
+
+
+def test_etag_matches_uses_weak_comparison(main):
+    assert main.etag_matches('"abc"', '"abc"')
+    assert main.etag_matches('W/"abc"', '"abc"')
+    assert main.etag_matches('"abc"', 'W/"abc"')
+    assert main.etag_matches('"x", W/"abc" ,"y"', '"abc"')
+    assert main.etag_matches("*", '"abc"')
+    assert not main.etag_matches('"abcd", "ab"', '"abc"')
+    assert not main.etag_matches("", '"abc"')
+    assert not main.etag_matches(None, '"abc"')
+
+
+def test_recommend_answers_304_when_the_client_copy_is_current(client):
+    response = client.get("/recommend/", params={"movie": "movie 1"})
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+
+    for if_none_match in (etag, f"W/{etag}", f'"stale", {etag}', "*"):
+        response = client.get("/recommend/", params={"movie": "movie 1"}, headers={"If-None-Match": if_none_match})
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["etag"] == etag
+
+    response = client.get("/recommend/", params={"movie": "movie 1"}, headers={"If-None-Match": '"stale"'})
+    assert response.status_code == 200
+    assert response.json()["movie"] == "movie 1"
+
+
+def test_cached_recommendations_are_recomputed_after_a_model_update(main):
+    key = ("movie 1", 4)
+    stale = (serving.current(), "movie 1", [(0, "stale")], '"stale"')
+    main.recommendation_cache.set(key, stale)
+    assert main.cached_recommendations(*key) == stale[1:]
+
+    # A user rating movie 1 changes the model; a request that read the old model before the
+    # swap can still store its result after the swap cleared the cache
+    ratings = pd.DataFrame({"user_id": [10_000, 10_000], "movie_id": [1, 2], "rating": [5.0, 5.0]})
+    index = serving.update(lambda index: recommender.update_index(index, ratings))
+    main.recommendation_cache.set(key, stale)
+
+    title, recs, _ = main.cached_recommendations(*key)
+    assert (title, recs) == ("movie 1", index.recommend("movie 1", 4))
+    assert main.recommendation_cache.get(key)[0] is index
+
+'''
+Python file with the tests of the API's conditional requests and recommendation cache
+'''
@@ -0,0 +1,103 @@
+# Imports
+import json
+import logging
+import numpy as np
+import pytest
+from myapp import artifact
+from myapp import recommender
+from myapp import serving
+from myapp.model_watcher import ModelWatcher
+
+
+@pytest.fixture
+def index(data):
+    ratings, movies = data
+    return recommender.RecommenderIndex.build(ratings, movies, top_k=5)
+
+
+def make_stale(model_dir, version):
+    # Rewrite the manifest as an older format would have
+    manifest_path = model_dir / version / "manifest.json"
+    manifest = json.loads(manifest_path.read_text())
+    manifest["format_version"] = artifact.FORMAT_VERSION - 1
+    manifest_path.write_text(json.dumps(manifest))
+
+
+def test_save_then_load_memory_maps_the_same_index(index, tmp_path):
+    version = artifact.save_artifact(index, tmp_path, "a" * 64)
+
+    loaded, manifest = artifact.load_artifact(tmp_path)
+
+    assert artifact.current_version(tmp_path) == version == manifest["version"]
+    assert manifest["format_version"] == artifact.FORMAT_VERSION and manifest["top_k"] == 5
+    assert isinstance(loaded.neighbour_table.neighbours, np.memmap)
+    for name in ("movie_ids", "neighbours", "scores"):
+        np.testing.assert_array_equal(getattr(loaded.neighbour_table, name), getattr(index.neighbour_table, name))
+    np.testing.assert_array_equal(loaded.titles, index.titles)
+    np.testing.assert_array_equal(loaded.genres, index.genres)
+    np.testing.assert_array_equal(loaded.user_ids, index.user_ids)
+    assert (loaded.matrix != index.matrix).nnz == 0
+    title = str(index.titles[0])
+    assert loaded.recommend(title, 4, content_weight=0.3) == index.recommend(title, 4, content_weight=0.3)
+
+
+def test_old_format_raises_stale_artifact_error(index, tmp_path):
+    version = artifact.save_artifact(index, tmp_path, "a" * 64)
+    make_stale(tmp_path, version)
+
+    with pytest.raises(artifact.StaleArtifactError):
+        artifact.load_artifact(tmp_path, version)
+
+
+def test_prune_versions_keeps_the_newest_and_drops_old_formats(index, tmp_path):
+    versions = [artifact.save_artifact(index, tmp_path, f"{i}" * 64) for i in range(4)]
+    make_stale(tmp_path, versions[2])
+
+    artifact.prune_versions(tmp_path, keep=2)
+
+    assert sorted(path.name for path in tmp_path.iterdir() if path.is_dir()) == [versions[3]]
+    # The version served is never deleted, whatever its format
+    make_stale(tmp_path, versions[3])
+    artifact.prune_versions(tmp_path, keep=0)
+    assert (tmp_path / versions[3]).is_dir()
+
+
+def test_watcher_publishes_a_new_version_once(index, tmp_path):
+    serving.publish(index, None)
+    swapped = []
+    watcher = ModelWatcher(tmp_path, on_swap=swapped.append)
+    assert watcher.check() is None
+
+    version = artifact.save_artifact(index, tmp_path, "a" * 64)
+
+    assert watcher.check() == version
+    assert serving.current_version() == version and swapped == [serving.current()]
+    # Pointer unchanged
+    assert watcher.check() is None
+    assert len(swapped) == 1
+
+
+def test_watcher_does_not_retry_a_failing_version(index, tmp_path, monkeypatch, caplog):
+    serving.publish(index, None)
+    version = artifact.save_artifact(index, tmp_path, "a" * 64)
+    make_stale(tmp_path, version)
+    loads = []
+    load_artifact = artifact.load_artifact
+    monkeypatch.setattr(artifact, "load_artifact", lambda *args: loads.append(args) or load_artifact(*args))
+    watcher = ModelWatcher(tmp_path, poll_interval=0.01)
+
+    with caplog.at_level(logging.ERROR, logger="myapp.model_watcher"):
+        watcher.start()
+        watcher._stopping.wait(0.3)
+        watcher.stop()
+    assert len(loads) == 1
+    assert len(caplog.records) == 1
+    assert serving.current_version() is None
+
+    # A new version behind a new pointer is loaded
+    new_version = artifact.save_artifact(index, tmp_path, "b" * 64)
+    assert watcher.check() == new_version
+
+'''
+Python file with the tests of the model artifact and the model watcher
+'''
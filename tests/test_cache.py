@@ -0,0 +1,70 @@
+# Imports
+from myapp import cache
+from myapp.cache import TTLCache
+
+
+class Clock:
+    """Stands in for time.monotonic, advanced by hand."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_least_recently_used_entry_is_evicted():
+    lru = TTLCache(maxsize=2, ttl=60)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    assert lru.get("a") == 1
+    lru.set("c", 3)
+
+    assert lru.get("b") is None
+    assert (lru.get("a"), lru.get("c")) == (1, 3)
+    stats = lru.stats()
+    assert (stats["size"], stats["evictions"], stats["hits"], stats["misses"]) == (2, 1, 3, 1)
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, "monotonic", clock)
+    ttl = TTLCache(maxsize=10, ttl=5)
+    ttl.set("a", 1)
+
+    clock.now = 4.9
+    assert ttl.get("a") == 1
+    clock.now = 5.0
+    assert ttl.get("a", "missing") == "missing"
+    stats = ttl.stats()
+    assert (stats["size"], stats["expirations"], stats["hits"], stats["misses"]) == (0, 1, 1, 1)
+
+    # Setting a key again restarts its ttl
+    ttl.set("a", 2)
+    clock.now = 9.9
+    assert ttl.get("a") == 2
+
+
+def test_maxsize_zero_disables_the_cache():
+    disabled = TTLCache(maxsize=0, ttl=60)
+    disabled.set("a", 1)
+    assert disabled.get("a") is None
+    assert disabled.stats()["size"] == 0
+
+
+def test_pop_and_clear_keep_the_counters():
+    entries = TTLCache(maxsize=10, ttl=60)
+    entries.set("a", 1)
+    entries.set("b", 2)
+    entries.get("a")
+    entries.pop("a")
+    entries.pop("missing")
+    assert entries.get("a") is None
+    entries.clear()
+    assert entries.get("b") is None
+    stats = entries.stats()
+    assert (stats["size"], stats["hits"], stats["misses"], stats["hit_rate"]) == (0, 1, 2, 1 / 3)
+
+'''
+Python file with the tests of the in-process response cache
+'''
@@ -0,0 +1,58 @@
+# Imports
+import pytest
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.exc import OperationalError
+from myapp.clickstats import ImpressionBuffer
+from myapp.models import ClickStats
+
+
+def click_stats(engine):
+    with engine.connect() as conn:
+        return {row.movie_id: (row.title, row.recommendations_shown, row.clicks) for row in conn.execute(select(ClickStats))}
+
+
+def test_flush_sums_impressions_into_one_upsert(engine):
+    with engine.begin() as conn:
+        conn.execute(insert(ClickStats).values(movie_id=1, title="movie 1", recommendations_shown=10, clicks=3))
+    buffer = ImpressionBuffer(engine)
+    buffer.add([(1, "movie 1"), (2, "movie 2")])
+    buffer.add([(1, "movie 1")])
+
+    assert buffer.flush() == 3
+    assert click_stats(engine) == {1: ("movie 1", 12, 3), 2: ("movie 2", 1, 0)}
+    assert buffer.flush() == 0
+
+
+def test_failed_flush_keeps_the_counts(tmp_path):
+    # No click_stats table yet
+    engine = create_engine(f"sqlite:///{tmp_path / 'empty.db'}")
+    buffer = ImpressionBuffer(engine)
+    buffer.add([(1, "movie 1"), (1, "movie 1")])
+
+    with pytest.raises(OperationalError):
+        buffer.flush()
+    ClickStats.__table__.create(engine)
+    buffer.add([(1, "movie 1")])
+
+    assert buffer.flush() == 3
+    assert click_stats(engine) == {1: ("movie 1", 3, 0)}
+
+
+def test_background_thread_flushes_when_full_and_on_stop(engine):
+    buffer = ImpressionBuffer(engine, flush_interval=60, flush_size=2)
+    buffer.start()
+    try:
+        buffer.add([(1, "movie 1"), (2, "movie 2")])
+        for _ in range(200):
+            if click_stats(engine):
+                break
+            buffer._stopping.wait(0.01)
+        assert click_stats(engine) == {1: ("movie 1", 1, 0), 2: ("movie 2", 1, 0)}
+        buffer.add([(3, "movie 3")])
+    finally:
+        buffer.stop()
+    assert click_stats(engine)[3] == ("movie 3", 1, 0)
+
+'''
+Python file with the tests of the buffered impression counters
+'''
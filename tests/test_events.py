@@ -0,0 +1,113 @@
+# Imports
+import numpy as np
+from sqlalchemy import select
+from myapp import events
+from myapp.models import ClickStats, EventOffset, Rating
+
+
+def offsets(engine):
+    with engine.connect() as conn:
+        return dict(conn.execute(select(EventOffset.segment, EventOffset.records)).all())
+
+
+def write(log, *appends):
+    for kind, movie_ids, user_id, value in appends:
+        log.append(kind, movie_ids, user_id, value)
+    log.flush()
+
+
+def test_rollup_sums_counts_and_keeps_the_latest_rating(engine, tmp_path):
+    log = events.EventLog(tmp_path / "events")
+    write(log, (events.IMPRESSION, [1, 1, 2], events.NO_USER, 0.0), (events.CLICK, [1], events.NO_USER, 0.0),
+          (events.RATING, [3], 7, 2.0), (events.RATING, [3], 7, 4.5))
+
+    rolled_up = events.rollup(engine, tmp_path / "events")
+
+    assert len(rolled_up) == 6
+    with engine.connect() as conn:
+        stats = {row.movie_id: (row.title, row.recommendations_shown, row.clicks) for row in conn.execute(select(ClickStats))}
+        ratings = conn.execute(select(Rating.user_id, Rating.movie_id, Rating.rating)).all()
+    assert stats == {1: ("movie 1", 2, 1), 2: ("movie 2", 1, 0)}
+    assert ratings == [(7, 3, 4.5)]
+    assert list(offsets(engine).values()) == [6]
+
+    # The next run starts where this one stopped
+    write(log, (events.CLICK, [1, 2], events.NO_USER, 0.0))
+    assert len(events.rollup(engine, tmp_path / "events")) == 2
+    assert len(events.rollup(engine, tmp_path / "events")) == 0
+    with engine.connect() as conn:
+        assert conn.scalar(select(ClickStats.clicks).where(ClickStats.movie_id == 1)) == 2
+    log.stop()
+
+
+def test_rollup_batches_are_limited_to_max_events(engine, tmp_path):
+    log = events.EventLog(tmp_path / "events")
+    write(log, (events.CLICK, [1, 2, 3, 4, 5], events.NO_USER, 0.0))
+
+    assert len(events.rollup(engine, tmp_path / "events", max_events=3)) == 3
+    assert len(events.rollup(engine, tmp_path / "events", max_events=3)) == 2
+    with engine.connect() as conn:
+        assert conn.scalar(select(ClickStats.clicks).where(ClickStats.movie_id == 5)) == 1
+    log.stop()
+
+
+def test_every_follower_replays_what_the_rollup_committed(engine, tmp_path):
+    log = events.EventLog(tmp_path / "events")
+    write(log, (events.RATING, [1], 7, 3.0))
+    events.rollup(engine, tmp_path / "events")
+    replayed = {name: [] for name in ("rollup worker", "other worker")}
+    followers = [events.EventFollower(engine, tmp_path / "events", on_events=replayed[name].append) for name in replayed]
+    # Started after the first rollup, which the model loaded at startup already holds
+    for follower in followers:
+        follower.sync()
+
+    write(log, (events.RATING, [2], 7, 4.0), (events.CLICK, [2], events.NO_USER, 0.0))
+    # Not rolled up yet, nothing to replay
+    assert all(len(follower.poll()) == 0 for follower in followers)
+    events.rollup(engine, tmp_path / "events")
+
+    for follower in followers:
+        follower.poll()
+        assert len(follower.poll()) == 0
+    for batches in replayed.values():
+        assert len(batches) == 1
+        assert batches[0]["movie_id"].tolist() == [2, 2]
+        assert events.ratings_frame(batches[0])[["user_id", "movie_id", "rating"]].values.tolist() == [[7, 2, 4.0]]
+    log.stop()
+
+
+def test_prune_deletes_only_rolled_up_sealed_segments(engine, tmp_path):
+    # Every flush starts a new segment
+    log = events.EventLog(tmp_path / "events", segment_bytes=1)
+    write(log, (events.CLICK, [1], events.NO_USER, 0.0))
+    write(log, (events.CLICK, [2], events.NO_USER, 0.0))
+    events.rollup(engine, tmp_path / "events")
+    write(log, (events.CLICK, [3], events.NO_USER, 0.0))
+    first, second, third = events.segments(tmp_path / "events")
+
+    # Within the retention period nothing goes
+    assert events.prune_segments(engine, tmp_path / "events", 3600) == 0
+    # Both rolled up segments are sealed by the newer one, which is neither rolled up nor sealed
+    assert events.prune_segments(engine, tmp_path / "events", 0) == 2
+    assert events.segments(tmp_path / "events") == [third]
+    assert offsets(engine) == {}
+
+    # The newest segment of a running process may still be appended to, it is kept once rolled up
+    events.rollup(engine, tmp_path / "events")
+    assert events.prune_segments(engine, tmp_path / "events", 0) == 0
+    assert list(offsets(engine)) == [third.name]
+    log.stop()
+
+
+def test_prune_deletes_the_last_segment_of_an_exited_process(engine, tmp_path):
+    directory = tmp_path / "events"
+    directory.mkdir()
+    # Written by a process that no longer runs
+    path = directory / f"{1:020d}-{2 ** 22 + 1}{events.SEGMENT_SUFFIX}"
+    records = np.zeros(3, dtype=events.EVENT_DTYPE)
+    records["kind"], records["movie_id"] = events.CLICK, 1
+    records.tofile(path)
+    events.rollup(engine, directory)
+
+    assert events.prune_segments(engine, directory, 0) == 1
+    assert not path.exists() and offsets(engine) == {}
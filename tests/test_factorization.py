@@ -0,0 +1,60 @@
+# Imports
+import numpy as np
+import pandas as pd
+from myapp import recommender
+from myapp.factorization import UserRecommender, _solve_side
+
+
+def build(data, **params):
+    ratings, movies = data
+    index = recommender.RecommenderIndex.build(ratings, movies, top_k=5)
+    return index, UserRecommender.from_index(index, factors=4, iterations=3, **params)
+
+
+def test_recommend_fills_top_n_when_the_best_movies_have_no_title(data):
+    index, model = build(data)
+    best = model.recommend(1, 10)
+    # Drop the titles of the user's five best movies
+    titles = model.titles.copy()
+    for movie_id, _ in best[:5]:
+        titles[index.id_to_row[movie_id]] = ""
+    untitled = UserRecommender(model.user_ids, model.movie_ids, titles, model.user_factors,
+                               model.item_factors, model.rated)
+
+    recs = untitled.recommend(1, 10)
+
+    assert len(recs) == 10
+    assert recs[:5] == best[5:]
+    assert all(title for _, title in recs)
+
+
+def test_fold_in_solves_new_and_changed_users(data):
+    index, model = build(data, regularization=0.5, alpha=2.0)
+    new_ratings = pd.DataFrame({"user_id": [1, 500, 500, 500], "movie_id": [2, 3, 4, 41],
+                                "rating": [5.0, 4.0, 1.0, 3.0]})
+    updated_index = recommender.update_index(index, new_ratings, {41: "movie 41"})
+
+    updated = model.fold_in(updated_index, new_ratings["user_id"])
+
+    assert updated.user_ids.tolist() == updated_index.user_ids.tolist()
+    # The new movie has no factors until the next training
+    assert len(updated.movie_ids) == 40
+    weights = updated_index.matrix[:40].T.tocsr()[[0, len(updated.user_ids) - 1]] * 2.0
+    np.testing.assert_allclose(updated.user_factors[[0, -1]], _solve_side(weights, model.item_factors, 0.5), rtol=1e-5)
+    # Users without new ratings keep their factors
+    np.testing.assert_array_equal(updated.user_factors[1:len(model.user_ids)], model.user_factors[1:])
+    recs = updated.recommend(500, 4)
+    assert len(recs) == 4 and not {3, 4} & {movie_id for movie_id, _ in recs}
+    assert 2 not in {movie_id for movie_id, _ in updated.recommend(1, 40)}
+
+
+def test_fold_in_needs_a_full_training_for_a_rebuilt_index(data):
+    ratings, movies = data
+    _, model = build(data)
+    rebuilt = recommender.RecommenderIndex.build(ratings[ratings["movie_id"] != 1], movies, top_k=5)
+
+    assert model.fold_in(rebuilt, [1]) is None
+
+'''
+Python file with the tests of the user factorization model
+'''
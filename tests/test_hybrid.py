@@ -0,0 +1,68 @@
+# Imports
+import numpy as np
+import pandas as pd
+from myapp import recommender
+from myapp.models import GENRES
+
+TOP_K = 10
+
+
+def genre_cosine(movies, movie_id):
+    """Genre cosine similarity of every movie with movie_id, computed from the flags directly."""
+    flags = movies[list(GENRES)].to_numpy(dtype=np.float64)
+    seed = flags[movies["movie_id"].to_numpy() == movie_id][0]
+    norms = np.sqrt(flags.sum(axis=1) * seed.sum())
+    return np.divide(flags @ seed, norms, out=np.zeros(len(flags)), where=norms > 0)
+
+
+def test_cold_start_movie_is_ranked_by_genre_cosine(data):
+    ratings, movies = data
+    # One rating, by a user who rated nothing else, so the movie has no collaborative signal
+    ratings = pd.concat([ratings, pd.DataFrame({"user_id": [1000], "movie_id": [41], "rating": [4.0]})],
+                        ignore_index=True)
+    new_movie = {"movie_id": 41, "title": "cold start", **{genre: int(genre in ("action", "comedy")) for genre in GENRES}}
+    movies = pd.concat([movies, pd.DataFrame([new_movie])], ignore_index=True)
+    index = recommender.RecommenderIndex.build(ratings, movies, top_k=TOP_K)
+    row = index.id_to_row[41]
+    assert index.rating_counts[row] <= recommender.COLD_START_RATINGS
+
+    weight = index.seed_weights([row])[0]
+    assert weight == np.float32(1 / recommender.COLD_START_RATINGS)
+    cosine = genre_cosine(movies, 41)[np.searchsorted(movies["movie_id"].to_numpy(), index.movie_ids)]
+    expected = (1.0 - weight) * (cosine + recommender.GENRE_TIE_BREAK * index.popularity)
+    expected[row] = -np.inf
+
+    rows, scores = index.candidates(row, TOP_K)
+    assert row not in rows
+    np.testing.assert_allclose(scores, np.sort(expected)[::-1][:TOP_K], rtol=1e-5)
+    np.testing.assert_allclose(expected[rows], scores, rtol=1e-5)
+    assert [movie_id for movie_id, _ in index.recommend("cold start", TOP_K)] == index.movie_ids[rows].tolist()
+    # Every pick shares a genre with the seed
+    assert (cosine[rows] > 0).all()
+
+
+def test_content_weight_zero_is_purely_collaborative(data):
+    ratings, movies = data
+    index = recommender.RecommenderIndex.build(ratings, movies, top_k=TOP_K)
+    table = index.neighbour_table
+    seeds = np.flatnonzero(index.rating_counts >= recommender.COLD_START_RATINGS)
+    assert len(seeds) == len(index.movie_ids)
+
+    np.testing.assert_array_equal(index.seed_weights(seeds, content_weight=0.0), 1.0)
+    batch = index.recommend_batch(seeds, TOP_K, content_weight=0.0)
+    for row, batch_recs in zip(seeds, batch):
+        expected = [(int(index.movie_ids[r]), str(index.titles[r])) for r in table.neighbours[row]]
+        assert index.recommend(str(index.titles[row]), TOP_K, content_weight=0.0) == expected
+        assert batch_recs == expected
+
+    # At weight 1 the hybrid scores keep the neighbour scores and nothing else
+    scores = index._hybrid_scores(seeds, np.ones(len(seeds), dtype=np.float32))
+    for row, seed_scores in zip(seeds, scores):
+        ranked = np.argsort(-seed_scores, kind="stable")[:TOP_K]
+        assert ranked.tolist() == table.neighbours[row].tolist()
+        np.testing.assert_allclose(seed_scores[ranked], table.scores[row])
+        assert np.isneginf(np.delete(seed_scores, table.neighbours[row])).all()
+
+'''
+Python file with the tests of the hybrid genre and collaborative scoring
+'''
@@ -0,0 +1,85 @@
+# Imports
+import pandas as pd
+import pytest
+from myapp import recommender
+from myapp import serving
+from myapp.model_updates import ModelUpdateBuffer
+
+
+def rating(user_id, movie_id, value):
+    return pd.DataFrame({"user_id": [user_id], "movie_id": [movie_id], "rating": [value]})
+
+
+@pytest.fixture
+def index(data):
+    ratings, movies = data
+    index = recommender.RecommenderIndex.build(ratings, movies, top_k=5)
+    serving.publish(index)
+    return index
+
+
+def test_add_folds_in_at_once_before_start(index):
+    updates = []
+    buffer = ModelUpdateBuffer(on_update=lambda index, ratings: updates.append(len(ratings)))
+
+    buffer.add(rating(1, 41, 4.0), {41: "movie 41"})
+
+    assert serving.current().id_to_row[41] == 40
+    assert serving.current().titles[40] == "movie 41"
+    assert updates == [1]
+
+
+def test_started_buffer_folds_every_pending_rating_in_one_update(index):
+    updates = []
+    buffer = ModelUpdateBuffer(flush_interval=60, on_update=lambda index, ratings: updates.append(len(ratings)))
+    buffer.start()
+    try:
+        buffer.add(rating(1, 41, 4.0), {41: "movie 41"})
+        buffer.add(rating(2, 41, 3.0))
+        buffer.add(rating(3, 1, 5.0))
+        # Queued, not folded in yet
+        assert serving.current() is index
+        assert buffer.pending_movie(41) and not buffer.pending_movie(1)
+    finally:
+        buffer.stop()
+
+    assert updates == [3]
+    assert serving.current().rating_counts[40] == 2
+    assert not buffer.pending_movie(41)
+
+
+def test_flush_size_wakes_the_thread(index):
+    buffer = ModelUpdateBuffer(flush_interval=60, flush_size=2)
+    buffer.start()
+    try:
+        buffer.add(rating(1, 41, 4.0), {41: "movie 41"})
+        buffer.add(rating(2, 41, 3.0))
+        for _ in range(200):
+            if serving.current() is not index:
+                break
+            buffer._stopping.wait(0.01)
+        assert 41 in serving.current().id_to_row
+    finally:
+        buffer.stop()
+
+
+def test_failed_update_keeps_the_ratings(data):
+    ratings, movies = data
+    index = recommender.RecommenderIndex.build(ratings, movies, top_k=5)
+    # Without its rating matrix the index cannot be updated
+    serving.publish(recommender.RecommenderIndex(index.neighbour_table, index.titles))
+    buffer = ModelUpdateBuffer(flush_interval=60)
+    buffer.start()
+    buffer.add(rating(1, 41, 4.0), {41: "movie 41"})
+
+    with pytest.raises(ValueError):
+        buffer.flush()
+    assert buffer.pending_movie(41)
+
+    serving.publish(index)
+    buffer.stop()
+    assert 41 in serving.current().id_to_row
+
+'''
+Python file with the tests of the model update buffer
+'''
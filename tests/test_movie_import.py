@@ -0,0 +1,86 @@
+# Imports
+import asyncio
+import json
+import pytest
+from sqlalchemy import select
+from myapp import movie_import
+from myapp.models import Movie, Rating
+from myapp.schemas import MovieCreate
+
+
+class Body:
+    """The parts of a Starlette request read_rows uses, over a body sent in the given chunks."""
+
+    def __init__(self, chunks, content_type="application/json"):
+        self.headers = {"content-type": content_type}
+        self.chunks = chunks
+
+    async def body(self):
+        return b"".join(self.chunks)
+
+    async def stream(self):
+        for chunk in self.chunks:
+            yield chunk
+
+
+def read(request):
+    async def collect():
+        return [row async for row in movie_import.read_rows(request)]
+    return asyncio.run(collect())
+
+
+def test_read_rows_json_array():
+    rows = read(Body([b'[{"title": "a"}, ', b'{"title": "b"}]']))
+
+    assert rows == [(1, {"title": "a"}), (2, {"title": "b"})]
+
+
+def test_read_rows_rejects_a_body_that_is_not_an_array():
+    with pytest.raises(movie_import.ImportBodyError):
+        read(Body([b'{"title": "a"}']))
+    with pytest.raises(movie_import.ImportBodyError):
+        read(Body([b"[{"]))
+
+
+def test_read_rows_ndjson_across_chunks():
+    rows = read(Body([b'{"title": "a"}\n{"ti', b'tle": "b"}\n\nnot json\n{"title": "c"}'], "application/x-ndjson"))
+
+    assert [number for number, _ in rows] == [1, 2, 4, 5]
+    assert rows[0][1] == {"title": "a"} and rows[1][1] == {"title": "b"} and rows[3][1] == {"title": "c"}
+    assert isinstance(rows[2][1], json.JSONDecodeError)
+
+
+def test_validate():
+    row, error = movie_import.validate({"title": "Heat", "crime": 1, "user_rating": 4})
+    assert error is None and row.crime == 1 and row.user_rating == 4
+
+    for value, message in [({"title": ""}, "title"), ({"title": "Heat", "movie_id": 3}, "movie_id"),
+                           ({"crime": 1}, "title"), (json.JSONDecodeError("x", "", 0), "invalid JSON")]:
+        row, error = movie_import.validate(value)
+        assert row is None and message in error
+
+
+def test_insert_batch_skips_existing_titles_and_stores_seed_ratings(engine):
+    rows = [MovieCreate(title="Heat", crime=1, user_rating=4.5), MovieCreate(title="MOVIE 1"),
+            MovieCreate(title="heat"), MovieCreate(title="Fargo")]
+
+    with engine.begin() as conn:
+        inserted, skipped = movie_import.insert_batch(conn, rows)
+
+    assert [title for _, title, _ in inserted] == ["heat", "fargo"]
+    assert skipped == ["movie 1", "heat"]
+    heat_id, fargo_id = (movie_id for movie_id, _, _ in inserted)
+    assert fargo_id == heat_id + 1 > 5
+    with engine.connect() as conn:
+        assert conn.execute(select(Movie.title, Movie.crime).where(Movie.movie_id == heat_id)).one() == ("heat", 1)
+        assert conn.execute(select(Rating.user_id, Rating.movie_id, Rating.rating)).all() == [
+            (movie_import.RATING_USER_ID, heat_id, 4.5)]
+
+
+def test_insert_batch_of_existing_titles_only(engine):
+    with engine.begin() as conn:
+        assert movie_import.insert_batch(conn, [MovieCreate(title="Movie 2")]) == ([], ["movie 2"])
+
+'''
+Python file with the tests of the bulk movie import
+'''
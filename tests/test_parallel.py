@@ -0,0 +1,33 @@
+# Imports
+import numpy as np
+import pytest
+from myapp import recommender
+from myapp.parallel import parallel_neighbours
+
+
+@pytest.mark.parametrize("top_k, block_size", [(5, 7), (50, 16)])
+def test_parallel_build_matches_the_single_process_build(data, top_k, block_size):
+    # block_size 7 leaves a partial last block, top_k 50 is more than the 39 other movies
+    ratings, _ = data
+    matrix, movie_ids, _ = recommender.build_rating_matrix(ratings)
+    single = recommender.neighbours_from_matrix(matrix, movie_ids, top_k, block_size, workers=1)
+    parallel = recommender.neighbours_from_matrix(matrix, movie_ids, top_k, block_size, workers=2)
+
+    assert parallel.neighbours.shape == single.neighbours.shape == (len(movie_ids), min(top_k, len(movie_ids) - 1))
+    np.testing.assert_array_equal(parallel.movie_ids, single.movie_ids)
+    np.testing.assert_array_equal(parallel.neighbours, single.neighbours)
+    np.testing.assert_allclose(parallel.scores, single.scores, rtol=1e-5, atol=1e-6)
+
+
+def test_parallel_neighbours_on_more_workers_than_blocks(data):
+    ratings, _ = data
+    matrix, movie_ids, _ = recommender.build_rating_matrix(ratings)
+    single = recommender.neighbours_from_matrix(matrix, movie_ids, 5, block_size=64)
+    parallel = parallel_neighbours(matrix, movie_ids, 5, block_size=64, workers=3)
+
+    np.testing.assert_array_equal(parallel.neighbours, single.neighbours)
+    np.testing.assert_allclose(parallel.scores, single.scores, rtol=1e-5, atol=1e-6)
+
+'''
+Python file with the tests of the multi-process neighbour table build
+'''
@@ -0,0 +1,137 @@
+# Imports
+import numpy as np
+import pandas as pd
+from myapp import recommender
+from myapp.models import GENRES
+
+TOP_K = 5
+
+
+def neighbour_lists(index):
+    """movie_id -> (neighbour movie ids, scores), independent of the row and column order."""
+    table = index.neighbour_table
+    return {int(movie_id): (table.movie_ids[neighbours].tolist(), scores)
+            for movie_id, neighbours, scores in zip(table.movie_ids, table.neighbours, table.scores)}
+
+
+def assert_same_model(updated, built):
+    assert updated.movie_ids.tolist() == built.movie_ids.tolist()
+    assert updated.titles.tolist() == built.titles.tolist()
+    np.testing.assert_array_equal(updated.genres, built.genres)
+    np.testing.assert_array_equal(updated.rating_counts, built.rating_counts)
+    updated_lists, built_lists = neighbour_lists(updated), neighbour_lists(built)
+    for movie_id, (neighbours, scores) in built_lists.items():
+        assert updated_lists[movie_id][0] == neighbours, movie_id
+        np.testing.assert_allclose(updated_lists[movie_id][1], scores, rtol=1e-5, atol=1e-6)
+    for title in built.titles:
+        assert updated.recommend(title, 4) == built.recommend(title, 4), title
+        assert updated.recommend(title, 4, content_weight=0.5) == built.recommend(title, 4, content_weight=0.5), title
+
+
+def test_sparse_neighbours_match_dense_similarity(data):
+    ratings, _ = data
+    dense = recommender.create_similarity_matrix(ratings)
+    # block_size 7 leaves a partial last block
+    table = recommender.create_neighbour_table(ratings, top_k=TOP_K, block_size=7)
+
+    assert table.movie_ids.tolist() == dense.index.tolist()
+    for row, movie_id in enumerate(table.movie_ids):
+        expected = dense.loc[movie_id].drop(movie_id).sort_values(ascending=False)[:TOP_K]
+        assert table.movie_ids[table.neighbours[row]].tolist() == expected.index.tolist(), movie_id
+        np.testing.assert_allclose(table.scores[row], expected.to_numpy(), rtol=1e-5, atol=1e-6)
+
+
+def test_recommend_excludes_the_seed_and_returns_top_n(data):
+    ratings, movies = data
+    index = recommender.RecommenderIndex.build(ratings, movies, top_k=TOP_K)
+    assert index.recommend("no such movie") is None
+
+    for top_n in (1, 4, TOP_K):
+        batch = index.recommend_batch(np.arange(len(index.movie_ids)), top_n)
+        for row, (movie_id, title) in enumerate(zip(index.movie_ids, index.titles)):
+            assert index.title_to_row[title] == index.id_to_row[movie_id] == row
+            recs = index.recommend(title, top_n)
+            assert len(recs) == top_n
+            assert movie_id not in [rec_movie_id for rec_movie_id, _ in recs]
+            # Best neighbours first, as stored in the table
+            assert [rec_movie_id for rec_movie_id, _ in recs] == index.movie_ids[index.neighbour_table.neighbours[row, :top_n]].tolist()
+            assert batch[row] == recs, title
+
+
+def test_recommend_batch_skips_excluded_rows(data):
+    ratings, movies = data
+    index = recommender.RecommenderIndex.build(ratings, movies, top_k=TOP_K)
+    seeds = np.arange(len(index.movie_ids))
+    excluded = index.neighbour_table.neighbours[0, :2]
+
+    # Two excluded out of TOP_K stored neighbours still leaves three for every seed
+    batch = index.recommend_batch(seeds, 3, exclude_rows=excluded)
+    for row, recs in zip(seeds, batch):
+        rec_ids = [rec_movie_id for rec_movie_id, _ in recs]
+        assert len(rec_ids) == 3
+        assert index.movie_ids[row] not in rec_ids
+        assert not set(index.movie_ids[excluded].tolist()) & set(rec_ids)
+
+
+def test_update_index_new_movie_matches_build(data):
+    ratings, movies = data
+    index = recommender.RecommenderIndex.build(ratings, movies, top_k=TOP_K)
+    new_movie = {"movie_id": 41, "title": "movie 41", **{genre: int(genre == "drama") for genre in GENRES}}
+    new_ratings = pd.DataFrame({"user_id": [3, 7, 81], "movie_id": [41, 41, 41], "rating": [4.5, 2.0, 3.5]})
+
+    updated = recommender.update_index(index, new_ratings, {41: "movie 41"},
+                                       {41: [new_movie[genre] for genre in GENRES]})
+
+    built = recommender.RecommenderIndex.build(pd.concat([ratings, new_ratings], ignore_index=True),
+                                               pd.concat([movies, pd.DataFrame([new_movie])], ignore_index=True),
+                                               top_k=TOP_K)
+    assert_same_model(updated, built)
+    assert updated.recommend("movie 41", 4)
+
+
+def test_update_index_new_rating_matches_build(data):
+    ratings, movies = data
+    index = recommender.RecommenderIndex.build(ratings, movies, top_k=TOP_K)
+    # One rating of an existing movie overwritten, one added by a known user, one by a new user
+    overwritten = ratings.iloc[0]
+    unrated = ratings[ratings["movie_id"] == 5]["user_id"]
+    new_user = int(np.setdiff1d(np.arange(1, 81), unrated)[0])
+    new_ratings = pd.DataFrame({"user_id": [int(overwritten["user_id"]), new_user, 200],
+                                "movie_id": [int(overwritten["movie_id"]), 5, 5],
+                                "rating": [0.5, 4.0, 1.5]})
+
+    updated = recommender.update_index(index, new_ratings)
+
+    combined = pd.concat([ratings.iloc[1:], new_ratings], ignore_index=True)
+    built = recommender.RecommenderIndex.build(combined, movies, top_k=TOP_K)
+    assert_same_model(updated, built)
+    # The served index is left untouched
+    assert index.matrix.shape == (40, 80)
+
+
+def test_update_index_rating_only_keeps_title_indexes(data):
+    ratings, movies = data
+    index = recommender.RecommenderIndex.build(ratings, movies, top_k=TOP_K)
+    resolver = index.title_resolver
+
+    updated = recommender.update_index(index, pd.DataFrame({"user_id": [1], "movie_id": [2], "rating": [3.0]}))
+
+    assert updated.title_resolver is resolver
+
+
+def test_get_recommendations_skips_padding(data):
+    from myapp.ann import ivf_neighbours
+    ratings, movies = data
+    matrix, movie_ids, _ = recommender.build_rating_matrix(ratings)
+    # One probed list out of eight leaves most rows short of 30 neighbours, padded with -1
+    table = ivf_neighbours(matrix, movie_ids, 30, n_lists=8, n_probe=1)
+    assert (table.neighbours == -1).any()
+    index = recommender.RecommenderIndex(table, movies.set_index("movie_id")["title"].reindex(movie_ids).to_numpy(dtype=str))
+
+    for title in movies["title"]:
+        expected = [rec_title for _, rec_title in index.recommend(title, 30)]
+        assert recommender.get_recommendations(title, movies, table, top_n=30) == expected, title
+
+'''
+Python file with the tests of the neighbour engine, the recommendation lookups and the incremental model updates
+'''
@@ -0,0 +1,95 @@
+# Imports
+import numpy as np
+from sqlalchemy import insert
+from myapp import recommender
+from myapp import reranking
+from myapp.models import ClickStats
+
+
+def build(data):
+    ratings, movies = data
+    return recommender.RecommenderIndex.build(ratings, movies, top_k=10)
+
+
+def test_relevance_scales_to_the_unit_range():
+    np.testing.assert_allclose(reranking.relevance([2.0, 4.0, 3.0]), [0.0, 1.0, 0.5])
+    np.testing.assert_array_equal(reranking.relevance([0.3, 0.3]), [1.0, 1.0])
+    assert len(reranking.relevance([])) == 0
+
+
+def test_make_reranker_without_weights_keeps_the_raw_ranking():
+    assert reranking.make_reranker() is None
+    # The click-rate boost needs a snapshot
+    assert reranking.make_reranker(ctr=0.5) is None
+    reranker = reranking.make_reranker(diversity=0.3, popularity=0.2, pool_factor=3)
+    assert reranker.pool_size(4) == 12
+    assert [type(adjuster) for adjuster in reranker.adjusters] == [reranking.PopularityPenalty]
+
+
+def test_mmr_without_diversity_ranks_by_relevance(data):
+    index = build(data)
+    rows = np.arange(8)
+    weights = np.linspace(1.0, 0.0, 8)
+
+    np.testing.assert_array_equal(reranking.mmr(index, rows, weights, 4, 0.0), rows[:4])
+    assert len(reranking.mmr(index, rows, weights, 20, 0.5)) == 8
+
+
+def test_mmr_skips_movies_with_the_same_genres(data):
+    index = build(data)
+    # Rows 0 and 1 share their genres, row 2 has others
+    index.genres = np.zeros_like(index.genres)
+    index.genres[[0, 1], 0] = 1
+    index.genres[2, 1] = 1
+    index.__dict__.pop("genre_vectors", None)
+    rows = np.array([0, 1, 2])
+
+    picked = reranking.mmr(index, rows, np.array([1.0, 0.9, 0.8]), 2, 0.5)
+
+    np.testing.assert_array_equal(picked, [0, 2])
+
+
+def test_popularity_penalty_lowers_widely_rated_movies(data):
+    index = build(data)
+    rows = np.array([int(np.argmax(index.popularity)), int(np.argmin(index.popularity))])
+    reranker = reranking.Reranker([reranking.PopularityPenalty(2.0)])
+
+    # Equal scores, the less popular movie comes first
+    np.testing.assert_array_equal(reranker.rerank(index, rows, np.array([0.5, 0.5]), 2), rows[::-1])
+
+
+def test_click_stats_snapshot_lift(engine):
+    with engine.begin() as conn:
+        conn.execute(insert(ClickStats), [
+            {"movie_id": 1, "title": "movie 1", "recommendations_shown": 1000, "clicks": 200},
+            {"movie_id": 2, "title": "movie 2", "recommendations_shown": 1000, "clicks": 20},
+            # Shown twice, clicked once: smoothed towards the global rate
+            {"movie_id": 3, "title": "movie 3", "recommendations_shown": 2, "clicks": 1},
+        ])
+    snapshot = reranking.ClickStatsSnapshot(engine, prior_shown=20)
+    assert np.array_equal(snapshot.lift([1, 2]), [0, 0])
+
+    assert snapshot.refresh() == 3
+    lifts = snapshot.lift([1, 2, 3, 4])
+
+    assert lifts[0] > 0 > lifts[1]
+    assert 0 < lifts[2] < 1
+    assert lifts[3] == 0
+
+
+def test_recommend_with_a_reranker(data):
+    index = build(data)
+    title = str(index.titles[0])
+    reranker = reranking.make_reranker(diversity=0.5, popularity=0.3)
+
+    recs = index.recommend(title, 4, reranker=reranker)
+
+    assert len(recs) == 4 and len(set(recs)) == 4
+    assert title not in {rec_title for _, rec_title in recs}
+    # The picks come from the reranker's larger candidate pool
+    pool, _ = index.candidates(0, reranker.pool_size(4))
+    assert {index.id_to_row[movie_id] for movie_id, _ in recs} <= set(pool.tolist())
+
+'''
+Python file with the tests of the re-ranking stage
+'''
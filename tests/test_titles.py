@@ -0,0 +1,83 @@
+# Imports
+import itertools
+import random
+import pytest
+from myapp.titles import TitleIndex, TitleResolver, edit_distance, normalize_title
+
+TITLES = ["Toy Story (1995)", "GoldenEye (1995)", "Abyss, The (1989)", "Star Wars (1977)", "Star Trek: Generations",
+          "Twelve Monkeys (1995)", "Godfather, The (1972)", "Godfather: Part II, The (1974)", "Fargo (1996)", ""]
+MOVIE_IDS = list(range(1, len(TITLES) + 1))
+
+
+def osa_distance(a, b):
+    """Full-matrix optimal string alignment distance, the reference edit_distance is checked against."""
+    d = [[i + j if i * j == 0 else 0 for j in range(len(b) + 1)] for i in range(len(a) + 1)]
+    for i, j in itertools.product(range(1, len(a) + 1), range(1, len(b) + 1)):
+        d[i][j] = min(d[i - 1][j] + 1, d[i][j - 1] + 1, d[i - 1][j - 1] + (a[i - 1] != b[j - 1]))
+        if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+            d[i][j] = min(d[i][j], d[i - 2][j - 2] + 1)
+    return d[-1][-1]
+
+
+@pytest.mark.parametrize("a, b, distance", [
+    ("", "", 0), ("abc", "abc", 0), ("abc", "abd", 1), ("abc", "acb", 1), ("abc", "ab", 1),
+    ("kitten", "sitting", 3), ("star wars", "star wras", 1), ("fargo", "", 5),
+])
+def test_edit_distance(a, b, distance):
+    assert edit_distance(a, b, 5) == distance
+    assert edit_distance(b, a, 5) == distance
+
+
+def test_edit_distance_matches_the_full_matrix_within_max_distance():
+    rng = random.Random(0)
+    for _ in range(500):
+        a = "".join(rng.choices("abc", k=rng.randint(0, 7)))
+        b = "".join(rng.choices("abc", k=rng.randint(0, 7)))
+        max_distance = rng.randint(0, 3)
+        expected = osa_distance(a, b)
+        assert edit_distance(a, b, max_distance) == (expected if expected <= max_distance else max_distance + 1), (a, b)
+
+
+def test_normalize_title():
+    assert normalize_title("The Abyss (1989)") == normalize_title("Abyss, The (1989)") == "abyss"
+    assert normalize_title("Amélie!") == "amelie"
+    assert normalize_title("Star Trek: Generations") == "star trek generations"
+
+
+def test_title_index_prefix_search():
+    index = TitleIndex(TITLES, MOVIE_IDS)
+
+    total, page = index.search("star")
+    assert total == 2
+    assert page == [(5, "Star Trek: Generations"), (4, "Star Wars (1977)")]
+    assert index.search("god", offset=1, limit=5) == (2, [(8, "Godfather: Part II, The (1974)")])
+    assert index.search("")[0] == len(index) == 9
+
+
+def test_resolve_ranks_typos_by_edit_distance():
+    resolver = TitleResolver(TITLES, MOVIE_IDS)
+
+    assert resolver.best("toy stroy").movie_id == 1
+    assert resolver.best("the abyss").movie_id == 3
+    assert resolver.best("GOLDENEYE").distance == 0
+    matches = resolver.resolve("star wrs", limit=3)
+    assert matches[0].movie_id == 4 and matches[0].distance == 1
+    assert [match.distance for match in matches] == sorted(match.distance for match in matches)
+
+
+def test_resolve_without_a_close_title():
+    resolver = TitleResolver(TITLES, MOVIE_IDS)
+
+    assert resolver.best("completely unrelated") is None
+    assert resolver.resolve("") == []
+
+
+def test_resolve_on_an_empty_catalog():
+    for titles in ([], [""]):
+        resolver = TitleResolver(titles, list(range(len(titles))))
+        assert resolver.resolve("toy story") == []
+        assert resolver.best("toy story") is None
+
+'''
+Python file with the tests of the title index and resolver
+'''